@@ -0,0 +1,4 @@
+"""
+Benchmarks for the tabtomidi library.  Run them from the repository root,
+e.g. python -m benchmarks.midi_encoding
+"""
@@ -0,0 +1,59 @@
+"""
+Compares converting a tab with a cold command-line run and with the client
+of a running daemon.
+
+Usage: python -m benchmarks.daemon [tab file] [runs]
+
+Both are run as new processes, like a shell pipeline would, and the wall
+time of every run is averaged.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from timeit import default_timer
+
+from tabtomidi.daemon import ConversionDaemon
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_TAB = os.path.join(ROOT, "tests", "testdata", "simple_4_4_beat.txt")
+
+
+def time_runs(command, runs):
+    """Returns the mean wall time of running the command in seconds."""
+    environment = dict(os.environ, PYTHONPATH=ROOT)
+    start = default_timer()
+    for _ in xrange(runs):
+        subprocess.check_call(command, env=environment)
+    return (default_timer() - start) / runs
+
+
+def main():
+    tab_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TAB
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    directory = tempfile.mkdtemp()
+    midi_path = os.path.join(directory, "out.mid")
+    socket_path = os.path.join(directory, "daemon.sock")
+    daemon = ConversionDaemon(socket_path)
+    thread = threading.Thread(target=daemon.serve)
+    thread.daemon = True
+    thread.start()
+    try:
+        cold = time_runs([sys.executable, "-m", "tabtomidi.cli", tab_path,
+                          midi_path], runs)
+        warm = time_runs([sys.executable,
+                          os.path.join(ROOT, "tabtomidi", "client.py"),
+                          "--socket", socket_path, tab_path, midi_path], runs)
+    finally:
+        daemon.stop()
+        thread.join()
+        os.remove(midi_path)
+        os.rmdir(directory)
+    sys.stdout.write("%-20s %8.1fms per tab\n" % ("cold cli", cold * 1000))
+    sys.stdout.write("%-20s %8.1fms per tab\n" % ("daemon client",
+                                                   warm * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Compares editing a TabDocument with constructing a new Tab after every edit.
+
+Usage: python -m benchmarks.editing [number of bar groups]
+
+Notes are typed and taken back in a group in the middle of the tab, and a
+group is inserted there and deleted again, which moves every later group.
+"""
+import sys
+from timeit import default_timer
+
+from tabtomidi import Tab
+from tabtomidi.document import TabDocument
+
+BAR_GROUP = [u"HH |o-------o---------------o-------|o-------o-------o-------o-------|",
+             u" S |----------------o---------------|----------------o---------------|",
+             u" B |o-------o-------o-------o-------|o-------o-------o-------o-------|",
+             u""]
+EDITS = 200
+
+
+def main():
+    num_groups = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    document = TabDocument(u"\n".join(BAR_GROUP * num_groups))
+    document.to_midi_bytes()
+    row = len(document.lines) // 2 + 1
+    line = document.lines[row]
+    start = default_timer()
+    for i in xrange(EDITS):
+        # Type a snare note and take it back again.
+        column = 4 + i % 32
+        edited = line[:column] + (u"o" if i % 2 == 0 else u"-") + \
+            line[column + 1:]
+        document.replace_lines(row, row + 1, [edited])
+        document.to_midi_bytes()
+    incremental = (default_timer() - start) / EDITS
+    start = default_timer()
+    for i in xrange(EDITS):
+        # Paste a group of bars and take it back again.
+        if i % 2 == 0:
+            document.insert_lines(row, BAR_GROUP)
+        else:
+            document.delete_lines(row, row + len(BAR_GROUP))
+        document.to_midi_bytes()
+    moving = (default_timer() - start) / EDITS
+    start = default_timer()
+    for _ in xrange(EDITS // 10):
+        Tab(document.text).to_midi_bytes()
+    full = (default_timer() - start) / (EDITS // 10)
+    sys.stdout.write("%d bars\n" % (num_groups * 2))
+    sys.stdout.write("%-20s %8.2fms per edit\n" % ("TabDocument", incremental * 1000))
+    sys.stdout.write("%-20s %8.2fms per edit\n" % ("  moving groups", moving * 1000))
+    sys.stdout.write("%-20s %8.2fms per edit\n" % ("new Tab", full * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compares an engine with the reference engine on a directory of tabs: checks
+that both walk every tab to the same notes and times their walks.
+
+Usage: python -m benchmarks.engines DIRECTORY --engine NAME
+                                    [--reference NAME] [--repeat N]
+
+Every mismatch is printed with the group of bars, row and column where the
+engines first disagree, followed by a summary of the mismatches and the
+speedup of the engine.  The exit status is 1 if there were mismatches.
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+from collections import namedtuple
+from timeit import default_timer
+
+from tabtomidi import Tab, TabParsingException
+from tabtomidi.differential import first_divergence
+from tabtomidi.engines import ENGINES, REFERENCE_ENGINE
+
+
+class CorpusComparison(namedtuple('CorpusComparison',
+                                  ['tabs', 'skipped', 'mismatches',
+                                   'reference_seconds', 'engine_seconds'])):
+    """
+    The outcome of compare_corpus.  tabs is the number of tabs that were
+    compared, skipped the number of files that could not be lexed and
+    mismatches a list of (filename, Divergence) pairs.  The times are the
+    totals of the best walks of every compared tab.
+    """
+    __slots__ = ()
+
+    def summary(self):
+        """Returns a line describing the outcome."""
+        speedup = (self.reference_seconds / self.engine_seconds
+                   if self.engine_seconds else 0)
+        return ("%d tabs compared, %d skipped, %d mismatches; reference "
+                "%.1fms, engine %.1fms, speedup %.2fx" %
+                (self.tabs, self.skipped, len(self.mismatches),
+                 self.reference_seconds * 1000, self.engine_seconds * 1000,
+                 speedup))
+
+
+def time_walk(text, engine, repeat=3):
+    """
+    Returns the best time of walking the notes of the tab with the engine,
+    without the time of lexing it.
+    """
+    best = None
+    for _ in xrange(repeat):
+        tab = Tab(text, engine=engine)
+        tab.ticks_per_beat
+        start = default_timer()
+        tab.note_events()
+        seconds = default_timer() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def compare_corpus(directory, engine, reference=REFERENCE_ENGINE, repeat=3):
+    """
+    Compares the engine with the reference on every .txt file in the
+    directory and returns a CorpusComparison.
+    """
+    tabs = skipped = 0
+    mismatches = []
+    reference_seconds = engine_seconds = 0.0
+    for filename in sorted(glob.glob(os.path.join(directory, "*.txt"))):
+        with io.open(filename, encoding="utf-8") as tab_file:
+            text = tab_file.read()
+        try:
+            divergence = first_divergence(text, engine, reference)
+        except TabParsingException:
+            skipped += 1
+            continue
+        tabs += 1
+        if divergence is not None:
+            mismatches.append((filename, divergence))
+            continue
+        try:
+            reference_seconds += time_walk(text, reference, repeat)
+            engine_seconds += time_walk(text, engine, repeat)
+        except Exception:
+            # Both engines stop at the same error, so there is no walk to
+            # time.
+            pass
+    return CorpusComparison(tabs, skipped, mismatches, reference_seconds,
+                            engine_seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare an engine with the reference engine.")
+    parser.add_argument("directory", help="a directory of .txt tabs")
+    parser.add_argument("--engine", required=True, choices=sorted(ENGINES),
+        help="the engine to check")
+    parser.add_argument("--reference", choices=sorted(ENGINES),
+        default=REFERENCE_ENGINE,
+        help="the engine to compare with (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+        help="walks per tab and engine; the best time counts")
+    args = parser.parse_args(argv)
+    comparison = compare_corpus(args.directory, args.engine, args.reference,
+                                args.repeat)
+    for filename, divergence in comparison.mismatches:
+        sys.stdout.write("%s: %s\n" % (filename, divergence))
+    sys.stdout.write(comparison.summary() + "\n")
+    return 1 if comparison.mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Generates synthetic drum tabs for benchmarks.
+
+The tabs are random but reproducible: the same arguments and seed always give
+the same text.  They can be varied in every dimension that the parser cares
+about, so that a benchmark can show how the cost of a phase grows with each.
+"""
+import random
+
+from tabtomidi.lexer import PIPE_LOOKALIKES
+
+# Drums in the order in which they are added to a tab, most common first.
+DRUMS = ['HH', 'S', 'B', 'C', 'R', 'T1', 'T2', 'F', 'Hf', 'Sp', 'Ch', 'Tm']
+# The chance that a drum is struck in a division of a bar.
+DENSITY = {'HH': 0.5, 'R': 0.4, 'B': 0.3, 'S': 0.2}
+DEFAULT_DENSITY = 0.08
+# Regular strikes are more common than accents and ghost notes.
+STRIKE_TYPES = u'oooooOg'
+
+
+def generate_tab(bars=64, drums=3, divisions=16, bars_per_line=4,
+                 repeat_density=0.0, count_rows=False, pipe_lookalikes=0.0,
+                 seed=0):
+    """
+    Returns the text of a drum tab with the given number of bars.
+
+    drums is the number of drum rows and divisions the number of divisions
+    in every bar.  Bars are written bars_per_line to a group of bars.
+    repeat_density is the chance that a bar is repeated, count_rows adds a
+    count row below every group of bars and pipe_lookalikes is the chance
+    that a group of bars is drawn with a pipe lookalike instead of '|'.
+    """
+    return u"\n".join(iter_tab_lines(bars, drums, divisions, bars_per_line,
+                                     repeat_density, count_rows,
+                                     pipe_lookalikes, seed))
+
+
+def iter_tab_lines(bars=64, drums=3, divisions=16, bars_per_line=4,
+                   repeat_density=0.0, count_rows=False, pipe_lookalikes=0.0,
+                   seed=0):
+    """
+    Yields the lines of the tab that generate_tab returns with the same
+    arguments, generating them as they are read.
+    """
+    generator = random.Random(seed)
+    names = DRUMS[:drums]
+    yield u"Synthetic tab with %d bars" % bars
+    yield u""
+    remaining = bars
+    while remaining > 0:
+        num_bars = min(bars_per_line, remaining)
+        remaining -= num_bars
+        if generator.random() < pipe_lookalikes:
+            pipe = generator.choice(PIPE_LOOKALIKES[1:])
+        else:
+            pipe = u'|'
+        repetitions = [generator.randint(2, 8)
+                       if generator.random() < repeat_density else None
+                       for _ in xrange(num_bars)]
+        if any(repetitions):
+            yield u"   " + pipe + pipe.join(
+                _repetition_marker(count, divisions)
+                for count in repetitions) + pipe
+        for name in names:
+            density = DENSITY.get(name, DEFAULT_DENSITY)
+            yield u"%2s " % name + pipe + pipe.join(
+                u"".join(generator.choice(STRIKE_TYPES)
+                         if generator.random() < density else u'-'
+                         for _ in xrange(divisions))
+                for _ in xrange(num_bars)) + pipe
+        if count_rows:
+            yield u"   " + pipe + pipe.join(
+                [_count(divisions)] * num_bars) + pipe
+        yield u""
+
+
+def _repetition_marker(count, divisions):
+    """Returns the text above a bar that is repeated count times."""
+    if count is None:
+        return u'-' * divisions
+    return (u"x%d" % count).center(divisions, u"-")
+
+
+def _count(divisions):
+    """Returns the text of a count row for one bar."""
+    beat = max(1, divisions // 4)
+    return u"".join(unicode(i // beat + 1) if i % beat == 0 else u' '
+                    for i in xrange(divisions))
@@ -0,0 +1,119 @@
+"""
+Measures the memory that parsed and converted tabs keep, per tab, and the
+peak memory of streaming a long tab.
+
+Usage: python -m benchmarks.memory [--tabs N] [--bars BARS]
+                                   [--stream-bars BARS]
+
+Many Tab objects are kept alive, like in a cache of parsed tabs, and the
+growth of the resident set size is divided by their number.  A tab of
+--stream-bars bars, and one of a tenth of them, are generated while
+stream_midi reads them, and the peak resident set size of both is shown,
+which should not grow with the tab.  Every measurement runs in a fresh
+process.
+"""
+import argparse
+import gc
+import resource
+import sys
+from multiprocessing import Pool
+
+from benchmarks.generator import generate_tab, iter_tab_lines
+from tabtomidi import Tab
+from tabtomidi.streaming import stream_midi
+
+
+def resident_bytes():
+    """Returns the current resident set size of the process in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * \
+                resource.getpagesize()
+    except IOError:
+        # Only the peak is known, which grows like the current size here.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(tabs, bars, convert):
+    """
+    Returns the bytes per tab kept by tabs Tab objects of a generated tab
+    with the given number of bars, after lexing them or, if convert is
+    True, after converting them to midi.
+    """
+    text = generate_tab(bars=bars, drums=4, count_rows=True)
+    kept = []
+    gc.collect()
+    before = resident_bytes()
+    for _ in xrange(tabs):
+        tab = Tab(text)
+        tab.note_types
+        if convert:
+            tab.to_midi_bytes()
+        kept.append(tab)
+    gc.collect()
+    return (resident_bytes() - before) / float(tabs)
+
+
+class _NullFile(object):
+    """
+    A file object that forgets what is written to it, but can seek like a
+    file, so that stream_midi does not keep the track in memory.
+    """
+
+    def __init__(self):
+        self._position = 0
+
+    def tell(self):
+        return self._position
+
+    def seek(self, position):
+        self._position = position
+
+    def write(self, data):
+        self._position += len(data)
+
+
+def measure_stream(bars):
+    """
+    Streams a generated tab with the given number of bars to a file object
+    that forgets the midi data, and returns the peak resident set size of
+    the process in bytes.
+    """
+    stream_midi(iter_tab_lines(bars=bars, drums=4, count_rows=True),
+                _NullFile())
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _in_fresh_process(function, *args):
+    """Calls the function in a fresh process and returns its result."""
+    pool = Pool(1)
+    try:
+        return pool.apply(function, args)
+    finally:
+        pool.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the memory kept by parsed tabs.")
+    parser.add_argument("--tabs", type=int, default=1000,
+        help="number of tabs to keep (default: %(default)s)")
+    parser.add_argument("--bars", type=int, default=64,
+        help="bars in every tab (default: %(default)s)")
+    parser.add_argument("--stream-bars", type=int, default=40000,
+        help="bars in the streamed tab (default: %(default)s)")
+    args = parser.parse_args(argv)
+    for convert in (False, True):
+        per_tab = _in_fresh_process(measure, args.tabs, args.bars, convert)
+        sys.stdout.write("%-10s %8.1f KB per tab of %d bars\n" %
+                         ("converted" if convert else "parsed",
+                          per_tab / 1024, args.bars))
+    for bars in (args.stream_bars // 10, args.stream_bars):
+        peak = _in_fresh_process(measure_stream, bars)
+        sys.stdout.write("%-10s %8.1f MB peak for a tab of %d bars\n" %
+                         ("streamed", peak / 1024.0 / 1024, bars))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+Compares the speed of the built-in midi encoder with the midiutil encoder.
+
+Usage: python -m benchmarks.midi_encoding [number of bar groups]
+"""
+import sys
+from cStringIO import StringIO
+from timeit import default_timer
+
+from tabtomidi import Tab
+
+BAR_GROUP = """
+HH |o-------o---------------o-------|o-------o---------------o-------|
+ S |----------------o---------------|----------------o---------------|
+ B |o-------o-------o-------o-------|o-------o-------o-------o-------|
+"""
+
+
+def best_time(function, repeat=3):
+    """Returns the best wall time of several calls to the function."""
+    times = []
+    for _ in xrange(repeat):
+        start = default_timer()
+        function()
+        times.append(default_timer() - start)
+    return min(times)
+
+
+def main():
+    num_groups = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tab = Tab(BAR_GROUP * num_groups)
+    num_notes = len(tab.note_events())
+    results = [('tabtomidi.smf', best_time(tab.to_midi_bytes))]
+    try:
+        import midiutil
+    except ImportError:
+        sys.stdout.write("midiutil is not installed, skipping it.\n")
+    else:
+        results.append(('midiutil', best_time(
+            lambda: tab.write_midi_file(StringIO(), use_midiutil=True))))
+    sys.stdout.write("%d notes\n" % num_notes)
+    for name, seconds in results:
+        sys.stdout.write("%-15s %8.3fs %12.0f notes/s\n" %
+                         (name, seconds, num_notes / seconds))
+
+
+if __name__ == "__main__":
+    main()
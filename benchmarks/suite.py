@@ -0,0 +1,224 @@
+"""
+Times every phase of a conversion on synthetic tabs of several shapes and
+sizes, and compares the results with a saved baseline.
+
+Usage: python -m benchmarks.suite [--cases NAMES] [--scale FACTOR]
+                                  [--save BASELINE] [--compare BASELINE]
+                                  [--threshold FRACTION]
+
+Every case runs in a fresh process, so that its peak memory (the maximum
+resident set size) is not hidden by the cases before it.  With --compare, the
+exit status is 1 if a phase became slower than the baseline by more than the
+threshold, after adjusting for the speed of the machine.
+"""
+import argparse
+import json
+import resource
+import sys
+from collections import OrderedDict
+from cStringIO import StringIO
+from multiprocessing import Pool
+from timeit import default_timer
+
+from benchmarks.generator import generate_tab
+from tabtomidi import Tab
+
+# Version 2: Tab() no longer lexes the tab, so note_types pays for lexing.
+BASELINE_FORMAT = 2
+
+# The generator arguments of every case.  The size cases show how the phases
+# grow with the number of bars, the others how they grow with one dimension.
+CASES = OrderedDict([
+    ('small', dict(bars=64)),
+    ('medium', dict(bars=1000)),
+    ('large', dict(bars=8000)),
+    ('many_drums', dict(bars=1000, drums=10)),
+    ('fine_divisions', dict(bars=1000, divisions=48)),
+    ('wide_lines', dict(bars=1000, bars_per_line=16)),
+    ('repeats', dict(bars=1000, repeat_density=0.5)),
+    ('count_rows', dict(bars=1000, count_rows=True)),
+    ('pipe_lookalikes', dict(bars=1000, pipe_lookalikes=0.5)),
+])
+
+PHASES = ['init', 'note_types', 'strike_types', 'walk_notes',
+          'write_midi_file']
+
+
+def time_phases(text):
+    """
+    Converts the tab once, timing every phase, and returns a dict of phase
+    times and the number of notes.  Each phase is timed after the phases
+    before it, so it only pays for its own work.
+    """
+    times = {}
+    start = default_timer()
+    tab = Tab(text)
+    times['init'] = default_timer() - start
+    start = default_timer()
+    tab.note_types
+    times['note_types'] = default_timer() - start
+    start = default_timer()
+    tab.strike_types
+    times['strike_types'] = default_timer() - start
+    start = default_timer()
+    num_notes = sum(1 for _ in tab.walk_notes())
+    times['walk_notes'] = default_timer() - start
+    start = default_timer()
+    tab.write_midi_file(StringIO())
+    times['write_midi_file'] = default_timer() - start
+    return times, num_notes
+
+
+def calibrate(repeat=3):
+    """
+    Returns the best time of a fixed amount of string and dict work, which
+    tells how fast the machine is at the moment.
+    """
+    best = None
+    for _ in xrange(repeat):
+        start = default_timer()
+        counts = {}
+        for i in xrange(20000):
+            line = "HH |o-o-o-o-|o-o-o-o-|"[i % 8:]
+            counts[line.partition('|')[0]] = i
+        seconds = default_timer() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def run_case(arguments, repeat=3):
+    """
+    Returns the results of a case: the best time of every phase over
+    several conversions, the number of notes and bars, the peak memory in
+    kilobytes and the calibration time of the machine.
+    """
+    text = generate_tab(**arguments)
+    best = {}
+    for _ in xrange(repeat):
+        times, num_notes = time_phases(text)
+        for phase, seconds in times.iteritems():
+            best[phase] = min(seconds, best.get(phase, seconds))
+    return {
+        'arguments': arguments,
+        'calibration': calibrate(),
+        'phases': best,
+        'notes': num_notes,
+        'characters': len(text),
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_cases(names, scale=1.0, repeat=3):
+    """Runs the named cases, each in its own process, and returns a dict."""
+    results = OrderedDict()
+    for name in names:
+        arguments = dict(CASES[name])
+        arguments['bars'] = max(1, int(arguments['bars'] * scale))
+        pool = Pool(1)
+        try:
+            results[name] = pool.apply(run_case, (arguments, repeat))
+        finally:
+            pool.terminate()
+    return results
+
+
+def report(results, out=sys.stdout):
+    """Writes a table of the phase times and rates."""
+    out.write("%-16s %7s %8s" % ("case", "bars", "notes") +
+              "".join(" %12s" % phase[:12] for phase in PHASES) +
+              " %11s %9s\n" % ("walk notes/s", "peak MB"))
+    for name, result in results.iteritems():
+        phases = result['phases']
+        walk = phases['walk_notes']
+        out.write("%-16s %7d %8d" % (name, result['arguments']['bars'],
+                                     result['notes']) +
+                  "".join(" %11.2fms" % (phases[phase] * 1000)
+                          for phase in PHASES) +
+                  " %11.0f %9.1f\n" % (result['notes'] / walk if walk else 0,
+                                       result['peak_memory_kb'] / 1024.0))
+
+
+def compare(results, baseline, threshold, min_seconds, out=sys.stdout):
+    """
+    Reports the phases that are slower than in the baseline by more than
+    the threshold and returns their number.  Phases faster than min_seconds
+    in the baseline are too noisy to compare and are skipped.
+
+    Times are scaled by the calibration times of the runs, so a baseline
+    recorded on a faster or less busy machine can still be compared.
+    """
+    regressions = 0
+    for name, result in results.iteritems():
+        expected = baseline['cases'].get(name)
+        if expected is None:
+            out.write("%s: not in the baseline\n" % name)
+            continue
+        if expected['arguments'] != result['arguments']:
+            out.write("%s: generated with other arguments than the "
+                      "baseline\n" % name)
+            continue
+        speed = expected['calibration'] / result['calibration']
+        for phase in PHASES:
+            before = expected['phases'][phase]
+            after = result['phases'][phase] * speed
+            if before < min_seconds or before == 0:
+                continue
+            if after > before * (1 + threshold):
+                regressions += 1
+                out.write("%s %s regressed: %.2fms -> %.2fms (%+.0f%%)\n" %
+                          (name, phase, before * 1000, after * 1000,
+                           (after / before - 1) * 100))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the phases of tab conversion.")
+    parser.add_argument("--cases", default=",".join(CASES),
+        help="comma separated cases to run (default: all of %s)" %
+             ", ".join(CASES))
+    parser.add_argument("--scale", type=float, default=1.0,
+        help="multiply the number of bars of every case by this factor")
+    parser.add_argument("--repeat", type=int, default=3,
+        help="conversions per case; the best time of each phase counts")
+    parser.add_argument("--save", metavar="BASELINE",
+        help="save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="BASELINE",
+        help="compare the results with a JSON baseline and exit with "
+             "status 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.5,
+        help="allowed slowdown as a fraction of the baseline time "
+             "(default: 0.5)")
+    parser.add_argument("--min-seconds", type=float, default=0.001,
+        help="skip phases faster than this in the baseline (default: 0.001)")
+    args = parser.parse_args(argv)
+    names = [name for name in args.cases.split(",") if name]
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error("unknown cases: %s" % ", ".join(unknown))
+    results = run_cases(names, args.scale, args.repeat)
+    report(results)
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump({'format': BASELINE_FORMAT,
+                       'python': sys.version.split()[0],
+                       'cases': results}, baseline_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('format') != BASELINE_FORMAT:
+            parser.error("%s is not a baseline of this version" %
+                         args.compare)
+        regressions = compare(results, baseline, args.threshold,
+                              args.min_seconds)
+        if regressions:
+            sys.stdout.write("%d phases regressed by more than %.0f%%\n" %
+                             (regressions, args.threshold * 100))
+            return 1
+        sys.stdout.write("No phase regressed by more than %.0f%%\n" %
+                         (args.threshold * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
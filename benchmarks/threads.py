@@ -0,0 +1,84 @@
+"""
+Measures the throughput of threads that convert the same shared tabs, like
+the request threads of a server that keeps parsed tabs in a
+ConversionCache.
+
+Usage: python -m benchmarks.threads [--tabs N] [--bars BARS] [--rounds N]
+                                    [--threads 1,2,4,8]
+
+For every number of threads, new Tab objects are shared by all threads,
+which render every tab at a tempo of their own, so the first render of a tab
+parses it for all of them.  For comparison, the threads also convert tabs
+of their own, which every thread parses.  Every midi file is checked
+against a serial conversion.
+"""
+import argparse
+import sys
+import threading
+from timeit import default_timer
+
+from benchmarks.generator import generate_tab
+from tabtomidi import Tab
+
+
+def run_threads(texts, expected, num_threads, rounds, shared=True):
+    """
+    Converts the texts in num_threads threads, rounds times each, and
+    returns the conversions per second.  The threads share one Tab for
+    every text, unless shared is False.  Raises AssertionError if a midi
+    file differs from the expected one for its tab and tempo.
+    """
+    shared_tabs = [Tab(text) for text in texts]
+    start_event = threading.Event()
+    failures = []
+
+    def convert(bpm):
+        start_event.wait()
+        tabs = shared_tabs if shared else [Tab(text) for text in texts]
+        for _ in xrange(rounds):
+            for tab, midi_files in zip(tabs, expected):
+                if tab.render(bpm=bpm) != midi_files[bpm]:
+                    failures.append(bpm)
+    bpms = sorted(expected[0])
+    threads = [threading.Thread(target=convert, args=(bpms[i % len(bpms)],))
+               for i in xrange(num_threads)]
+    for thread in threads:
+        thread.start()
+    start = default_timer()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    seconds = default_timer() - start
+    assert not failures, "%d wrong midi files" % len(failures)
+    return num_threads * rounds * len(texts) / seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput of threads sharing tabs.")
+    parser.add_argument("--tabs", type=int, default=20,
+        help="number of shared tabs (default: %(default)s)")
+    parser.add_argument("--bars", type=int, default=64,
+        help="bars in every tab (default: %(default)s)")
+    parser.add_argument("--rounds", type=int, default=5,
+        help="conversions of every tab per thread (default: %(default)s)")
+    parser.add_argument("--threads", default="1,2,4,8",
+        help="comma-separated thread counts (default: %(default)s)")
+    args = parser.parse_args(argv)
+    thread_counts = [int(count) for count in args.threads.split(",")]
+    bpms = range(60, 60 + 10 * max(thread_counts), 10)
+    texts = [generate_tab(bars=args.bars, drums=4, repeat_density=0.2,
+                          seed=seed) for seed in xrange(args.tabs)]
+    expected = [dict((bpm, Tab(text, bpm=bpm).to_midi_bytes())
+                     for bpm in bpms) for text in texts]
+    for num_threads in thread_counts:
+        shared = run_threads(texts, expected, num_threads, args.rounds)
+        separate = run_threads(texts, expected, num_threads, args.rounds,
+                               shared=False)
+        sys.stdout.write("%3d threads %10.1f conversions per second shared, "
+                         "%.1f separate\n" % (num_threads, shared, separate))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Times the conversion of crafted tabs that make the work of converting a tab
+blow up, with the limits for untrusted tabs and, optionally, without limits.
+
+Usage: python -m benchmarks.worst_case [--unlimited] [--timeout SECONDS]
+
+Every case is sized to stay within all of the UNTRUSTED_LIMITS but the one
+it is named after, which it should hit in a fraction of a second.  With
+--unlimited, every case is also converted without limits in a worker process
+that is given up on after --timeout seconds.
+"""
+import argparse
+import sys
+from multiprocessing import Pool, TimeoutError
+from timeit import default_timer
+
+from tabtomidi import Tab
+from tabtomidi.exceptions import ResourceLimitExceeded
+from tabtomidi.limits import UNTRUSTED_LIMITS
+
+
+def _groups(count, bars, repetition_marker=None, strikes='o-o-'):
+    """
+    Returns a tab of count groups of bars of a hi-hat row with the given
+    number of bars, and a repetition row with the marker over every bar.
+    """
+    rows = []
+    if repetition_marker is not None:
+        rows.append("   |" + (repetition_marker + "|") * bars)
+    rows.append("HH |" + (strikes + "|") * bars)
+    return "\n\n".join(["\n".join(rows)] * count)
+
+
+def _nested(levels, repetitions, strikes='o-o-o-o-'):
+    """
+    Returns a tab of one bar that is repeated in levels of repeats nested in
+    each other.
+    """
+    marker = ("x%d" % repetitions).center(len(strikes), '-')
+    return "\n".join(["   |%s|" % marker] * levels + ["HH |%s|" % strikes])
+
+
+# The limit that every case should hit, and a function returning its text.
+WORST_CASES = [
+    ('input_bytes', 'max_input_bytes', lambda: _groups(100000, 2)),
+    ('wide_line', 'max_line_width', lambda: _groups(1, 100000)),
+    ('pipe_columns', 'max_line_width',
+     lambda: "HH " + "|" * 200000 + "\n S " + "|" * 200000),
+    ('bar_groups', 'max_bar_groups', lambda: _groups(20000, 1)),
+    ('repeat_count', 'max_repetitions', lambda: _groups(1, 1, '-x99999-')),
+    ('nested_repeats', 'max_notes', lambda: _nested(3, 250)),
+    ('repeated_rests', 'max_steps',
+     lambda: _groups(120, 800, 'x256', '----')),
+]
+
+
+def convert(text, limits):
+    """
+    Converts the tab and returns the seconds it took and the name of the
+    limit that it exceeded, or None.
+    """
+    start = default_timer()
+    try:
+        Tab(text, limits=limits).to_midi_bytes()
+    except ResourceLimitExceeded as e:
+        return default_timer() - start, e.limit
+    return default_timer() - start, None
+
+
+def run_cases(limits=UNTRUSTED_LIMITS):
+    """
+    Converts every case with the limits and returns a (name, expected
+    limit, seconds, exceeded limit) tuple for each.
+    """
+    results = []
+    for name, expected, make_text in WORST_CASES:
+        seconds, exceeded = convert(make_text(), limits)
+        results.append((name, expected, seconds, exceeded))
+    return results
+
+
+def _describe_unlimited(make_text, timeout):
+    """
+    Converts the case without limits in a worker process and returns a
+    description of how long that took or how it failed.
+    """
+    pool = Pool(1)
+    try:
+        seconds = pool.apply_async(convert, (make_text(), None)) \
+            .get(timeout)[0]
+    except TimeoutError:
+        return "> %gs" % timeout
+    except Exception as e:
+        return type(e).__name__
+    finally:
+        pool.terminate()
+    return "%.1fms" % (seconds * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the conversion of crafted worst-case tabs.")
+    parser.add_argument("--unlimited", action="store_true",
+        help="also convert every case without limits")
+    parser.add_argument("--timeout", type=float, default=30.0,
+        help="seconds to wait for a conversion without limits "
+             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+    status = 0
+    for name, expected, seconds, exceeded in run_cases():
+        line = "%-16s %8.1fms  %-16s" % (name, seconds * 1000,
+                                        exceeded or "converted")
+        if exceeded != expected:
+            line += "  (expected %s)" % expected
+            status = 1
+        if args.unlimited:
+            make_text = dict((case[0], case[2]) for case in WORST_CASES)[name]
+            line += "  unlimited: " + _describe_unlimited(make_text,
+                                                          args.timeout)
+        sys.stdout.write(line + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
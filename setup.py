@@ -16,5 +16,5 @@ setup(
     author_email='rosenville@gmail.com',
     url='https://github.com/JoshRosen/tabtomidi',
     license=license,
-    packages=find_packages(exclude=('tests', 'docs'))
+    packages=find_packages(exclude=('tests', 'docs', 'benchmarks'))
 )
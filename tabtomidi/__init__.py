@@ -1,2 +1,6 @@
+__version__ = '0.1'
+
 from tabtomidi.drumtabs import Tab, TabParsingException, \
     UnmappableNoteNamesException
+from tabtomidi.exceptions import ResourceLimitExceeded
+from tabtomidi.limits import ResourceLimits
@@ -0,0 +1,176 @@
+"""
+batch.py: Converts many tabs to midi files, optionally in several processes.
+"""
+import codecs
+import glob
+import os
+from collections import defaultdict, namedtuple
+from multiprocessing import Pool, cpu_count
+from timeit import default_timer
+
+from tabtomidi.drumtabs import Tab
+from tabtomidi.exceptions import TabParsingException
+
+
+class ConversionResult(namedtuple('ConversionResult',
+                                  ['tab_filename', 'midi_filename',
+                                   'num_notes', 'error', 'row', 'column'])):
+    """
+    The outcome of converting one tab.  error is None if the conversion
+    succeeded, otherwise it describes the problem and row and column locate
+    it in the tab when they are known.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        if self.error is None:
+            return "%s -> %s" % (self.tab_filename, self.midi_filename)
+        location = ":".join(str(n) for n in (self.row, self.column)
+                            if n is not None)
+        if location:
+            return "%s:%s: %s" % (self.tab_filename, location, self.error)
+        return "%s: %s" % (self.tab_filename, self.error)
+
+
+class BatchResult(object):
+    """The results of a batch conversion, in the order of the inputs."""
+
+    def __init__(self, results, seconds):
+        self.results = results
+        self.seconds = seconds
+
+    @property
+    def failures(self):
+        """The results of the tabs that could not be converted."""
+        return [r for r in self.results if r.error is not None]
+
+    @property
+    def num_notes(self):
+        """The total number of notes in the converted tabs."""
+        return sum(r.num_notes for r in self.results)
+
+    def summary(self):
+        """Returns a one line description of the batch and its throughput."""
+        seconds = max(self.seconds, 1e-9)
+        return ("Converted %d of %d tabs in %.2fs (%.1f tabs/s, %.0f notes/s)"
+                % (len(self.results) - len(self.failures), len(self.results),
+                   self.seconds, len(self.results) / seconds,
+                   self.num_notes / seconds))
+
+
+def find_tab_files(inputs, outdir):
+    """
+    Expands tab filenames, directories and glob patterns into a sorted list
+    of (tab_filename, midi_filename) pairs.  Directories are searched
+    recursively for .txt files and their layout is kept below outdir.
+    """
+    pairs = set()
+    for pattern in inputs:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if os.path.isdir(path):
+                for root, _, filenames in os.walk(path):
+                    for filename in filenames:
+                        if filename.endswith('.txt'):
+                            tab_filename = os.path.join(root, filename)
+                            relative = os.path.relpath(tab_filename, path)
+                            pairs.add((tab_filename,
+                                       _midi_filename(outdir, relative)))
+            else:
+                pairs.add((path,
+                           _midi_filename(outdir, os.path.basename(path))))
+    return sorted(pairs)
+
+
+def _midi_filename(outdir, relative_tab_filename):
+    """Returns the output filename for a tab below the output directory."""
+    return os.path.join(outdir,
+                        os.path.splitext(relative_tab_filename)[0] + '.mid')
+
+
+def convert_file(tab_filename, midi_filename, **tab_options):
+    """
+    Converts one tab file and returns a ConversionResult.  Problems with the
+    tab are reported in the result instead of being raised.
+    """
+    try:
+        tab_text = codecs.open(tab_filename, "r", "utf-8").read()
+        tab = Tab(tab_text, **tab_options)
+        midi = tab.to_midi_bytes()
+        directory = os.path.dirname(midi_filename)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another worker may have created it in the meantime.
+                if not os.path.isdir(directory):
+                    raise
+        with open(midi_filename, 'wb') as midi_file:
+            midi_file.write(midi)
+    except TabParsingException as e:
+        return ConversionResult(tab_filename, midi_filename, 0, str(e),
+                                e.row, e.column)
+    except Exception as e:
+        return ConversionResult(tab_filename, midi_filename, 0,
+                                "%s: %s" % (type(e).__name__, e), None, None)
+    return ConversionResult(tab_filename, midi_filename,
+                            len(tab.note_events()), None, None, None)
+
+
+def _output_collision(tab_filename, midi_filename, tab_filenames):
+    """
+    Returns the ConversionResult of a tab that is not converted because
+    other tabs in tab_filenames have the same output filename.
+    """
+    others = [other for other in tab_filenames if other != tab_filename]
+    return ConversionResult(
+        tab_filename, midi_filename, 0, "Not converted, as %s would also be "
+        "written for %s." % (midi_filename, ", ".join(others)), None, None)
+
+
+def _convert_task(task):
+    """Unpacks a task sent to a worker process."""
+    tab_filename, midi_filename, tab_options = task
+    return convert_file(tab_filename, midi_filename, **tab_options)
+
+
+def convert_many(inputs, outdir, workers=None, chunksize=None,
+                 **tab_options):
+    """
+    Converts the tabs named by the given filenames, directories and glob
+    patterns into midi files below outdir and returns a BatchResult.
+
+    The work is spread over a pool of worker processes (one per cpu by
+    default) in chunks of chunksize tabs.  A tab that cannot be converted is
+    reported in the results and does not stop the batch, and so are tabs in
+    different directories that would be written to the same midi file.  The
+    results and output files do not depend on the number of workers.  Other
+    keyword arguments are passed on to Tab.
+    """
+    start = default_timer()
+    pairs = find_tab_files(inputs, outdir)
+    tab_filenames = defaultdict(list)
+    for tab_filename, midi_filename in pairs:
+        tab_filenames[midi_filename].append(tab_filename)
+    tasks = [(tab_filename, midi_filename, tab_options)
+             for tab_filename, midi_filename in pairs
+             if len(tab_filenames[midi_filename]) == 1]
+    if workers is None:
+        workers = cpu_count()
+    workers = max(1, min(workers, len(tasks)))
+    if workers == 1:
+        converted = [_convert_task(task) for task in tasks]
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(tasks) // (workers * 4))
+        pool = Pool(workers)
+        try:
+            converted = list(pool.imap(_convert_task, tasks, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+    converted = iter(converted)
+    results = [next(converted) if len(tab_filenames[midi_filename]) == 1
+               else _output_collision(tab_filename, midi_filename,
+                                      tab_filenames[midi_filename])
+               for tab_filename, midi_filename in pairs]
+    return BatchResult(results, default_timer() - start)
@@ -0,0 +1,229 @@
+"""
+cache.py: A content-addressed cache for parsed tabs and generated midi.
+
+Entries are keyed by a hash of the normalized tab text, the options passed to
+Tab and a version salt, so identical submissions are converted only once and
+upgrading the library invalidates old entries.  Recently used entries are
+kept in memory; midi files can also be kept in a directory shared between
+processes.
+"""
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from tabtomidi import __version__
+from tabtomidi.drumtabs import Tab
+from tabtomidi.lexer import normalize_lines
+from tabtomidi.notenames import DEFAULT_NOTE_NAME_TO_NUMBER_MAP
+
+# Bump this when the format of cached entries changes.
+CACHE_FORMAT = 2
+VERSION_SALT = "tabtomidi-%s-%d" % (__version__, CACHE_FORMAT)
+
+_argspec = inspect.getargspec(Tab.__init__)
+TAB_OPTION_DEFAULTS = dict(zip(_argspec.args[-len(_argspec.defaults):],
+                               _argspec.defaults))
+# Statistics do not change the midi, so they are not part of the key.
+del TAB_OPTION_DEFAULTS['stats']
+
+
+def cache_key(tabtext, **tab_options):
+    """
+    Returns the hex digest identifying the conversion of the tab text with
+    the given Tab options.
+    """
+    unknown_options = set(tab_options).difference(TAB_OPTION_DEFAULTS)
+    if unknown_options:
+        raise TypeError("Unknown Tab options: %s" % ", ".join(unknown_options))
+    options = dict(TAB_OPTION_DEFAULTS, **tab_options)
+    if options['note_name_to_number_map'] is None:
+        options['note_name_to_number_map'] = DEFAULT_NOTE_NAME_TO_NUMBER_MAP
+    text = u"\n".join(normalize_lines(tabtext))
+    digest = hashlib.sha1(VERSION_SALT)
+    digest.update(b"\0")
+    digest.update(json.dumps(options, sort_keys=True))
+    digest.update(b"\0")
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class _Entry(object):
+    """A parsed tab and, once it has been rendered, its midi file."""
+    __slots__ = ('tab', 'midi')
+
+    def __init__(self, tab, midi=None):
+        self.tab = tab
+        self.midi = midi
+
+
+class ConversionCache(object):
+    """
+    Caches Tab objects and their midi files.
+
+    At most max_entries conversions are kept in memory, evicting the least
+    recently used one first.  If directory is given, midi files are also
+    stored there (written atomically) and the least recently used files are
+    removed once they take up more than max_directory_bytes.  The hits,
+    misses, evictions, disk_hits, disk_writes and disk_evictions attributes
+    count what the cache did; stats() returns them as a dict.
+    """
+
+    def __init__(self, max_entries=256, directory=None,
+                 max_directory_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_directory_bytes = max_directory_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self.disk_evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._directory_bytes = sum(
+                os.path.getsize(path) for path in self._disk_files())
+
+    def stats(self):
+        """Returns the cache counters as a dict."""
+        return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'evictions' : self.evictions,
+            'disk_hits' : self.disk_hits,
+            'disk_writes' : self.disk_writes,
+            'disk_evictions' : self.disk_evictions,
+            'entries' : len(self._entries),
+        }
+
+    def tab(self, tabtext, **tab_options):
+        """Returns the Tab for the tab text, parsing it only on a miss."""
+        key = cache_key(tabtext, **tab_options)
+        entry = self._get(key)
+        if entry is None:
+            entry = _Entry(Tab(tabtext, **tab_options))
+            self._put(key, entry)
+        return entry.tab
+
+    def midi_bytes(self, tabtext, **tab_options):
+        """
+        Returns the midi file for the tab text, converting it only if it is
+        neither in memory nor on disk.
+        """
+        key = cache_key(tabtext, **tab_options)
+        entry = self._get(key)
+        if entry is not None and entry.midi is not None:
+            return entry.midi
+        midi = self._read_disk(key)
+        if midi is not None:
+            return midi
+        if entry is None:
+            entry = _Entry(Tab(tabtext, **tab_options))
+        entry.midi = entry.tab.to_midi_bytes()
+        self._put(key, entry)
+        self._write_disk(key, entry.midi)
+        return entry.midi
+
+    def _get(self, key):
+        """Returns the entry for the key and marks it as recently used."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries[key] = entry
+            return entry
+
+    def _put(self, key, entry):
+        """Stores the entry, evicting the least recently used ones."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.mid')
+
+    def _disk_files(self):
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith('.mid'):
+                    yield os.path.join(root, filename)
+
+    def _read_disk(self, key):
+        """Returns the midi file stored on disk for the key, or None."""
+        if self.directory is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as midi_file:
+                midi = midi_file.read()
+            # Touch the file so that eviction removes older files first.
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        return midi
+
+    def _write_disk(self, key, midi):
+        """Atomically stores the midi file on disk, then enforces the limit."""
+        if self.directory is None:
+            return
+        path = self._disk_path(key)
+        subdirectory = os.path.dirname(path)
+        if not os.path.isdir(subdirectory):
+            try:
+                os.makedirs(subdirectory)
+            except OSError:
+                if not os.path.isdir(subdirectory):
+                    raise
+        fd, temp_path = tempfile.mkstemp(dir=subdirectory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(midi)
+            os.rename(temp_path, path)
+        except:
+            os.remove(temp_path)
+            raise
+        with self._lock:
+            self.disk_writes += 1
+            self._directory_bytes += len(midi)
+            over_limit = self._directory_bytes > self.max_directory_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Removes the least recently used files until under the limit."""
+        files = []
+        for path in self._disk_files():
+            try:
+                files.append((os.path.getmtime(path), os.path.getsize(path),
+                              path))
+            except OSError:
+                pass
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        for _, size, path in files:
+            if total <= self.max_directory_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._directory_bytes = total
+            self.disk_evictions += evicted
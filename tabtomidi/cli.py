@@ -3,25 +3,74 @@ A command-line tool for testing the tabtomidi library.
 """
 import argparse
 import codecs
+import io
+import sys
 
 from tabtomidi import Tab
-from collections import defaultdict
+from tabtomidi.batch import convert_many
+from tabtomidi.engines import ENGINES, REFERENCE_ENGINE
+from tabtomidi.parallel import render_midi
+from tabtomidi.profiling import ConversionStats
+from tabtomidi.streaming import stream_midi
 
 def main():
     """
     Main method of the command line interface
     """
     parser = argparse.ArgumentParser(
-        description="Convert drum tabs to midi files.")
-    parser.add_argument("tab_filename")
-    parser.add_argument("midi_output_file", type=argparse.FileType('w'))
+        description="Convert drum tabs to midi files.",
+        usage="%(prog)s tab_filename midi_output_file\n"
+              "       %(prog)s -o OUTDIR [-j WORKERS] input [input ...]")
+    parser.add_argument("inputs", nargs="+", metavar="input",
+        help="a tab file and the midi file to write, or with --outdir, tab "
+             "files, directories and glob patterns to convert")
+    parser.add_argument("-o", "--outdir",
+        help="convert all inputs and write the midi files to this directory")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+        help="number of worker processes for --outdir, or for converting a "
+             "long tab (default: one per cpu with --outdir, otherwise one)")
+    parser.add_argument("--stream", action="store_true",
+        help="convert one group of bars at a time to bound memory use")
+    parser.add_argument("--engine", choices=sorted(ENGINES),
+        default=REFERENCE_ENGINE,
+        help="the engine that walks the notes (default: %(default)s)")
+    parser.add_argument("--profile", action="store_true",
+        help="print the time spent in every phase of the conversion")
     args = parser.parse_args()
-    tab_file = codecs.open(args.tab_filename, "r", "utf-8")
+    if args.profile and (args.outdir is not None or args.stream):
+        parser.error("--profile cannot be combined with --outdir or --stream")
+    if args.stream and args.workers is not None:
+        parser.error("--stream cannot be combined with --workers")
+    if args.stream and args.engine != REFERENCE_ENGINE:
+        parser.error("--stream cannot be combined with --engine")
+    if args.outdir is not None:
+        result = convert_many(args.inputs, args.outdir, workers=args.workers,
+                              engine=args.engine)
+        for failure in result.failures:
+            sys.stderr.write(str(failure) + "\n")
+        sys.stdout.write(result.summary() + "\n")
+        return 1 if result.failures else 0
+    if len(args.inputs) != 2:
+        parser.error("expected a tab file and a midi output file")
+    tab_filename, midi_filename = args.inputs
+    if args.stream:
+        with io.open(tab_filename, "r", encoding="utf-8") as tab_file:
+            with open(midi_filename, "wb") as midi_output_file:
+                stream_midi(tab_file, midi_output_file)
+        return 0
+    tab_file = codecs.open(tab_filename, "r", "utf-8")
     tab_text = tab_file.read()
-    tab = Tab(tab_text, note_name_to_number_map=defaultdict(int))
-    tab = Tab(tab_text)
-    tab.write_midi_file(args.midi_output_file)
+    stats = ConversionStats() if args.profile else None
+    tab = Tab(tab_text, engine=args.engine, stats=stats)
+    with open(midi_filename, "wb") as midi_output_file:
+        if args.workers is not None:
+            midi_output_file.write(render_midi(tab, args.workers))
+        else:
+            tab.write_midi_file(midi_output_file)
+    if stats is not None:
+        sys.stderr.write(stats.report())
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
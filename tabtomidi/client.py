@@ -0,0 +1,256 @@
+"""
+client.py: A thin client for the conversion daemon in tabtomidi.daemon.
+
+The daemon keeps the library imported and its caches warm, so converting a
+tab through it skips the startup cost of a new interpreter importing the
+library.  This module only uses the standard library, so that running it as
+a script is fast too:
+
+    python tabtomidi/client.py [--socket PATH] tab.txt tab.mid [...]
+
+Tabs are sent to the daemon by path and the midi files written by the
+client.  A path of "-" reads the tab from stdin or writes the midi file to
+stdout.
+
+Messages in both directions are a JSON header and a body, each preceded by
+its length as a 4-byte big-endian number.  Requests have a "command"
+("convert", "stats" or "shutdown"); responses have a "status", which is 200
+on success and otherwise an HTTP-like status code like those of
+tabtomidi.server, with an "error" dict describing the problem.
+"""
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+
+# The Tab options that can be passed with a conversion.
+CONVERT_OPTIONS = ('bpm', 'strike_volume', 'accent_volume',
+                   'ghost_note_volume')
+# Headers longer than this are rejected, as they cannot be requests.
+MAX_HEADER_BYTES = 64 * 1024
+
+_LENGTHS = struct.Struct('>II')
+
+
+def default_socket_path():
+    """Returns the path of the daemon's socket for the current user."""
+    # tempfile.gettempdir would be slower to import than the rest of the
+    # client.
+    directory = os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(directory, 'tabtomidi-%d.sock' % os.getuid())
+
+
+class DaemonError(Exception):
+    """
+    Raised when the daemon does not convert a tab.  status is the status of
+    the response and error the dict describing the problem.
+    """
+
+    def __init__(self, status, error):
+        Exception.__init__(self, error.get('message', "Unknown error."))
+        self.status = status
+        self.error = error
+
+    def __str__(self):
+        error = self.error
+        message = "%s: %s" % (error.get('type', 'Error'),
+                              error.get('message', "Unknown error."))
+        # Some errors only know the row, and some know neither.
+        position = ["%s %d" % (name, error[name])
+                    for name in ('row', 'column')
+                    if error.get(name) is not None]
+        if position:
+            message += " (%s)" % ", ".join(position)
+        return message
+
+
+def send_message(sock, header, body=b""):
+    """Sends a message with the JSON-serializable header and the body."""
+    header = json.dumps(header).encode('utf-8')
+    sock.sendall(_LENGTHS.pack(len(header), len(body)) + header + body)
+
+
+def receive_message(sock, max_body_bytes=None):
+    """
+    Returns the (header, body) of the next message, or None if the
+    connection was closed before it.  Raises ValueError if the message is
+    malformed or the body longer than max_body_bytes.
+    """
+    lengths = _receive_exactly(sock, _LENGTHS.size, eof_ok=True)
+    if lengths is None:
+        return None
+    header_length, body_length = _LENGTHS.unpack(lengths)
+    if header_length > MAX_HEADER_BYTES:
+        raise ValueError("Headers are limited to %d bytes." %
+                         MAX_HEADER_BYTES)
+    if max_body_bytes is not None and body_length > max_body_bytes:
+        raise ValueError("Bodies are limited to %d bytes." % max_body_bytes)
+    header = json.loads(_receive_exactly(sock, header_length)
+                        .decode('utf-8'))
+    if not isinstance(header, dict):
+        raise ValueError("The header is not a JSON object.")
+    return header, _receive_exactly(sock, body_length)
+
+
+def _receive_exactly(sock, length, eof_ok=False):
+    """
+    Returns the next length bytes.  Returns None if eof_ok is True and the
+    connection is closed before the first byte, and raises ValueError if it
+    is closed later.
+    """
+    chunks = []
+    remaining = length
+    while remaining:
+        chunk = sock.recv(min(remaining, 256 * 1024))
+        if not chunk:
+            if eof_ok and remaining == length:
+                return None
+            raise ValueError("The connection was closed mid-message.")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class DaemonClient(object):
+    """
+    Sends requests to the daemon listening on the socket path over one
+    connection, which is opened by the first request.  Raises socket.error
+    if no daemon is listening.
+    """
+
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self._sock = None
+
+    def convert(self, tabtext=None, path=None, **tab_options):
+        """
+        Returns the midi file for the tab text, or for the tab in the file
+        at path, which the daemon reads.  Raises DaemonError if the tab
+        cannot be converted.
+        """
+        header = {'command': 'convert', 'options': tab_options}
+        if path is not None:
+            header['path'] = os.path.abspath(path)
+            body = b""
+        else:
+            body = tabtext.encode('utf-8')
+        return self._request(header, body)[1]
+
+    def stats(self):
+        """Returns the counters of the daemon as a dict."""
+        return self._request({'command': 'stats'})[0]['stats']
+
+    def shutdown(self):
+        """
+        Asks the daemon to stop once the conversions in progress are done.
+        """
+        self._request({'command': 'shutdown'})
+        self.close()
+
+    def close(self):
+        """Closes the connection to the daemon."""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _request(self, header, body=b""):
+        """Sends a request and returns the (header, body) of the response."""
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except:
+                sock.close()
+                raise
+            self._sock = sock
+        try:
+            send_message(self._sock, header, body)
+            response = receive_message(self._sock)
+        except:
+            self.close()
+            raise
+        if response is None:
+            self.close()
+            raise DaemonError(503, {'message': "The daemon closed the "
+                                               "connection."})
+        header, body = response
+        if header.get('status') != 200:
+            raise DaemonError(header.get('status'), header.get('error', {}))
+        return header, body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert drum tabs to midi files with the tabtomidi "
+                    "daemon.",
+        usage="%(prog)s [options] tab_filename midi_output_file [...]\n"
+              "       %(prog)s [--socket PATH] --stats | --shutdown")
+    parser.add_argument("paths", nargs="*", metavar="path",
+        help="pairs of a tab file and the midi file to write")
+    parser.add_argument("--socket",
+        help="the daemon's socket (default: %s)" % default_socket_path())
+    for option in CONVERT_OPTIONS:
+        parser.add_argument("--" + option.replace('_', '-'), type=int,
+                            dest=option)
+    parser.add_argument("--stats", action="store_true",
+        help="print the counters of the daemon as JSON")
+    parser.add_argument("--shutdown", action="store_true",
+        help="stop the daemon once its conversions are done")
+    args = parser.parse_args(argv)
+    if args.stats or args.shutdown:
+        if args.paths:
+            parser.error("--stats and --shutdown take no paths")
+    elif not args.paths or len(args.paths) % 2:
+        parser.error("expected pairs of a tab file and a midi output file")
+    tab_options = dict((option, getattr(args, option))
+                       for option in CONVERT_OPTIONS
+                       if getattr(args, option) is not None)
+    client = DaemonClient(args.socket)
+    try:
+        if args.stats:
+            sys.stdout.write(json.dumps(client.stats(), indent=2) + "\n")
+            return 0
+        if args.shutdown:
+            client.shutdown()
+            return 0
+        return _convert_all(client, args.paths, tab_options)
+    except socket.error as e:
+        sys.stderr.write("Cannot reach the daemon at %s: %s\n" %
+                         (client.socket_path, e))
+        return 2
+    finally:
+        client.close()
+
+
+def _convert_all(client, paths, tab_options):
+    """
+    Converts every pair of a tab file and a midi file in paths and returns
+    the exit status.
+    """
+    status = 0
+    for tab_path, midi_path in zip(paths[::2], paths[1::2]):
+        try:
+            if tab_path == '-':
+                midi = client.convert(sys.stdin.read().decode('utf-8'),
+                                      **tab_options)
+            else:
+                midi = client.convert(path=tab_path, **tab_options)
+        except DaemonError as e:
+            sys.stderr.write("%s: %s\n" % (tab_path, e))
+            status = 1
+            continue
+        if midi_path == '-':
+            sys.stdout.write(midi)
+            sys.stdout.flush()
+        else:
+            with open(midi_path, 'wb') as midi_file:
+                midi_file.write(midi)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+corpus.py: Random access to the tabs in large archive files.
+
+An archive is a UTF-8 text file holding many tabs, separated by lines that
+contain only a form feed ("\\f").  open_corpus memory-maps the archive and
+loads the offsets of its entries, and of the groups of bars in every entry,
+from an index file next to it, building the index on the first use.  An
+entry is converted by decoding only its own bytes, so a worker process can
+convert any entry, or any shard of the archive, without reading the rest.
+"""
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from tabtomidi.drumtabs import Tab
+from tabtomidi.lexer import PIPE_LOOKALIKES
+
+SEPARATOR = b"\f"
+INDEX_SUFFIX = ".idx"
+# Bump this when the layout of index files, or what they hold, changes.
+# Format 1 left out the first group of an archive that starts with bars.
+INDEX_FORMAT = 2
+
+_INDEX_MAGIC = b"TTMI"
+_INDEX_HEADER = struct.Struct("<4sHBBQdQQH")
+_OFFSET_TYPECODE = 'L'
+_PIPES = b"|".join(re.escape(lookalike.encode('utf-8'))
+                   for lookalike in PIPE_LOOKALIKES)
+# Lines that contain a vertical line or a triplet mark.
+_GROUP_LINE_RE = re.compile(b"^[^\n]*(?:" + _PIPES + b"|\\(3\\))[^\n]*$",
+                            re.MULTILINE)
+_PIPE_RE = re.compile(_PIPES)
+
+
+class CorpusIndex(object):
+    """
+    The offsets of the entries of an archive and of their groups of bars.
+
+    Entry i is the bytes from starts[i] to ends[i] of the archive.  The
+    groups of bars of entry i start at the offsets
+    group_offsets[first_groups[i]:first_groups[i+1]], which are relative to
+    the start of the entry.
+    """
+
+    def __init__(self, starts, ends, first_groups, group_offsets,
+                 separator=SEPARATOR, archive_size=0, archive_mtime=0.0):
+        self.starts = starts
+        self.ends = ends
+        self.first_groups = first_groups
+        self.group_offsets = group_offsets
+        self.separator = separator
+        self.archive_size = archive_size
+        self.archive_mtime = archive_mtime
+
+    def __len__(self):
+        return len(self.starts)
+
+    def save(self, index_path):
+        """Writes the index to a file."""
+        with open(index_path, 'wb') as index_file:
+            index_file.write(_INDEX_HEADER.pack(
+                _INDEX_MAGIC, INDEX_FORMAT, array(_OFFSET_TYPECODE).itemsize,
+                sys.byteorder == 'little', self.archive_size,
+                self.archive_mtime, len(self.starts), len(self.group_offsets),
+                len(self.separator)))
+            index_file.write(self.separator)
+            for offsets in (self.starts, self.ends, self.first_groups,
+                            self.group_offsets):
+                offsets.tofile(index_file)
+
+    @classmethod
+    def load(cls, index_path):
+        """
+        Reads an index written by save.  Returns None if the file is not an
+        index that this version of the library can read on this machine.
+        """
+        try:
+            index_file = open(index_path, 'rb')
+        except IOError:
+            return None
+        with index_file:
+            header = index_file.read(_INDEX_HEADER.size)
+            if len(header) != _INDEX_HEADER.size:
+                return None
+            (magic, format, itemsize, little_endian, archive_size,
+             archive_mtime, num_entries, num_groups, separator_length) = \
+                _INDEX_HEADER.unpack(header)
+            if magic != _INDEX_MAGIC or format != INDEX_FORMAT or \
+                    itemsize != array(_OFFSET_TYPECODE).itemsize or \
+                    little_endian != (sys.byteorder == 'little'):
+                return None
+            separator = index_file.read(separator_length)
+            arrays = []
+            try:
+                for length in (num_entries, num_entries, num_entries + 1,
+                               num_groups):
+                    offsets = array(_OFFSET_TYPECODE)
+                    offsets.fromfile(index_file, length)
+                    arrays.append(offsets)
+            except EOFError:
+                return None
+        return cls(*arrays, separator=separator, archive_size=archive_size,
+                   archive_mtime=archive_mtime)
+
+
+def build_index(buffer, separator=SEPARATOR):
+    """
+    Returns the CorpusIndex of an archive held in a string or mmap.  Empty
+    entries, such as the one after a final separator line, are left out.
+    """
+    starts = array(_OFFSET_TYPECODE)
+    ends = array(_OFFSET_TYPECODE)
+    first_groups = array(_OFFSET_TYPECODE, [0])
+    group_offsets = array(_OFFSET_TYPECODE)
+    separator_re = re.compile(b"^" + re.escape(separator) + b"\r?$\n?",
+                              re.MULTILINE)
+    start = 0
+    for match in separator_re.finditer(buffer):
+        _add_entry(buffer, start, match.start(), starts, ends, first_groups,
+                   group_offsets)
+        start = match.end()
+    _add_entry(buffer, start, len(buffer), starts, ends, first_groups,
+               group_offsets)
+    return CorpusIndex(starts, ends, first_groups, group_offsets, separator)
+
+
+def _add_entry(buffer, start, end, starts, ends, first_groups,
+               group_offsets):
+    """Adds the entry between start and end, unless it is empty."""
+    if start == end:
+        return
+    starts.append(start)
+    ends.append(end)
+    # Find the lines that start groups of bars like lexer.iter_bar_groups:
+    # a group starts on a line with a vertical line and continues over lines
+    # with vertical lines or triplet marks.  Count rows are blanked out by
+    # normalization, so they end groups.  The first line of the entry does
+    # not continue a group.
+    previous_end = start - 2
+    for match in _GROUP_LINE_RE.finditer(buffer, start, end):
+        line = match.group()
+        if '&' in line or '+' in line:
+            continue
+        continues_group = match.start() == previous_end + 1
+        if _PIPE_RE.search(line):
+            if not continues_group:
+                group_offsets.append(match.start() - start)
+        elif not continues_group:
+            continue
+        previous_end = match.end()
+    first_groups.append(len(group_offsets))
+
+
+class Corpus(object):
+    """
+    A memory-mapped archive of tabs and its CorpusIndex.  Entries are
+    numbered from 0 in the order of the archive.  If index is None, it is
+    built from the archive with the given separator.
+    """
+
+    def __init__(self, archive_path, index=None, separator=SEPARATOR):
+        self.archive_path = archive_path
+        with open(archive_path, 'rb') as archive_file:
+            if os.fstat(archive_file.fileno()).st_size:
+                self._buffer = mmap.mmap(archive_file.fileno(), 0,
+                                         access=mmap.ACCESS_READ)
+            else:
+                # Empty files cannot be mapped.
+                self._buffer = b""
+        if index is None:
+            index = build_index(self._buffer, separator)
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """Unmaps the archive."""
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def text(self, entry):
+        """Returns the text of an entry, decoding only its bytes."""
+        index = self.index
+        return self._buffer[index.starts[entry]:index.ends[entry]] \
+            .decode('utf-8')
+
+    def tab(self, entry, **tab_options):
+        """Returns the Tab of an entry.  The options are passed on to Tab."""
+        return Tab(self.text(entry), **tab_options)
+
+    def group_offsets(self, entry):
+        """
+        Returns the offsets of the groups of bars of an entry, in bytes from
+        the start of the entry.
+        """
+        index = self.index
+        return index.group_offsets[index.first_groups[entry]:
+                                   index.first_groups[entry + 1]]
+
+    def shards(self, count):
+        """
+        Splits the entries into count ranges of consecutive entries with
+        about the same number of bytes each, for converting the archive in
+        several processes.
+        """
+        starts = self.index.starts
+        size = self.index.ends[-1] if len(starts) else 0
+        bounds = [0] + [bisect_left(starts, size * i // count)
+                        for i in xrange(1, count)] + [len(starts)]
+        return [xrange(bounds[i], bounds[i + 1]) for i in xrange(count)]
+
+
+def open_corpus(archive_path, index_path=None, separator=SEPARATOR):
+    """
+    Returns the Corpus of an archive.  The index is read from index_path
+    (the archive path followed by .idx by default), and built and saved
+    there if it is missing or older than the archive.
+    """
+    if index_path is None:
+        index_path = archive_path + INDEX_SUFFIX
+    stat = os.stat(archive_path)
+    index = CorpusIndex.load(index_path)
+    if index is not None and index.separator == separator and \
+            index.archive_size == stat.st_size and \
+            index.archive_mtime == stat.st_mtime:
+        return Corpus(archive_path, index)
+    corpus = Corpus(archive_path, separator=separator)
+    corpus.index.archive_size = stat.st_size
+    corpus.index.archive_mtime = stat.st_mtime
+    corpus.index.save(index_path)
+    return corpus
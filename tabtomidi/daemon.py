@@ -0,0 +1,296 @@
+"""
+daemon.py: A long-lived process that converts tabs for tabtomidi.client.
+
+Converting a tab with the command-line tool starts a new interpreter and
+imports the library first, which takes longer than converting a typical tab.
+The daemon pays for that once: it listens on a Unix socket, converts the
+tabs that clients send it in the process that has everything imported, and
+keeps recent conversions in a ConversionCache.  See tabtomidi.client for the
+protocol.
+
+Every client connection is served by its own thread.  The daemon stops when
+a client asks it to, on SIGTERM or SIGINT, or after idle_timeout seconds
+without requests; it stops accepting connections, finishes the conversions
+in progress and removes its socket.  The socket is only accessible to the
+user running the daemon, since the daemon reads the tab files that clients
+name.
+
+Usage: python -m tabtomidi.daemon [--socket PATH] [--idle-timeout SECONDS]
+"""
+import argparse
+import codecs
+import errno
+import os
+import signal
+import socket
+import sys
+import threading
+from SocketServer import BaseRequestHandler, ThreadingMixIn, \
+    UnixStreamServer
+from timeit import default_timer
+
+from tabtomidi.cache import ConversionCache
+from tabtomidi.client import CONVERT_OPTIONS, default_socket_path, \
+    receive_message, send_message
+from tabtomidi.drumtabs import Tab
+from tabtomidi.exceptions import TabParsingException
+from tabtomidi.server import ServiceError, error_dict
+
+
+class ConversionDaemon(ThreadingMixIn, UnixStreamServer):
+    """
+    Converts tabs for the clients that connect to the Unix socket at
+    socket_path (default_socket_path() by default).
+
+    serve runs the daemon until stop is called or, if idle_timeout is given,
+    no request has been received for that many seconds.  Tab bodies larger
+    than max_request_bytes are rejected.  Conversions are cached in cache, a
+    ConversionCache.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path=None, idle_timeout=None, cache=None,
+                 max_request_bytes=16 * 1024 * 1024, verbose=False):
+        if socket_path is None:
+            socket_path = default_socket_path()
+        _remove_stale_socket(socket_path)
+        # Create the socket file without permissions for other users.
+        umask = os.umask(0o177)
+        try:
+            UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.cache = cache if cache is not None else ConversionCache()
+        self.max_request_bytes = max_request_bytes
+        self.verbose = verbose
+        self._lock = threading.Condition()
+        self._stopping = threading.Event()
+        self._in_progress = 0
+        self._closed = False
+        self._last_request = default_timer()
+        self._requests = 0
+        self._errors = 0
+        self._started = default_timer()
+
+    @property
+    def stopping(self):
+        """True once the daemon has been asked to stop."""
+        return self._stopping.is_set()
+
+    def serve(self):
+        """
+        Serves clients until the daemon is stopped, then waits for the
+        requests in progress and closes the socket.
+        """
+        if self.idle_timeout is not None:
+            watcher = threading.Thread(target=self._stop_when_idle)
+            watcher.daemon = True
+            watcher.start()
+        try:
+            if not self.stopping:
+                self.serve_forever(poll_interval=0.1)
+            with self._lock:
+                while self._in_progress:
+                    self._lock.wait()
+                self._closed = True
+        finally:
+            self.server_close()
+
+    def stop(self):
+        """
+        Asks serve to return once the requests in progress are done.  Can be
+        called from any thread and from signal handlers.
+        """
+        if self.stopping:
+            return
+        self._stopping.set()
+        # shutdown waits for serve_forever to return, so it cannot be called
+        # from the thread that runs serve_forever.
+        thread = threading.Thread(target=self.shutdown)
+        thread.daemon = True
+        thread.start()
+
+    def stats(self):
+        """Returns the counters of the daemon and its cache as a dict."""
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'uptime': default_timer() - self._started,
+                'requests': self._requests,
+                'errors': self._errors,
+                'in_progress': self._in_progress,
+                'cache': self.cache.stats(),
+            }
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.socket_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def respond(self, header, body):
+        """Returns the (header, body) of the response to a request."""
+        start = default_timer()
+        with self._lock:
+            if self._closed:
+                return {'status': 503,
+                        'error': {'message': "The daemon is stopping."}}, b""
+            self._in_progress += 1
+            self._requests += 1
+            self._last_request = start
+        try:
+            command = header.get('command')
+            try:
+                if command == 'convert':
+                    return {'status': 200}, self._convert(header, body)
+                if command == 'stats':
+                    return {'status': 200, 'stats': self.stats()}, b""
+                if command == 'shutdown':
+                    self.stop()
+                    return {'status': 200}, b""
+                raise ServiceError(400, "Unknown command: %s" % command)
+            except ServiceError as e:
+                with self._lock:
+                    self._errors += 1
+                return {'status': e.status, 'error': e.error}, b""
+        finally:
+            with self._lock:
+                self._in_progress -= 1
+                self._last_request = default_timer()
+                self._lock.notify_all()
+            if self.verbose:
+                sys.stderr.write("%s %s %.1fms\n" % (
+                    command, header.get('path', '-'),
+                    (default_timer() - start) * 1000))
+
+    def _convert(self, header, body):
+        """Returns the midi file for a convert request."""
+        tab_options = header.get('options') or {}
+        if not isinstance(tab_options, dict):
+            raise ServiceError(400, "The options are not a JSON object.")
+        for name, value in tab_options.iteritems():
+            if name not in CONVERT_OPTIONS:
+                raise ServiceError(400, "Unknown option: %s" % name)
+            if not isinstance(value, (int, long)):
+                raise ServiceError(400, "Option %s must be an integer." %
+                                   name)
+        path = header.get('path')
+        if path is not None and not isinstance(path, basestring):
+            raise ServiceError(400, "The path is not a string.")
+        try:
+            if path is not None:
+                with codecs.open(path, "r", "utf-8") as tab_file:
+                    tabtext = tab_file.read()
+            else:
+                tabtext = body.decode('utf-8')
+        except IOError as e:
+            raise ServiceError(404, "Cannot read %s: %s" % (path, e.strerror),
+                               type='IOError')
+        except UnicodeDecodeError:
+            raise ServiceError(400, "The tab is not valid UTF-8.")
+        try:
+            return self.cache.midi_bytes(tabtext, **tab_options)
+        except TabParsingException as e:
+            error = error_dict(e)
+            raise ServiceError(422, error.pop('message'), **error)
+        except Exception as e:
+            raise ServiceError(500, str(e), type=type(e).__name__)
+
+    def _stop_when_idle(self):
+        """Stops the daemon once it has been idle for idle_timeout seconds."""
+        while not self._stopping.wait(min(self.idle_timeout, 1.0)):
+            with self._lock:
+                idle = not self._in_progress and \
+                    default_timer() - self._last_request >= self.idle_timeout
+            if idle:
+                if self.verbose:
+                    sys.stderr.write("Stopping after %gs without requests.\n"
+                                     % self.idle_timeout)
+                self.stop()
+
+
+class _RequestHandler(BaseRequestHandler):
+    """Serves the requests of one client connection of a ConversionDaemon."""
+
+    def handle(self):
+        server = self.server
+        sock = self.request
+        while not server.stopping:
+            try:
+                message = receive_message(sock, server.max_request_bytes)
+            except ValueError as e:
+                # The rest of the stream cannot be parsed, so give up on it.
+                send_message(sock, {'status': 400,
+                                    'error': {'message': str(e)}})
+                return
+            except socket.error:
+                return
+            if message is None:
+                return
+            header, body = server.respond(*message)
+            try:
+                send_message(sock, header, body)
+            except socket.error:
+                return
+
+
+def _remove_stale_socket(socket_path):
+    """
+    Removes the socket file left behind by a daemon that did not stop
+    cleanly.  Raises socket.error if a daemon is listening on it.
+    """
+    if not os.path.exists(socket_path):
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error as e:
+        if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            raise
+        os.unlink(socket_path)
+    else:
+        raise socket.error(errno.EADDRINUSE,
+                           "A daemon is already listening on %s." %
+                           socket_path)
+    finally:
+        sock.close()
+
+
+def warm_up():
+    """
+    Converts a small tab, so that the tables that are built on first use are
+    ready before the first client connects.
+    """
+    Tab("HH |x-x-|\n S |-o-O|\n B |o-g-|").to_midi_bytes()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert tabs for tabtomidi.client in a long-lived "
+                    "process.")
+    parser.add_argument("--socket", default=default_socket_path(),
+        help="path of the Unix socket to listen on (default: %(default)s)")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+        help="stop after this many seconds without requests")
+    parser.add_argument("--cache-entries", type=int, default=256,
+        help="conversions kept in memory (default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+        help="log every request")
+    args = parser.parse_args(argv)
+    warm_up()
+    daemon = ConversionDaemon(args.socket, args.idle_timeout,
+                              ConversionCache(args.cache_entries),
+                              verbose=args.verbose)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: daemon.stop())
+    sys.stderr.write("Listening on %s\n" % daemon.socket_path)
+    daemon.serve()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
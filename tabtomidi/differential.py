@@ -0,0 +1,113 @@
+"""
+differential.py: Checks that an engine walks tabs like the reference engine.
+
+first_divergence walks a tab with two engines side by side, one group of bars
+at a time, and returns where their notes first differ: the group of bars, and
+the row and column of the tab that the differing note was read from.
+"""
+from collections import namedtuple
+from itertools import izip
+
+from tabtomidi.drumtabs import Tab
+from tabtomidi.engines import REFERENCE_ENGINE, get_engine
+
+
+class Divergence(namedtuple('Divergence', ['bar_group', 'row', 'column',
+                                           'expected', 'actual'])):
+    """
+    The first difference between two engines.  bar_group is the index of the
+    group of bars, and row and column locate the note in the normalized tab,
+    or are None if the note cannot be traced back to a column.  expected and
+    actual describe what the reference engine and the other engine did: a
+    (tick, note type, strike type) tuple for a note, None for a missing
+    note, the exception that an engine raised, or the length in ticks of the
+    group when only the lengths differ.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        location = "bar group %d" % self.bar_group
+        if self.row is not None:
+            location += ", row %d" % self.row
+        if self.column is not None:
+            location += ", column %d" % self.column
+        return "%s: expected %r, got %r" % (location, self.expected,
+                                            self.actual)
+
+
+def first_divergence(tabtext, engine, reference=REFERENCE_ENGINE,
+                     ignore_repetition=False, **tab_options):
+    """
+    Walks the tab with the named engine and the reference engine and returns
+    the first Divergence between them, or None if they agree.  The options
+    are passed on to Tab, which lexes the tab for both engines; errors while
+    lexing are raised.
+    """
+    tab = Tab(tabtext, engine=reference, **tab_options)
+    bar_groups = tab._bar_groups
+    arguments = (tab.divisions_in_bar, ignore_repetition, tab.ticks_per_beat,
+                 tab._per_bar_divisions)
+    expected_builder = get_engine(reference)(*arguments)
+    actual_builder = get_engine(engine)(*arguments)
+    for i, group in enumerate(bar_groups):
+        start = expected_builder.tick
+        expected, expected_ticks = _walk_group(expected_builder, group)
+        actual, actual_ticks = _walk_group(actual_builder, group)
+        if isinstance(expected, Exception) or isinstance(actual, Exception):
+            if type(expected) is type(actual) and \
+                    str(expected) == str(actual):
+                # Both engines stop at the same error.
+                return None
+            return Divergence(i, getattr(expected, 'row', None),
+                              getattr(expected, 'column', None), expected,
+                              actual)
+        for j in xrange(max(len(expected), len(actual))):
+            expected_note = expected[j] if j < len(expected) else None
+            actual_note = actual[j] if j < len(actual) else None
+            if expected_note != actual_note:
+                row, column = _locate(expected_builder, group, start,
+                                      expected_note or actual_note)
+                return Divergence(i, row, column, expected_note, actual_note)
+        if expected_ticks != actual_ticks:
+            return Divergence(i, None, None, expected_ticks, actual_ticks)
+    return None
+
+
+def _walk_group(builder, group):
+    """
+    Adds the group of bars to the builder and returns its notes as a list
+    of (tick, note type, strike type) tuples and the length of the group in
+    ticks, or the exception that walking it raised.
+    """
+    start = builder.tick
+    try:
+        builder.add_bar_group(group)
+    except Exception as e:
+        return e, None
+    events = builder.build()
+    note_types = events.note_types
+    strike_types = events.strike_types
+    return ([(tick, note_types[note_type_code],
+              strike_types[strike_type_code])
+             for tick, note_type_code, strike_type_code in izip(
+                 events.ticks, events.note_type_codes,
+                 events.strike_type_codes)],
+            builder.tick - start)
+
+
+def _locate(builder, group, start, note):
+    """
+    Returns the row and column of the tab that the note of the group was
+    read from, going by the timing of the reference builder.
+    """
+    tick, note_type, strike_type = note
+    column = builder.column_at(group, tick - start)
+    if column is None:
+        return None, None
+    for d, row in enumerate(group.rows):
+        if group.note_types[d] == note_type and column < len(row) and \
+                row[column] == strike_type:
+            return group.note_row + d, column
+    if note_type in group.note_types:
+        return group.note_row + group.note_types.index(note_type), column
+    return None, column
@@ -0,0 +1,310 @@
+"""
+document.py: An editable tab that is re-parsed incrementally.
+
+Editors that convert a tab after every keystroke should not re-parse the whole
+tab each time.  TabDocument keeps the lexed groups of bars together with the
+notes of every group, timed from the start of the group.  An edit re-lexes
+from the first group that read one of the edited lines until the lexer lines
+up with an unchanged group again, and only the new groups are walked and
+encoded as midi.  The midi events of every group are also timed from its
+start, so groups that only move in time are not encoded again.  The tick
+offsets of the groups, and the notes of the tab, are kept up to the first
+edited group and only worked out again from there.
+"""
+from array import array
+from bisect import bisect_right
+from itertools import islice, izip
+
+from tabtomidi.drumtabs import midi_notes
+from tabtomidi.events import MAX_GROOVES, NoteEvents, NoteEventsBuilder
+from tabtomidi.exceptions import TabParsingException, \
+    UnmappableNoteNamesException
+from tabtomidi.lexer import BarGroupError, calculate_divisions_in_bar, \
+    iter_bar_groups, iter_normalized_lines, normalize_lines
+from tabtomidi.notemap import compile_note_map
+from tabtomidi.smf import DrumTrackWriter, encode_chunk
+
+
+class TabDocument(object):
+    """
+    A tab that takes line-range edits and produces the same notes and midi
+    as a Tab constructed from its current text.
+
+    Edits never raise parsing errors, since a tab is usually invalid while it
+    is being typed.  Groups of bars that cannot be lexed are listed by errors
+    and the first of them is raised by note_events and to_midi_bytes.
+    """
+
+    def __init__(self, tabtext=u"", note_name_to_number_map=None,
+                 bpm=100, strike_volume=70, accent_volume=110,
+                 ghost_note_volume=50):
+        """
+        Constructs a TabDocument from a string representing a tab.  The
+        options mean the same as for Tab.
+        """
+        self._note_map = compile_note_map(note_name_to_number_map,
+                                          strike_volume, accent_volume,
+                                          ghost_note_volume)
+        self._bpm = bpm
+        self._lines = normalize_lines(tabtext)
+        self._groups = list(iter_bar_groups(self._lines, errors=True))
+        self._dependency_ends = [group.dependency_end
+                                 for group in self._groups]
+        # The notes of every group, timed from the start of the group, and
+        # the length of the group in ticks.  None until the group has been
+        # walked.
+        self._group_events = [None] * len(self._groups)
+        # The TrackChunk of every group's midi events, timed from the start
+        # of the group.  None until the group has been encoded, or if it has
+        # no notes.
+        self._midi_chunks = [None] * len(self._groups)
+        # The tick offset of every group that has been walked since the
+        # groups before it last changed, and of the end of the last of them.
+        self._offsets = [0]
+        # The index of the first note of the same groups in _kept_events,
+        # the notes of the tab that note_events returned last.
+        self._note_starts = [0]
+        self._kept_events = None
+        self.divisions_in_bar = None
+        self._builder = None
+        self._note_types = ()
+        self._strike_types = ()
+        self._note_events = None
+        self._midi = None
+        self._update_divisions_in_bar()
+
+    @property
+    def lines(self):
+        """The normalized lines of the tab."""
+        return tuple(self._lines)
+
+    @property
+    def text(self):
+        """The normalized text of the tab."""
+        return u"\n".join(self._lines)
+
+    @property
+    def bar_groups(self):
+        """The groups of bars that could be lexed, in order."""
+        return tuple(group for group in self._groups
+                     if not isinstance(group, BarGroupError))
+
+    @property
+    def errors(self):
+        """The TabParsingExceptions of the groups that could not be lexed."""
+        return [group.error for group in self._groups
+                if isinstance(group, BarGroupError)]
+
+    @property
+    def note_types(self):
+        """The set of all note types."""
+        types = set()
+        for group in self.bar_groups:
+            types.update(group.note_types)
+        return types
+
+    def replace_lines(self, start, end, new_lines):
+        """
+        Replaces lines start to end (exclusive) with new_lines, which may
+        be any iterable of strings, and re-parses the groups of bars that
+        depended on the replaced lines.
+        """
+        if not 0 <= start <= end <= len(self._lines):
+            raise IndexError("Line range %d:%d is out of range." %
+                             (start, end))
+        new_lines = list(iter_normalized_lines(new_lines))
+        shift = len(new_lines) - (end - start)
+        self._lines[start:end] = new_lines
+        groups = self._groups
+        # The first group that read one of the replaced lines, or the line
+        # after them, which tells where the group ends.
+        first = bisect_right(self._dependency_ends, start)
+        if first < len(groups):
+            relex_row = min(start, groups[first].top_row)
+        else:
+            relex_row = start
+        # Groups below the replaced lines only read unchanged lines, so the
+        # lexer agrees with them as soon as it starts a group on the same
+        # line.
+        reused = first
+        while reused < len(groups) and groups[reused].top_row < end:
+            reused += 1
+        relexed = []
+        for group in iter_bar_groups(islice(self._lines, relex_row, None),
+                                     relex_row, errors=True):
+            while reused < len(groups) and \
+                    groups[reused].top_row + shift < group.top_row:
+                reused += 1
+            if reused < len(groups) and \
+                    groups[reused].top_row + shift == group.top_row:
+                break
+            relexed.append(group)
+        else:
+            reused = len(groups)
+        self._groups = groups[:first] + relexed + \
+            [group.shifted(shift) for group in groups[reused:]]
+        self._dependency_ends = [group.dependency_end
+                                 for group in self._groups]
+        self._group_events = self._group_events[:first] + \
+            [None] * len(relexed) + self._group_events[reused:]
+        self._midi_chunks = self._midi_chunks[:first] + \
+            [None] * len(relexed) + self._midi_chunks[reused:]
+        # The groups before the first one that was relexed start where they
+        # did, and so does that one.
+        del self._offsets[first + 1:]
+        del self._note_starts[first + 1:]
+        self._note_events = None
+        self._midi = None
+        if first == 0:
+            self._update_divisions_in_bar()
+
+    def insert_lines(self, row, new_lines):
+        """Inserts new_lines before the given row."""
+        self.replace_lines(row, row, new_lines)
+
+    def delete_lines(self, start, end):
+        """Deletes lines start to end (exclusive)."""
+        self.replace_lines(start, end, [])
+
+    def _update_divisions_in_bar(self):
+        """
+        Recalculates the divisions in bar from the first group, like Tab, and
+        forgets the notes of every group if they changed.
+        """
+        divisions_in_bar = None
+        if self._groups and not isinstance(self._groups[0], BarGroupError):
+            try:
+                divisions_in_bar = calculate_divisions_in_bar(self._groups[0])
+            except TabParsingException:
+                pass
+        if divisions_in_bar != self.divisions_in_bar:
+            self.divisions_in_bar = divisions_in_bar
+            self._forget_notes()
+
+    def _forget_notes(self):
+        """Forgets the notes and midi events of every group."""
+        self._builder = None
+        self._group_events = [None] * len(self._groups)
+        self._midi_chunks = [None] * len(self._groups)
+        self._offsets = [0]
+        self._note_starts = [0]
+        self._note_events = None
+
+    def _check_parsed(self):
+        """Raises the first problem that keeps the tab from being converted."""
+        if not self._groups:
+            raise TabParsingException("Could not find any bars in input text.")
+        for group in self._groups:
+            if isinstance(group, BarGroupError):
+                raise group.error
+        if self.divisions_in_bar is None:
+            # Let the first group raise the error with its position.
+            calculate_divisions_in_bar(self._groups[0])
+
+    def _walk(self):
+        """
+        Walks the groups of bars that changed and returns the tick offset of
+        every group and of the end of the tab.
+        """
+        self._check_parsed()
+        if self._builder is None:
+            self._builder = NoteEventsBuilder(self.divisions_in_bar)
+        builder = self._builder
+        offsets = self._offsets
+        # Groups that changed only come after the offsets that are known.
+        for i in xrange(len(offsets) - 1, len(self._groups)):
+            walked = self._group_events[i]
+            if walked is None:
+                builder.tick = 0
+                builder.add_bar_group(self._groups[i])
+                events = builder.build()
+                walked = self._group_events[i] = (events, builder.tick)
+                # The lookup tables only grow, so the latest are complete.
+                self._note_types = events.note_types
+                self._strike_types = events.strike_types
+                # Like a stream, an edited document is walked without end.
+                if len(builder.grooves) >= MAX_GROOVES:
+                    builder.grooves.clear()
+            offsets.append(offsets[-1] + walked[1])
+        return offsets
+
+    def note_events(self):
+        """
+        Returns the notes of the tab, in order, as a NoteEvents object.  Only
+        the groups of bars that changed since the last call are walked, and
+        the notes of the groups before them are copied from the last call.
+        """
+        if self._note_events is not None:
+            return self._note_events
+        offsets = self._walk()
+        note_starts = self._note_starts
+        first = len(note_starts) - 1
+        if first:
+            # Copy the notes that are kept, as the NoteEvents object that was
+            # returned last may still be in use.
+            kept = self._kept_events
+            ticks = kept.ticks[:note_starts[first]]
+            note_type_codes = kept.note_type_codes[:note_starts[first]]
+            strike_type_codes = kept.strike_type_codes[:note_starts[first]]
+        else:
+            ticks = array('l')
+            note_type_codes = array('H')
+            strike_type_codes = array('H')
+        for i in xrange(first, len(self._groups)):
+            events = self._group_events[i][0]
+            offset = offsets[i]
+            if offset:
+                ticks.extend([tick + offset for tick in events.ticks])
+            else:
+                ticks.extend(events.ticks)
+            note_type_codes.extend(events.note_type_codes)
+            strike_type_codes.extend(events.strike_type_codes)
+            note_starts.append(len(ticks))
+        self._note_events = self._kept_events = NoteEvents(
+            ticks, note_type_codes, strike_type_codes, self._note_types,
+            self._strike_types, self._builder.ticks_per_beat)
+        return self._note_events
+
+    def to_midi_bytes(self):
+        """
+        Returns the midi file generated from the tab as a string.  The midi
+        events of every group of bars are kept and only encoded again if the
+        group changed.
+        """
+        if self._midi is not None:
+            return self._midi
+        offsets = self._walk()
+        self._note_map.check(self.note_types)
+        try:
+            self._note_map.tables(self._note_types, self._strike_types)
+        except UnmappableNoteNamesException:
+            # Note names that have been edited out of the tab are still in
+            # the lookup tables, so walk every group again with new tables.
+            self._forget_notes()
+            offsets = self._walk()
+        writer = DrumTrackWriter(bpm=self._bpm,
+                                 ticks_per_beat=self._builder.ticks_per_beat)
+        duration = self._builder.step_ticks
+        chunks = []
+        for i, ((events, _), offset) in enumerate(izip(self._group_events,
+                                                       offsets)):
+            if not len(events):
+                continue
+            chunk = self._midi_chunks[i]
+            if chunk is None:
+                chunk = self._midi_chunks[i] = encode_chunk(
+                    midi_notes(events, self._note_map), duration)
+            chunks.append((offset, chunk))
+        if duration > 0 and all(
+                previous_offset + previous.last_tick <=
+                offset + chunk.first_tick
+                for (previous_offset, previous), (offset, chunk)
+                in izip(chunks, chunks[1:])):
+            for offset, chunk in chunks:
+                writer.add_chunk(chunk, offset)
+        else:
+            # Notes of neighbouring groups overlap, so encode them together.
+            writer.add_notes(midi_notes(self.note_events(), self._note_map),
+                             duration)
+        self._midi = writer.to_bytes()
+        return self._midi
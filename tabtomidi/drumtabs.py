@@ -1,86 +1,228 @@
-import string
-import re
-from midiutil.MidiFile import MIDIFile
-from tabtomidi.notenames import DEFAULT_NOTE_NAME_TO_NUMBER_MAP, \
-    GM_SPEC_NOTE_NAME_TO_NUMBER_MAP
-
-
-class TabParsingException(Exception):
-    """Base class for all exceptions due to unparsable tabs."""
-
-    def __init__(self, message, row=None, column=None):
-        Exception.__init__(self, message)
-        self.row = row
-        self.column = column
-
-
-class UnmappableNoteNamesException(TabParsingException):
-    """
-    Raised when the parser cannot map one or more note names to midi notes.
-    The note_names attribute provides the set of unmappable note names.
-    """
-
-    def __init__(self, note_names):
-        TabParsingException.__init__(self,
-            "Some note names could not be mapped to midi notes: " + str(note_names))
-        self.note_names = note_names
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import islice, izip
+from tabtomidi.engines import REFERENCE_ENGINE, get_engine
+from tabtomidi.events import MIN_DEDUP_RATIO, bar_divisions, \
+    division_ticks, ticks_per_beat_for
+from tabtomidi.exceptions import TabParsingException, \
+    UnmappableNoteNamesException
+from tabtomidi.lexer import TextStore, calculate_divisions_in_bar, \
+    has_bar_rows, iter_bar_groups, lex
+from tabtomidi.limits import NO_LIMITS
+from tabtomidi.notemap import compile_note_map, strike_type_volume_map
+from tabtomidi.notenames import DEFAULT_NOTE_NAME_TO_NUMBER_MAP
+from tabtomidi.profiling import NO_STATS
+from tabtomidi.smf import DrumTrackWriter, TrackTemplate, encode_chunk
 
 
 class Tab(object):
     """
     Provides information about drum tabs and generates midi files from them.
+
+    Tabs can be shared between threads.  What is computed on first use, from
+    the lines of the tab to its notes, is computed once, by the first thread
+    that needs it, while the others wait for it.  The divisions_in_bar and
+    note_name_to_number_map setters discard what was computed and should
+    not be used on shared tabs.
     """
 
     def __init__(self, tabtext,
                  note_name_to_number_map=None,
                  bpm=100, strike_volume=70, accent_volume=110,
-                 ghost_note_volume=50):
-        """Constructs a Tab object from a string representing a tab."""
-        # Replace pipe character loookalikes with proper pipe characters
-        # See http://stackoverflow.com/questions/10572627/
-        pipe_lookalikes = u'\u007c\u00a6\u2758\uffc5\uffe4'
-        for lookalike in pipe_lookalikes:
-            tabtext = tabtext.replace(lookalike, '|')
-        self._tab = [l.rstrip() for l in tabtext.splitlines()]
+                 ghost_note_volume=50, ticks_per_beat=None,
+                 per_bar_divisions=False, engine=REFERENCE_ENGINE,
+                 stats=None, limits=None):
+        """
+        Constructs a Tab object from a string representing a tab.  If stats
+        is a ConversionStats object, the phases of the conversion are
+        recorded in it.
+
+        Notes are timed in midi ticks.  ticks_per_beat is chosen so that
+        every bar divides into a whole number of ticks, preferring 128, unless
+        it is given.  By default, all bars are assumed to have as many
+        divisions as the first one; if per_bar_divisions is True, the
+        divisions of every bar are counted separately.
+
+        engine names the engine in tabtomidi.engines that walks the notes.
+        limits is a ResourceLimits object that bounds the work of converting
+        the tab, as described in tabtomidi.limits; by default, there are no
+        limits.
+
+        Construction only checks the length of the text and that it has a
+        row with a vertical line.  The text is normalized and lexed, and the
+        divisions in a bar calculated, when they are first needed, so errors
+        in the groups of bars are raised by the first method that needs them.
+        """
+        self._limits = limits if limits is not None else NO_LIMITS
+        self._limits.check_input(tabtext)
+        if not has_bar_rows(tabtext):
+            raise TabParsingException("Could not find any bars in input text.")
+        # Guards what is computed on first use.  Computing it can need other
+        # lazily computed values, so the lock is reentrant.
+        self._lock = threading.RLock()
+        self.stats = stats
+        self._stats = stats if stats is not None else NO_STATS
+        self._tabtext = tabtext
+        self._lines = None
+        self._lexed_bar_groups = None
+        self._divisions_in_bar = None
+        self._ticks_per_beat = ticks_per_beat
+        self._per_bar_divisions = per_bar_divisions
+        self._engine = get_engine(engine)
+        self._chosen_ticks_per_beat = None
+        self._group_ticks = None
         self._bpm = bpm
         self._strike_volume = strike_volume
         self._accent_volume = accent_volume
         self._ghost_note_volume = ghost_note_volume
-        # perform pre-processing to remove count rows:
-        for r in range(len(self._tab)):
-            if self._is_count_row(r):
-                self._tab[r] = ""
-        self._bar_rows = self._calculate_bar_rows()
-        if not self._bar_rows:
-            raise TabParsingException("Could not find any bars in input text.")
         self._note_types = None
         self._strike_types = None
+        self._note_events = {}
         if note_name_to_number_map == None:
             self.note_name_to_number_map = DEFAULT_NOTE_NAME_TO_NUMBER_MAP
         else:
             self.note_name_to_number_map = note_name_to_number_map
-        # Assuming that all columns notes have the same duration, i.e. each
-        # column represents a 16th note.
-        # Some tabs have extra characters between the bars, i.e. 33 instead of
-        # 32, so simply counting the number of characters between the bars will
-        # not always work.
-        # For now, use the number of divisions in the first bar to calculate
-        # the note duration.  This should probably be changed to find the mode
-        # of the set of divisions in each bar.
-        self.divisions_in_bar = self._calculate_divisions_in_bar(
-            self._bar_rows[0])
+
+    @property
+    def _tab(self):
+        """The normalized lines of the tab, as a TextStore."""
+        if self._lines is None:
+            with self._lock:
+                if self._lines is None:
+                    lines = TextStore(self._tabtext, self._stats)
+                    row, width = lines.widest_line()
+                    self._limits.check('max_line_width', width, row)
+                    self._lines = lines
+                    self._tabtext = None
+                    self._stats.count('lines', len(lines))
+        return self._lines
+
+    @property
+    def _bar_groups(self):
+        """The BarGroup of every group of bars."""
+        if self._lexed_bar_groups is None:
+            with self._lock:
+                if self._lexed_bar_groups is None:
+                    self._lexed_bar_groups = self._lex()
+        return self._lexed_bar_groups
+
+    def _lex(self):
+        """Returns the BarGroup of every group of bars of the lines."""
+        lines = self._tab
+        max_bar_groups = self._limits.max_bar_groups
+        with self._stats.phase('bar_groups'):
+            if max_bar_groups is None:
+                bar_groups = lex(lines)
+            else:
+                # Lexing stops at the first group past the limit.
+                bar_groups = tuple(islice(iter_bar_groups(lines),
+                                          max_bar_groups + 1))
+                if len(bar_groups) > max_bar_groups:
+                    self._limits.check('max_bar_groups', len(bar_groups),
+                                       bar_groups[-1].top_row)
+        self._stats.count('bar_groups', len(bar_groups))
+        self._stats.count('note_rows', sum(
+            len(group.rows) for group in bar_groups))
+        return bar_groups
+
+    @property
+    def _bar_rows(self):
+        """The top row of every group of bars."""
+        return [group.top_row for group in self._bar_groups]
+
+    def __get_divisions_in_bar(self):
+        """Accessor for divisions_in_bar property."""
+        if self._divisions_in_bar is None:
+            with self._lock:
+                if self._divisions_in_bar is None:
+                    self._divisions_in_bar = self._first_bar_divisions()
+        return self._divisions_in_bar
+
+    def _first_bar_divisions(self):
+        """Returns the number of divisions in the first bar."""
+        # Assuming that all columns notes have the same duration, i.e.
+        # each column represents a 16th note.
+        # Some tabs have extra characters between the bars, i.e. 33
+        # instead of 32, so simply counting the number of characters
+        # between the bars will not always work.
+        # For now, use the number of divisions in the first bar to
+        # calculate the note duration.  This should probably be changed
+        # to find the mode of the set of divisions in each bar.
+        bar_groups = self._bar_groups
+        with self._stats.phase('divisions_in_bar'):
+            return calculate_divisions_in_bar(bar_groups[0])
+
+    def __set_divisions_in_bar(self, divisions_in_bar):
+        """Setter for divisions_in_bar property."""
+        with self._lock:
+            self._divisions_in_bar = divisions_in_bar
+            self._chosen_ticks_per_beat = None
+            self._group_ticks = None
+            self._note_events = {}
+
+    divisions_in_bar = property(
+        __get_divisions_in_bar, __set_divisions_in_bar,
+        doc="""Get or set the number of divisions in a bar.""")
+
+    @property
+    def ticks_per_beat(self):
+        """The number of midi ticks in a quarter note."""
+        if self._chosen_ticks_per_beat is None:
+            with self._lock:
+                if self._chosen_ticks_per_beat is None:
+                    self._chosen_ticks_per_beat = self._choose_ticks_per_beat()
+        return self._chosen_ticks_per_beat
+
+    def _choose_ticks_per_beat(self):
+        """Returns the ticks per beat that suit the divisions of the bars."""
+        divisions = set([self.divisions_in_bar])
+        if self._per_bar_divisions:
+            for group in self._bar_groups:
+                divisions.update(bar_divisions(group))
+        if self._ticks_per_beat is None:
+            return ticks_per_beat_for(divisions)
+        for count in divisions:
+            if count:
+                division_ticks(count, self._ticks_per_beat)
+        return self._ticks_per_beat
+
+    @property
+    def _bar_group_ticks(self):
+        """
+        The tick at which every group of bars starts, including its repeats,
+        followed by the tick at which the tab ends.  The ticks are counted
+        without parsing the notes.
+        """
+        if self._group_ticks is None:
+            with self._lock:
+                if self._group_ticks is None:
+                    builder = self._new_builder()
+                    group_ticks = array('l', [0])
+                    tick = 0
+                    for group in self._bar_groups:
+                        tick += builder.count_ticks(group)
+                        group_ticks.append(tick)
+                    self._group_ticks = group_ticks
+        return self._group_ticks
 
     # TODO: add indirect accessors and setters before allowing this class to be
     # subclassed.
     def __set_note_name_to_number_map(self, note_name_to_number_map):
         """Setter for note_name_to_number_map property."""
-        self.__note_name_to_number_map = \
-            dict((note, note_name_to_number_map[note]) for note in
-            note_name_to_number_map.keys() if note in self.note_types)
+        with self._lock:
+            self._unfiltered_note_name_to_number_map = note_name_to_number_map
+            self._compiled_note_map = None
 
     def __get_note_name_to_number_map(self):
-        """Accessor for note_name_to_number_map property."""
-        return self.__note_name_to_number_map
+        """
+        Accessor for note_name_to_number_map property.  The map is filtered
+        on every access rather than kept, since converting the tab only
+        needs its CompiledNoteMap, which is shared with other tabs.
+        """
+        note_name_to_number_map = self._unfiltered_note_name_to_number_map
+        return dict((note, note_name_to_number_map[note]) for note in
+                    note_name_to_number_map.keys() if note in self.note_types)
 
     note_name_to_number_map = property(
         __get_note_name_to_number_map, __set_note_name_to_number_map,
@@ -89,25 +231,26 @@ class Tab(object):
     @property
     def note_types(self):
         """The set of all note types."""
-        if self._note_types == None:
-            self._note_types = self._find_all_note_types()
+        if self._note_types is None:
+            with self._lock:
+                if self._note_types is None:
+                    self._note_types = self._find_all_note_types()
         return self._note_types
 
     @property
     def strike_types(self):
         """The set of all strike types."""
-        if self._strike_types == None:
-            self._strike_types = self._find_all_strike_types()
+        if self._strike_types is None:
+            with self._lock:
+                if self._strike_types is None:
+                    self._strike_types = self._find_all_strike_types()
         return self._strike_types
 
     @property
     def strike_type_volume_map(self):
-        return {
-            'O' : self._accent_volume,
-            'g' : self._ghost_note_volume,
-            'r' : self._strike_volume,
-            'o' : self._strike_volume,
-        }
+        return strike_type_volume_map(self._strike_volume,
+                                      self._accent_volume,
+                                      self._ghost_note_volume)
 
     @property
     def unknown_strike_types(self):
@@ -125,265 +268,306 @@ class Tab(object):
         else:
             return self._strike_volume
 
-    def write_midi_file(self, file_object):
-        """Writes midi generated from this tab to the given file object."""
-        # Throw an exception if there are note names for which we can't
-        # determine the proper note numbers.
-        unmappable_note_names = self.note_types.difference(
-            self.note_name_to_number_map.keys())
-        if unmappable_note_names:
-            raise UnmappableNoteNamesException(unmappable_note_names)
+    def write_midi_file(self, file_object, use_midiutil=False):
+        """
+        Writes midi generated from this tab to the given file object.  The
+        file is encoded by tabtomidi.smf unless use_midiutil is True.
+        """
+        if use_midiutil:
+            self._write_midiutil_file(file_object)
+        else:
+            file_object.write(self.to_midi_bytes())
+
+    def to_midi_bytes(self):
+        """Returns the midi file generated from this tab as a string."""
+        self._check_parsed()
+        self._check_note_names()
+        # Walk the notes and compile the tables of the note map first, so
+        # that encode_midi only times the encoding.
+        events = self.note_events()
+        self._note_map().tables(events.note_types, events.strike_types)
+        with self._stats.phase('encode_midi'):
+            writer = DrumTrackWriter(bpm=self._bpm,
+                                     ticks_per_beat=events.ticks_per_beat)
+            duration = division_ticks(self.divisions_in_bar,
+                                      events.ticks_per_beat)
+            chunks = run_chunks(events, self._note_map(), duration)
+            if chunks is not None:
+                for offset, chunk in chunks:
+                    writer.add_chunk(chunk, offset)
+            else:
+                writer.add_notes(self._midi_notes(), duration)
+            midi = writer.to_bytes()
+        self._stats.count('midi_bytes', len(midi))
+        return midi
+
+    def render(self, bpm=None, strike_volume=None, accent_volume=None,
+               ghost_note_volume=None, note_name_to_number_map=None):
+        """
+        Returns the midi file of this tab with another tempo, other volumes
+        or another note name to number map, as a string.  The options mean
+        the same as for the constructor and default to the values of this
+        tab.  The notes are walked once for all renders.
+        """
+        return self.render_variants([dict(
+            bpm=bpm, strike_volume=strike_volume, accent_volume=accent_volume,
+            ghost_note_volume=ghost_note_volume,
+            note_name_to_number_map=note_name_to_number_map)])[0]
+
+    def render_variants(self, variants):
+        """
+        Returns a list of midi files, one for every dict of render options
+        in variants.  The notes are encoded once for every note name to
+        number map; the variants of each only differ in the tempo and
+        velocity bytes, which are patched in.
+        """
+        self._check_parsed()
+        variants = [self._variant_note_map(**variant) for variant in variants]
+        events = self.note_events()
+        duration = division_ticks(self.divisions_in_bar,
+                                  events.ticks_per_beat)
+        templates = {}
+        midi_files = []
+        for bpm, note_map in variants:
+            width, pitches, velocities = note_map.tables(events.note_types,
+                                                         events.strike_types)
+            if len(events.strike_types) > 256:
+                # The strike type codes do not fit in the velocity bytes.
+                writer = DrumTrackWriter(bpm=bpm,
+                                         ticks_per_beat=events.ticks_per_beat)
+                writer.add_notes(midi_notes(events, note_map), duration)
+                midi_files.append(writer.to_bytes())
+                continue
+            key = pitches.tostring()
+            template = templates.get(key)
+            if template is None:
+                template = templates[key] = TrackTemplate(
+                    ((tick, pitches[note_type_code * width + strike_type_code],
+                      strike_type_code)
+                     for tick, note_type_code, strike_type_code in izip(
+                         events.ticks, events.note_type_codes,
+                         events.strike_type_codes)),
+                    duration, events.ticks_per_beat)
+            midi_files.append(template.render(bpm, velocities))
+        return midi_files
+
+    def render_range(self, start, end, loops=1):
+        """
+        Returns the midi file of the groups of bars from start up to, but not
+        including, end, played loops times from the first tick, as a string.
+        start and end count groups of bars like slice indices.  The range is
+        found from the ticks of the groups, so only the groups in it are
+        walked, unless the notes of the whole tab have been walked already.
+        """
+        if loops < 1:
+            raise ValueError("A range has to be played at least once.")
+        self._check_parsed()
+        self._check_note_names()
+        bar_groups = self._bar_groups
+        start, end, _ = slice(start, end).indices(len(bar_groups))
+        end = max(start, end)
+        group_ticks = self._bar_group_ticks
+        first_tick = group_ticks[start]
+        events = self._note_events.get(False)
+        if events is not None:
+            ticks = events.ticks
+            events = events[bisect_left(ticks, first_tick):
+                            bisect_left(ticks, group_ticks[end])]
+        else:
+            builder = self._new_builder()
+            builder.tick = first_tick
+            for group in bar_groups[start:end]:
+                builder.add_bar_group(group)
+            events = builder.build()
+        notes = list(midi_notes(events, self._note_map()))
+        length = group_ticks[end] - first_tick
+        writer = DrumTrackWriter(bpm=self._bpm,
+                                 ticks_per_beat=events.ticks_per_beat)
+        duration = division_ticks(self.divisions_in_bar,
+                                  events.ticks_per_beat)
+        for loop in xrange(loops):
+            offset = loop * length - first_tick
+            writer.add_notes(((tick + offset, pitch, volume)
+                              for tick, pitch, volume in notes), duration)
+        return writer.to_bytes()
+
+    def _variant_note_map(self, bpm=None, strike_volume=None,
+                          accent_volume=None, ghost_note_volume=None,
+                          note_name_to_number_map=None):
+        """
+        Returns the tempo and the CompiledNoteMap of a variant, filling in
+        the options of this tab that the variant leaves out.  Raises
+        UnmappableNoteNamesException if a note name of the tab is not in the
+        note name to number map.
+        """
+        if note_name_to_number_map is None:
+            note_name_to_number_map = self._unfiltered_note_name_to_number_map
+        note_map = compile_note_map(
+            note_name_to_number_map,
+            self._strike_volume if strike_volume is None else strike_volume,
+            self._accent_volume if accent_volume is None else accent_volume,
+            self._ghost_note_volume if ghost_note_volume is None
+            else ghost_note_volume)
+        note_map.check(self.note_types)
+        return self._bpm if bpm is None else bpm, note_map
+
+    def _midi_notes(self):
+        """Yields a (tick, pitch, volume) tuple for every note in order."""
+        return midi_notes(self.note_events(), self._note_map())
+
+    def _note_map(self):
+        """
+        Returns the CompiledNoteMap for the note name to number map and the
+        volumes of this tab.
+        """
+        note_map = self._compiled_note_map
+        if note_map is None:
+            note_map = self._compiled_note_map = compile_note_map(
+                self._unfiltered_note_name_to_number_map, self._strike_volume,
+                self._accent_volume, self._ghost_note_volume)
+        return note_map
+
+    def _check_parsed(self):
+        """
+        Throws the first exception that keeps the groups of bars from being
+        parsed.
+        """
+        self.divisions_in_bar
+
+    def _check_note_names(self):
+        """
+        Throws an exception if there are note names for which we can't
+        determine the proper note numbers.
+        """
+        self._note_map().check(self.note_types)
 
+    def _write_midiutil_file(self, file_object):
+        """Writes midi generated from this tab using midiutil."""
+        from midiutil.MidiFile import MIDIFile
+        self._check_parsed()
+        self._check_note_names()
         midifile = MIDIFile(1)
         track = 0
         channel = 9
-        duration = round(4.0 / self.divisions_in_bar, 10)
-        # 4.0 is because midiutil's  unit of time is the quarter note.
+        # midiutil's unit of time is the quarter note.
+        ticks_per_beat = float(self.ticks_per_beat)
+        duration = division_ticks(self.divisions_in_bar,
+                                  self.ticks_per_beat) / ticks_per_beat
         midifile.addTrackName(track, 0, "")
         midifile.addTempo(track, 0, self._bpm)
-        for note in self.walk_notes():
-            strike_type = note['strike_type']
-            volume = self._volume_for_strke_type(strike_type)
-            if strike_type == 'r':
-                pitch = GM_SPEC_NOTE_NAME_TO_NUMBER_MAP['Sticks']
-            else:
-                pitch = self.note_name_to_number_map[note['note_type']]
-            midifile.addNote(track, channel, pitch, note['time'], duration,
-                             volume)
+        for tick, pitch, volume in self._midi_notes():
+            midifile.addNote(track, channel, pitch, tick / ticks_per_beat,
+                             duration, volume)
         midifile.writeFile(file_object)
 
     def walk_notes(self, ignore_repetition=False):
         """A generator that yields each note in order."""
-        tab = self._tab
-        time = 0.0
-        duration = round(4.0 / self.divisions_in_bar, 10)
-        # 4.0 is because midiutil's  unit of time is the quarter note.
-
-        for r in self._bar_rows:
-            # Determine whether the first row contains notes or repetition
-            # information.
-            if self._contains_repetitions(r):
-                has_repetitions = True
-                repetition_info = r
-                r += 1
-            else:
-                has_repetitions = False
-            r = self._find_first_note_row_for_bar(r)
-            # Determine which drums are present in this group of bars.
-            note_types = self._find_note_types_for_row(r)
-            # The following assumes that there are as many entries in
-            # note_types as there are vertical lines in the bar.
-            c = self._find_vertical_line(start_row=r)
-            # Support bars that leave out the leftmost pipe character.
-            if c - (self.divisions_in_bar + 1) > 0:
-                c -= (self.divisions_in_bar + 1)
-            while c < len(tab[r]) - 1:
-                next_vertical_line = self._find_vertical_line(c+1, r)
-                if next_vertical_line:
-                    num_cols_to_parse = next_vertical_line - c - 1
-                else:
-                    num_cols_to_parse = 0
-                if has_repetitions and not ignore_repetition:
-                    # Determine the length of the repeated section.
-                    repetition_cols = len(tab[repetition_info][c+1:].split('|', 1)[0])
-                    if repetition_cols != 0:
-                        num_cols_to_parse = repetition_cols
-                    # Determine how many times the section is repeated.
-                    repetitions = self._calculate_repetitions(repetition_info, c)
-                else:
-                    repetitions = 1
-                for _ in xrange(repetitions):
-                    for t in xrange(1, num_cols_to_parse+1):
-                        # For every time in this bar or repeated section:
-                        if not self._is_vertical_line(c+t, r):
-                            for d in xrange(0, len(note_types)):
-                                # For every drum in this bar:
-                                if c + t >= len(tab[r + d]) and \
-                                    tab[r + d].strip()[-1] == '|':
-                                    # This is to handle cases where the last
-                                    # row of a group of bars has fewer columns
-                                    continue
-                                strike_type = tab[r + d][c + t]
-                                if strike_type in '-|':
-                                    continue
-                                else:
-                                    yield { 'strike_type' : strike_type,
-                                            'note_type' : note_types[d],
-                                            'time' : time, }
-                            time += duration
-                c += num_cols_to_parse + 1
-                if not self._is_vertical_line(c, r):
-                    break
-
-    def _calculate_bar_rows(self):
-        """Calculates which rows of the tab text are the top rows of bars."""
-        tab = self._tab
-        bar_rows = []
-        row = 0
-        while row < len(tab):
-            if '|' in tab[row]:
-                bar_rows.append(row)
-                while row < len(tab) and ('|' in tab[row] or
-                    self._contains_triplets(row)):
-                    row += 1
-            else:
-                row += 1
-        return bar_rows
+        for note in self.note_events(ignore_repetition):
+            yield note
 
-    def _find_first_note_row_for_bar(self, row):
+    def note_events(self, ignore_repetition=False):
         """
-        Find the first row of the bar starting on or after the given row that
-        contains notes (as opposed to repetition information, comments, or
-        triplet marks.
+        Returns the notes of this tab, in order, as a NoteEvents object that
+        stores them in compact arrays instead of one dict per note.
         """
-        r = row
-        while r < len(self._tab) and (self._contains_repetitions(r) or \
-            self._contains_triplets(r)):
-            r += 1
-        if r >= len(self._tab) or not self._find_vertical_line(start_row=r):
-            raise TabParsingException("Bar without notes")
-        return r
+        events = self._note_events.get(ignore_repetition)
+        if events is None:
+            with self._lock:
+                events = self._note_events.get(ignore_repetition)
+                if events is None:
+                    events = self._build_note_events(ignore_repetition)
+                    self._note_events[ignore_repetition] = events
+        return events
+
+    def _build_note_events(self, ignore_repetition):
+        """Walks the bar groups and collects their notes in a NoteEvents."""
+        with self._stats.phase('walk_notes'):
+            builder = self._new_builder(ignore_repetition)
+            for group in self._bar_groups:
+                builder.add_bar_group(group)
+            events = builder.build()
+        self._stats.count('columns_parsed', builder.columns_parsed)
+        self._stats.count('sections', builder.grooves.lookups)
+        self._stats.count('sections_reused', builder.grooves.hits)
+        self._stats.count('repetitions_expanded',
+                          builder.repetitions_expanded)
+        self._stats.count('steps', builder.steps)
+        self._stats.count('notes', len(events))
+        return events
+
+    def _new_builder(self, ignore_repetition=False):
+        """Returns a builder of the engine of this tab for walking notes."""
+        return self._engine(self.divisions_in_bar, ignore_repetition,
+                            self.ticks_per_beat, self._per_bar_divisions,
+                            self._limits)
 
     def _find_all_note_types(self):
         """Returns the set of note types."""
-        types = set()
-        for row in self._bar_rows:
-            note_row = self._find_first_note_row_for_bar(row)
-            types.update(self._find_note_types_for_row(note_row))
+        with self._stats.phase('note_types'):
+            types = set()
+            for group in self._bar_groups:
+                types.update(group.note_types)
         return types
 
-    def _find_note_types_for_row(self, row):
-        """
-        Returns an ordered list of the note types corresponding to the bar
-        whose top note row is the given row.
-        """
-        tab = self._tab
-        types = []
-        while row < len(tab) and '|' in tab[row]:
-            if not self._contains_repetitions(row):
-                note_type = self._find_note_type(row)
-                if note_type:
-                    types.append(note_type)
-            row += 1
-        return types
-
-    def _find_note_type(self, row):
-        """Finds the note type for a given row."""
-        tab = self._tab
-        note_type = tab[row].partition('|')[0]
-        note_type = note_type.strip().split(' ')[0]
-        return note_type.rstrip(' :-')
-
     def _find_all_strike_types(self):
         """Returns the set of strike types."""
-        types = set()
-        for note in self.walk_notes(ignore_repetition=True):
-            types.update(note['strike_type'])
-        return types
-
-    def _find_vertical_line(self, start_column=0, start_row=0):
-        """
-        Returns the first column on or after start_column that is a vertical
-        line / bar division.  If no column is found, returns None.
-        """
-        tab = self._tab
-        for column in xrange(start_column, len(tab[start_row])):
-            if self._is_vertical_line(column, start_row):
-                return column
-        return None
+        return set(self.note_events(ignore_repetition=True).strike_types)
 
-    def _is_vertical_line(self, column, start_row):
-        """
-        Returns True if the column contains an unbroken vertical line
-        starting from the start_row."""
-        tab = self._tab
-        if tab[start_row][column] == '|':
-            for row in xrange(start_row, len(tab)):
-                if column >= len(tab[row]) \
-                   or tab[row].strip() == "" \
-                   or tab[row][column] == " ":
-                    break
-                if tab[row][column] != '|':
-                    return False
-            return True
-        else:
-            return False
 
-    def _calculate_divisions_in_bar(self, row):
-        """
-        Returns the number of divisions in the bar whose top row is the
-        given row.
-        """
-        # Find the first row that contains notes
-        row = self._find_first_note_row_for_bar(row)
-        # Count the number of characters between the vertical bars.
-        start = self._find_vertical_line(0, row)
-        if not start:
-            raise TabParsingException("Could not find starting vertical bar.",
-                                      0, row)
-        end = self._find_vertical_line(start + 1, row)
-        if not end:
-            raise TabParsingException("Could not find end vertical bar.",
-                                      start + 1, row)
-        return end - start - 1
-
-    def _calculate_repetitions(self, row, column):
-        """
-        Determines how many times the region whose start is at the given row
-        and column is repeatd.  Assumes that the row contains repetition
-        information (the row should not be the top row of notes).
-        """
-        tab = self._tab
-        # TODO: handle the case where this row at this column is padded out
-        # with whitespace or is shorter than the rows below it.
-        fill_characters = '=-_ '
-        repetition_count = tab[row][column+1:].split('|', 1)[0]
-        repetition_count = repetition_count.strip(fill_characters +
-                                                  string.ascii_letters)
-        if repetition_count:
-            try:
-                reps = int(repetition_count)
-                if reps == 1:
-                    # "repeat 1x" probably means "play this section twice"
-                    return 2
-                else:
-                    return reps
-            except ValueError:
-                # TODO: should probably log a warning here.
-                return 1
-        else:
-            return 1
-
-    def _contains_repetitions(self, row):
-        """
-        Return True if the row contains repetition information, False
-        otherwise.
-        """
-        row_text = self._tab[row]
-        if re.search(r"repeat|\|[-_=]*(\d+x|x\d+)[-_=]*\|", row_text):
-            return True
-        return not self._find_note_type(row)
+def midi_notes(events, note_map):
+    """
+    Yields a (tick, pitch, volume) tuple for every note of the NoteEvents,
+    looking the pitches and volumes up in the tables of the CompiledNoteMap.
+    """
+    width, pitches, velocities = note_map.tables(events.note_types,
+                                                 events.strike_types)
+    for tick, note_type_code, strike_type_code in izip(
+            events.ticks, events.note_type_codes, events.strike_type_codes):
+        yield (tick, pitches[note_type_code * width + strike_type_code],
+               velocities[strike_type_code])
 
-    def _contains_triplets(self, row):
-        """
-        Return True if the row contains notation indicating triplets, False
-        otherwise.
-        """
-        row_text = self._tab[row]
-        if re.search(r"\(3\)", row_text):
-            return True
-        else:
-            return False
 
-    def _is_count_row(self, row):
-        """
-        Return True if the row contains notation indicating a count, False
-        otherwise.  For example: | 1 e & a 2 e & a 3 e & a 4 e & a |
-        """
-        row_text = self._tab[row]
-        if '&' in row_text or '+' in row_text:
-            return True
-        return False
+def run_chunks(events, note_map, duration):
+    """
+    Returns an (offset, TrackChunk) tuple for every run of the SegmentRuns
+    of the NoteEvents, encoding the notes of every Segment only once.
+    Returns None if the runs are not known or the notes of neighbouring runs
+    overlap, in which case the notes have to be encoded together, and if
+    less than MIN_DEDUP_RATIO of the runs share the Segment of an earlier
+    run, in which case encoding them together is faster.
+    """
+    runs = events.runs
+    if runs is None or duration <= 0:
+        return None
+    if len(runs.codes) - len(set(runs.codes)) < \
+            MIN_DEDUP_RATIO * len(runs.codes):
+        return None
+    width, pitches, velocities = note_map.tables(events.note_types,
+                                                 events.strike_types)
+    ticks = events.ticks
+    note_type_codes = events.note_type_codes
+    strike_type_codes = events.strike_type_codes
+    sizes = runs.sizes
+    encoded = {}
+    chunks = []
+    end_tick = 0
+    start = 0
+    for tick, code in izip(runs.ticks, runs.codes):
+        end = start + sizes[code]
+        chunk = encoded.get(code)
+        if chunk is None:
+            chunk = encoded[code] = encode_chunk(
+                ((ticks[i] - tick,
+                  pitches[note_type_codes[i] * width + strike_type_codes[i]],
+                  velocities[strike_type_codes[i]])
+                 for i in xrange(start, end)),
+                duration)
+        if chunk.first_tick + tick < end_tick:
+            return None
+        end_tick = chunk.last_tick + tick
+        chunks.append((tick, chunk))
+        start = end
+    return chunks
 
 
 def _test():
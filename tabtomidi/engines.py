@@ -0,0 +1,35 @@
+"""
+engines.py: The registry of engines that walk the notes of lexed tabs.
+
+An engine is a class that takes the arguments of NoteEventsBuilder and
+provides its attributes and methods: tick, step_ticks, ticks_per_beat,
+columns_parsed, repetitions_expanded, add_bar_group, count_ticks and build.
+Tab(text, engine=name) walks the tab with the named engine.  The
+"reference" engine is NoteEventsBuilder; other engines are checked against
+it with tabtomidi.differential before they are trusted.  The "grid" engine
+parses bars with NumPy, if it is installed.
+"""
+from tabtomidi.events import NoteEventsBuilder
+from tabtomidi.gridengine import GRID_ENGINE, GridNoteEventsBuilder
+
+REFERENCE_ENGINE = 'reference'
+
+ENGINES = {REFERENCE_ENGINE: NoteEventsBuilder,
+           GRID_ENGINE: GridNoteEventsBuilder}
+
+
+def register_engine(name, engine):
+    """Makes the engine class available to Tab under the given name."""
+    ENGINES[name] = engine
+
+
+def get_engine(name):
+    """
+    Returns the engine class registered under the name.  Raises ValueError
+    if there is none.
+    """
+    engine = ENGINES.get(name)
+    if engine is None:
+        raise ValueError("Unknown engine: %s (known engines: %s)" %
+                         (name, ", ".join(sorted(ENGINES))))
+    return engine
@@ -0,0 +1,626 @@
+"""
+events.py: Compact, array backed storage for the notes of a tab.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from fractions import gcd
+from itertools import izip
+
+from tabtomidi.exceptions import TabParsingException
+from tabtomidi.lexer import calculate_repetitions
+from tabtomidi.limits import NO_LIMITS
+from tabtomidi.smf import MAX_TICKS_PER_BEAT, TICKS_PER_BEAT
+
+# The steps that playing a Segment costs on top of copying its notes, which
+# takes about as long as copying this many notes.
+SEGMENT_STEPS = 16
+
+# After MIN_GROOVE_LOOKUPS sections, a GrooveCache only fingerprints more
+# sections while at least MIN_DEDUP_RATIO of them were found in it, as
+# fingerprinting the sections of tabs that do not write grooves out again
+# only costs time.
+MIN_GROOVE_LOOKUPS = 256
+MIN_DEDUP_RATIO = 0.125
+# The most Segments that the GrooveCache of a walk that never ends, like a
+# stream or an edited document, keeps before it is cleared.
+MAX_GROOVES = 1024
+
+
+def ticks_per_beat_for(divisions, base=TICKS_PER_BEAT):
+    """
+    Returns the smallest multiple of base ticks per beat at which a bar of
+    four beats divides into a whole number of ticks for every count of
+    divisions.  Raises TabParsingException if that is more than a midi file
+    can store.
+    """
+    factor = 1
+    for count in divisions:
+        if not count:
+            # Bars without divisions take no time.
+            continue
+        needed = count // gcd(count, 4 * base)
+        factor = factor * needed // gcd(factor, needed)
+    if base * factor > MAX_TICKS_PER_BEAT:
+        raise TabParsingException(
+            "Bars with %s divisions need more than %d ticks per beat." %
+            (", ".join(str(count) for count in sorted(set(divisions))),
+             MAX_TICKS_PER_BEAT))
+    return base * factor
+
+
+def bar_divisions(group):
+    """Returns the set of the numbers of divisions in the bars of a group."""
+    vertical_lines = group.vertical_lines
+    return set(end - start - 1
+               for start, end in izip(vertical_lines, vertical_lines[1:]))
+
+
+def division_ticks(divisions, ticks_per_beat):
+    """
+    Returns the length in ticks of one of the divisions of a bar.  Raises
+    ValueError if a bar does not divide into a whole number of ticks.
+    """
+    # 4 is because a bar is four quarter notes long.
+    step_ticks, remainder = divmod(4 * ticks_per_beat, divisions)
+    if remainder:
+        raise ValueError("%d ticks per beat do not divide a bar into %d "
+                         "divisions." % (ticks_per_beat, divisions))
+    return step_ticks
+
+
+class NoteEvents(object):
+    """
+    A columnar sequence of note events in time order.
+
+    The events are stored in parallel arrays: ticks holds the time of every
+    note in ticks, of which there are ticks_per_beat in a quarter note,
+    note_type_codes holds indices into the note_types table and
+    strike_type_codes holds indices into the strike_types table.  Slicing
+    returns a new NoteEvents object that shares the lookup tables.
+
+    runs is a SegmentRuns object if the notes were added by a
+    NoteEventsBuilder one Segment at a time, and None otherwise.
+    """
+
+    def __init__(self, ticks=None, note_type_codes=None,
+                 strike_type_codes=None, note_types=(), strike_types=(),
+                 ticks_per_beat=TICKS_PER_BEAT, runs=None):
+        self.ticks = ticks if ticks is not None else array('l')
+        self.note_type_codes = note_type_codes \
+            if note_type_codes is not None else array('H')
+        self.strike_type_codes = strike_type_codes \
+            if strike_type_codes is not None else array('H')
+        self.note_types = note_types
+        self.strike_types = strike_types
+        self.ticks_per_beat = ticks_per_beat
+        self.runs = runs
+
+    @property
+    def times(self):
+        """The time of every note in quarter notes."""
+        ticks_per_beat = float(self.ticks_per_beat)
+        return array('d', [tick / ticks_per_beat for tick in self.ticks])
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return NoteEvents(self.ticks[index], self.note_type_codes[index],
+                              self.strike_type_codes[index], self.note_types,
+                              self.strike_types, self.ticks_per_beat)
+        return self._note(self.ticks[index], self.note_type_codes[index],
+                          self.strike_type_codes[index])
+
+    def __iter__(self):
+        for tick, note_type_code, strike_type_code in izip(
+                self.ticks, self.note_type_codes, self.strike_type_codes):
+            yield self._note(tick, note_type_code, strike_type_code)
+
+    def _note(self, tick, note_type_code, strike_type_code):
+        """Returns the given event as a dict in the format of walk_notes."""
+        return { 'strike_type' : self.strike_types[strike_type_code],
+                 'note_type' : self.note_types[note_type_code],
+                 'time' : tick / float(self.ticks_per_beat), }
+
+
+class SegmentRuns(namedtuple('SegmentRuns', ['ticks', 'codes', 'sizes'])):
+    """
+    The runs of notes of a NoteEvents object that were added from one
+    Segment each, in order.  The run at index i starts at ticks[i] and holds
+    the notes of the Segment with the code codes[i], of which there are
+    sizes[codes[i]].  Runs of the same Segment hold the same notes, shifted
+    in time, so they only need to be encoded once.  Segments without notes
+    have no runs.
+    """
+    __slots__ = ()
+
+
+class Segment(object):
+    """
+    The notes of a section of a group of bars, parsed once so that they can
+    be played any number of times.  ticks holds the time of every note from
+    the start of the section and num_ticks the length of the section.  code
+    is the number that a GrooveCache gave the segment, or None.
+    """
+    __slots__ = ('code', 'num_ticks', 'ticks', 'note_type_codes',
+                 'strike_type_codes')
+
+    def __init__(self):
+        self.code = None
+        self.num_ticks = 0
+        self.ticks = array('l')
+        self.note_type_codes = array('H')
+        self.strike_type_codes = array('H')
+
+    def extend(self, segment):
+        """Appends the notes of the other segment after the notes so far."""
+        offset = self.num_ticks
+        self.ticks.extend([tick + offset for tick in segment.ticks])
+        self.note_type_codes.extend(segment.note_type_codes)
+        self.strike_type_codes.extend(segment.strike_type_codes)
+        self.num_ticks += segment.num_ticks
+
+
+class GrooveCache(object):
+    """
+    Hash-conses the Segments of the sections of a tab that are played as
+    they are.
+
+    A section is fingerprinted by its columns in every note row, the note
+    types of the rows and the vertical lines in and around it, which
+    decide how long its columns last.  Sections with the same fingerprint,
+    like a groove that is written out again in every bar, share the Segment
+    that was parsed for the first of them.  Sections whose rows end early
+    are not fingerprinted, because they are parsed differently.
+
+    Every Segment added gets a code, its index in sizes, which holds its
+    number of notes.  lookups counts the sections that were looked up and
+    hits the ones whose Segment was found.  Once the dedup_ratio of
+    MIN_GROOVE_LOOKUPS sections or more falls below MIN_DEDUP_RATIO,
+    fingerprinting is no longer worthwhile and the sections that follow are
+    parsed.
+    """
+
+    def __init__(self):
+        self.sizes = array('L')
+        self.lookups = 0
+        self.hits = 0
+        self._segments = {}
+
+    def __len__(self):
+        """The number of distinct Segments."""
+        return len(self.sizes)
+
+    @property
+    def dedup_ratio(self):
+        """The fraction of the sections looked up whose Segment was found."""
+        if not self.lookups:
+            return 0.0
+        return self.hits / float(self.lookups)
+
+    @property
+    def worthwhile(self):
+        """Whether sections are still worth fingerprinting."""
+        return self.lookups < MIN_GROOVE_LOOKUPS or \
+            self.hits >= MIN_DEDUP_RATIO * self.lookups
+
+    def get(self, key):
+        """
+        Returns the Segment with the fingerprint key, or None if there is
+        none or key is None.
+        """
+        self.lookups += 1
+        segment = self._segments.get(key) if key is not None else None
+        if segment is not None:
+            self.hits += 1
+        return segment
+
+    def clear(self):
+        """
+        Forgets every Segment, so that codes start from 0 again.  sizes is
+        replaced rather than emptied, as the SegmentRuns of notes that were
+        built before still refer to it.
+        """
+        self.sizes = array('L')
+        self._segments = {}
+
+    def add(self, key, segment):
+        """
+        Gives the Segment a code and, unless key is None, keeps it under
+        the fingerprint key.  Returns the Segment.
+        """
+        segment.code = len(self.sizes)
+        self.sizes.append(len(segment.ticks))
+        if key is not None:
+            self._segments[key] = segment
+        return segment
+
+
+class NoteEventsBuilder(object):
+    """
+    Walks groups of bars and collects their notes in NoteEvents objects,
+    interning note and strike types as it goes.  columns_parsed counts the
+    columns that were parsed and repetitions_expanded the extra times that
+    repeated sections were played.  Sections that are written out like an
+    earlier one are not parsed again but found in grooves, a GrooveCache.
+    steps counts the cells of the columns parsed, the notes copied and
+    SEGMENT_STEPS for every Segment played, and notes_added the notes added,
+    which limits, a ResourceLimits object, bound together with the repeats.
+
+    Every division of a bar lasts step_ticks ticks, with ticks_per_beat
+    chosen by ticks_per_beat_for by default.  If per_bar_divisions is True,
+    the divisions of every bar are counted between its own vertical lines
+    instead, and ticks_per_beat has to suit all of them.  tick is the time
+    at which the next group of bars starts.
+    """
+
+    def __init__(self, divisions_in_bar, ignore_repetition=False,
+                 ticks_per_beat=None, per_bar_divisions=False, limits=None):
+        if ticks_per_beat is None:
+            ticks_per_beat = ticks_per_beat_for([divisions_in_bar])
+        self.divisions_in_bar = divisions_in_bar
+        self.ignore_repetition = ignore_repetition
+        self.ticks_per_beat = ticks_per_beat
+        self.per_bar_divisions = per_bar_divisions
+        self.step_ticks = division_ticks(divisions_in_bar, ticks_per_beat)
+        self.tick = 0
+        self.columns_parsed = 0
+        self.repetitions_expanded = 0
+        self.steps = 0
+        self.notes_added = 0
+        self.limits = limits if limits is not None else NO_LIMITS
+        self.grooves = GrooveCache()
+        self._run_ticks = array('l')
+        self._run_codes = array('L')
+        self._note_type_codes = {}
+        self._strike_type_codes = {}
+        self._note_types = []
+        self._strike_types = []
+        self._events = NoteEvents(ticks_per_beat=ticks_per_beat)
+
+    def note_type_code(self, note_type):
+        """Returns the code for the note type, assigning one if needed."""
+        code = self._note_type_codes.get(note_type)
+        if code is None:
+            code = self._note_type_codes[note_type] = len(self._note_types)
+            self._note_types.append(note_type)
+        return code
+
+    def strike_type_code(self, strike_type):
+        """Returns the code for the strike type, assigning one if needed."""
+        code = self._strike_type_codes.get(strike_type)
+        if code is None:
+            code = self._strike_type_codes[strike_type] = \
+                len(self._strike_types)
+            self._strike_types.append(strike_type)
+        return code
+
+    def build(self):
+        """
+        Returns the notes added since the previous call as a NoteEvents
+        object.
+        """
+        events = self._events
+        events.note_types = tuple(self._note_types)
+        events.strike_types = tuple(self._strike_types)
+        events.runs = SegmentRuns(self._run_ticks, self._run_codes,
+                                  self.grooves.sizes)
+        self._events = NoteEvents(ticks_per_beat=self.ticks_per_beat)
+        self._run_ticks = array('l')
+        self._run_codes = array('L')
+        return events
+
+    def add_bar_group(self, group):
+        """Adds the notes of the group of bars after the notes added so far."""
+        if not isinstance(group.rows, tuple):
+            # Rows that are views of a TextStore are read many times below.
+            group = group._replace(rows=tuple(group.rows))
+        tick = self.tick
+        # A tuple, so that it can be part of the fingerprints of sections.
+        note_type_codes = tuple([self.note_type_code(note_type)
+                                 for note_type in group.note_types])
+        nested_repetition_rows = self._nested_repetition_rows(group)
+        for c, num_cols, repetitions in self._sections(group):
+            # The section is parsed once and then played repetitions times.
+            self.limits.check('max_repetitions', repetitions, group.top_row,
+                              c + 1)
+            self.repetitions_expanded += repetitions - 1
+            segment = self._parse_segment(group, note_type_codes,
+                                          nested_repetition_rows, c, num_cols)
+            self.notes_added += len(segment.ticks) * repetitions
+            self.limits.check('max_notes', self.notes_added, group.top_row,
+                              c + 1)
+            self._spend(repetitions * (len(segment.ticks) + SEGMENT_STEPS))
+            for _ in xrange(repetitions):
+                tick = self._add_segment(segment, tick)
+        self.tick = tick
+
+    def count_ticks(self, group):
+        """
+        Returns the number of ticks that add_bar_group would advance the time
+        by, without parsing the notes.
+        """
+        nested_repetition_rows = self._nested_repetition_rows(group)
+        return sum(self._count_segment_ticks(group, nested_repetition_rows, c,
+                                             num_cols) * repetitions
+                   for c, num_cols, repetitions in self._sections(group))
+
+    def column_at(self, group, tick):
+        """
+        Returns the column of the group whose notes are played the given
+        number of ticks after the start of the group, or None if no column
+        is.  Notes of repeated sections map to the column they were parsed
+        from.
+        """
+        nested_repetition_rows = self._nested_repetition_rows(group)
+        for c, num_cols, repetitions in self._sections(group):
+            segment_ticks = self._count_segment_ticks(
+                group, nested_repetition_rows, c, num_cols)
+            if tick < segment_ticks * repetitions:
+                return self._segment_column_at(group, nested_repetition_rows,
+                                               c, num_cols,
+                                               tick % segment_ticks)
+            tick -= segment_ticks * repetitions
+        return None
+
+    def _segment_column_at(self, group, nested_repetition_rows, c, num_cols,
+                           tick):
+        """Like column_at, for the Segment that _parse_segment returns."""
+        if nested_repetition_rows:
+            for c, section_cols, repetitions in _nested_sections(
+                    nested_repetition_rows[0], c, num_cols):
+                section_ticks = self._count_segment_ticks(
+                    group, nested_repetition_rows[1:], c, section_cols)
+                if tick < section_ticks * repetitions:
+                    return self._segment_column_at(
+                        group, nested_repetition_rows[1:], c, section_cols,
+                        tick % section_ticks)
+                tick -= section_ticks * repetitions
+            return None
+        for column in xrange(c + 1, c + num_cols + 1):
+            if group.is_vertical_line(column):
+                continue
+            if self.per_bar_divisions:
+                column_ticks = self._column_ticks(group, column)
+            else:
+                column_ticks = self.step_ticks
+            if tick < column_ticks:
+                return column
+            tick -= column_ticks
+        return None
+
+    def _nested_repetition_rows(self, group):
+        """Returns the nested repetition rows of the group that apply."""
+        if self.ignore_repetition:
+            return ()
+        return group.nested_repetition_rows
+
+    def _sections(self, group):
+        """
+        Yields the column before every section of the group of bars, the
+        number of columns in the section and how many times it is played.
+        """
+        if self.ignore_repetition:
+            repetition_row = None
+        else:
+            repetition_row = group.repetition_row
+        return iter_sections(group, self.divisions_in_bar, repetition_row)
+
+    def _spend(self, steps):
+        """
+        Adds steps to the steps of the walk.  Raises ResourceLimitExceeded if
+        that is more than the limits allow.
+        """
+        self.steps += steps
+        self.limits.check('max_steps', self.steps)
+
+    def _add_segment(self, segment, tick):
+        """
+        Adds the notes of the segment starting at the given tick and returns
+        the tick at which the segment ends.
+        """
+        if segment.ticks:
+            if segment.code is None:
+                self.grooves.add(None, segment)
+            self._run_ticks.append(tick)
+            self._run_codes.append(segment.code)
+        if tick:
+            self._events.ticks.extend([tick + offset
+                                       for offset in segment.ticks])
+        else:
+            self._events.ticks.extend(segment.ticks)
+        self._events.note_type_codes.extend(segment.note_type_codes)
+        self._events.strike_type_codes.extend(segment.strike_type_codes)
+        return tick + segment.num_ticks
+
+    def _parse_segment(self, group, note_type_codes, nested_repetition_rows,
+                       c, num_cols):
+        """
+        Returns the Segment holding the notes in the num_cols columns after
+        column c.  The first of nested_repetition_rows divides the columns
+        into sections that are repeated, and so on for the rest of the rows.
+        """
+        if not nested_repetition_rows:
+            if self.grooves.worthwhile:
+                key = self._section_key(group, note_type_codes, c, num_cols)
+            else:
+                key = None
+            segment = self.grooves.get(key)
+            if segment is None:
+                segment = self.grooves.add(key, self._parse_columns(
+                    group, note_type_codes, c, num_cols))
+            return segment
+        segment = Segment()
+        for c, section_cols, repetitions in _nested_sections(
+                nested_repetition_rows[0], c, num_cols):
+            self.limits.check('max_repetitions', repetitions, group.top_row,
+                              c + 1)
+            self.repetitions_expanded += repetitions - 1
+            section = self._parse_segment(group, note_type_codes,
+                                          nested_repetition_rows[1:], c,
+                                          section_cols)
+            # The segment has to fit in the notes that may still be added.
+            self.limits.check(
+                'max_notes', self.notes_added + len(segment.ticks) +
+                len(section.ticks) * repetitions, group.top_row, c + 1)
+            self._spend(repetitions * (len(section.ticks) + SEGMENT_STEPS))
+            for _ in xrange(repetitions):
+                segment.extend(section)
+        return segment
+
+    def _section_key(self, group, note_type_codes, c, num_cols):
+        """
+        Returns the fingerprint of the num_cols columns after column c for
+        the GrooveCache, or None if a row ends before them.
+        """
+        end = c + num_cols + 1
+        rows = group.rows
+        columns = "\n".join([row[c + 1:end] for row in rows])
+        # No slice is longer than num_cols, so a short one shortens the text.
+        if len(columns) != len(rows) * (num_cols + 1) - 1:
+            return None
+        vertical_lines = group.vertical_lines
+        if self.per_bar_divisions:
+            # The vertical lines just before and after the section decide
+            # how long its columns are if every bar has its own divisions.
+            first = max(bisect_left(vertical_lines, c + 1) - 1, 0)
+            last = bisect_right(vertical_lines, c + num_cols) + 1
+        else:
+            first = bisect_right(vertical_lines, c)
+            last = bisect_right(vertical_lines, c + num_cols)
+        if first == last:
+            return note_type_codes, columns
+        return (note_type_codes, columns,
+                tuple([column - c for column in vertical_lines[first:last]]))
+
+    def _count_segment_ticks(self, group, nested_repetition_rows, c,
+                             num_cols):
+        """
+        Returns the num_ticks of the Segment that _parse_segment would
+        return.
+        """
+        if nested_repetition_rows:
+            return sum(self._count_segment_ticks(
+                           group, nested_repetition_rows[1:], c,
+                           section_cols) * repetitions
+                       for c, section_cols, repetitions in _nested_sections(
+                           nested_repetition_rows[0], c, num_cols))
+        if self.per_bar_divisions:
+            return sum(self._column_ticks(group, column)
+                       for column in xrange(c + 1, c + num_cols + 1)
+                       if not group.is_vertical_line(column))
+        vertical_lines = group.vertical_lines
+        # Columns with vertical lines are skipped.
+        return self.step_ticks * (
+            num_cols - (bisect_right(vertical_lines, c + num_cols) -
+                        bisect_right(vertical_lines, c)))
+
+    def _column_ticks(self, group, column):
+        """
+        Returns the length in ticks of the division of a bar in the column,
+        counting the divisions of the bar that the column is in.
+        """
+        vertical_lines = group.vertical_lines
+        i = bisect_right(vertical_lines, column)
+        if 0 < i < len(vertical_lines):
+            divisions = vertical_lines[i] - vertical_lines[i - 1] - 1
+            return division_ticks(divisions, self.ticks_per_beat)
+        # Columns before the first or after the last vertical line are not
+        # in a bar of their own.
+        return self.step_ticks
+
+    def _parse_columns(self, group, note_type_codes, c, num_cols):
+        """
+        Returns the Segment holding the notes in the num_cols columns after
+        column c, which are played as they are.
+        """
+        rows = group.rows
+        strike_type_code = self.strike_type_code
+        self.columns_parsed += num_cols
+        self._spend(num_cols * len(note_type_codes))
+        segment = Segment()
+        append_tick = segment.ticks.append
+        append_note_type_code = segment.note_type_codes.append
+        append_strike_type_code = segment.strike_type_codes.append
+        step_ticks = self.step_ticks
+        per_bar_divisions = self.per_bar_divisions
+        tick = 0
+        for t in xrange(1, num_cols+1):
+            # For every time in this bar or repeated section:
+            if not group.is_vertical_line(c+t):
+                for d in xrange(0, len(note_type_codes)):
+                    # For every drum in this bar:
+                    if c + t >= len(rows[d]) and \
+                        rows[d][-1] == '|':
+                        # This is to handle cases where the last
+                        # row of a group of bars has fewer columns
+                        continue
+                    strike_type = rows[d][c + t]
+                    if strike_type in '-|':
+                        continue
+                    append_tick(tick)
+                    append_note_type_code(note_type_codes[d])
+                    append_strike_type_code(strike_type_code(strike_type))
+                if per_bar_divisions:
+                    tick += self._column_ticks(group, c + t)
+                else:
+                    tick += step_ticks
+        segment.num_ticks = tick
+        return segment
+
+
+def iter_sections(group, divisions_in_bar, repetition_row):
+    """
+    Yields the column before every section of the group of bars that the
+    notes are walked in, the number of columns in the section and how many
+    times it is played.  The sections are the bars, unless repetition_row
+    marks repeated sections; with a repetition_row of None, every section
+    is played once.
+    """
+    row_length = len(group.rows[0])
+    # The following assumes that there are as many entries in
+    # note_types as there are vertical lines in the bar.
+    c = group.find_vertical_line()
+    # Support bars that leave out the leftmost pipe character.
+    if c - (divisions_in_bar + 1) > 0:
+        c -= (divisions_in_bar + 1)
+    while c < row_length - 1:
+        next_vertical_line = group.find_vertical_line(c+1)
+        if next_vertical_line:
+            num_cols_to_parse = next_vertical_line - c - 1
+        else:
+            num_cols_to_parse = 0
+        if repetition_row is not None:
+            # Determine the length of the repeated section.
+            repetition_cols = len(repetition_row[c+1:].split('|', 1)[0])
+            if repetition_cols != 0:
+                num_cols_to_parse = repetition_cols
+            # Determine how many times the section is repeated.
+            repetitions = calculate_repetitions(repetition_row, c)
+        else:
+            repetitions = 1
+        yield c, num_cols_to_parse, repetitions
+        c += num_cols_to_parse + 1
+        if not group.is_vertical_line(c):
+            break
+
+
+def _nested_sections(repetition_row, c, num_cols):
+    """
+    Yields the column before every section that the nested repetition row
+    divides the num_cols columns after column c into, the number of columns
+    in the section and how many times it is played.
+    """
+    end = c + num_cols
+    while c < end:
+        section_cols = len(repetition_row[c+1:end+1].split('|', 1)[0])
+        if section_cols == 0:
+            # The row has no more sections in this segment.
+            section_cols = end - c
+            repetitions = 1
+        else:
+            repetitions = calculate_repetitions(repetition_row, c)
+        yield c, section_cols, repetitions
+        c += section_cols + 1
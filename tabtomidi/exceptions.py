@@ -0,0 +1,46 @@
+"""
+exceptions.py: Exceptions raised while parsing tabs and generating midi.
+"""
+
+
+class TabParsingException(Exception):
+    """Base class for all exceptions due to unparsable tabs."""
+
+    def __init__(self, message, row=None, column=None):
+        Exception.__init__(self, message)
+        self.row = row
+        self.column = column
+
+
+class UnmappableNoteNamesException(TabParsingException):
+    """
+    Raised when the parser cannot map one or more note names to midi notes.
+    The note_names attribute provides the set of unmappable note names.
+    """
+
+    def __init__(self, note_names):
+        TabParsingException.__init__(self,
+            "Some note names could not be mapped to midi notes: " + str(note_names))
+        self.note_names = note_names
+
+
+class ResourceLimitExceeded(TabParsingException):
+    """
+    Raised when a tab needs more of a resource than its ResourceLimits
+    allow.  limit is the name of the limit, like 'max_notes', value the
+    amount that was needed and maximum the amount allowed.
+    """
+
+    def __init__(self, limit, value, maximum, row=None, column=None):
+        TabParsingException.__init__(self,
+            "The tab exceeds %s: %d > %d." % (limit, value, maximum),
+            row, column)
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+
+    def __reduce__(self):
+        # Exceptions are pickled with their message only, which is not
+        # enough to construct this one in another process.
+        return type(self), (self.limit, self.value, self.maximum, self.row,
+                            self.column)
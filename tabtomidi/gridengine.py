@@ -0,0 +1,210 @@
+"""
+gridengine.py: An engine that finds the notes of groups of bars with NumPy.
+
+Every group of bars is turned into a 2-D grid of character codes, one row per
+drum, padded with '-' to the length of the longest row.  The strikes of the
+whole group, and the ticks they are played at, are found at once with a mask
+over the grid, in time-then-row order, and the sections that
+NoteEventsBuilder walks are sliced out of them by column, so the walk itself,
+including repeats, stays the same.  The columns with vertical lines are the
+ones that the lexer found.
+
+If NumPy is not installed, or a group has characters that do not fit in a
+byte, the notes are parsed by NoteEventsBuilder one character at a time.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+
+from tabtomidi.events import NoteEventsBuilder, Segment
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+GRID_ENGINE = 'grid'
+
+_NO_NOTE = ord('-')
+_VERTICAL_LINE = ord('|')
+
+
+class GridNoteEventsBuilder(NoteEventsBuilder):
+    """A NoteEventsBuilder that parses the columns of bars with NumPy."""
+
+    def __init__(self, *args, **kwargs):
+        NoteEventsBuilder.__init__(self, *args, **kwargs)
+        self._grid = None
+        self._grid_pending = False
+        if numpy is not None:
+            # The strike type code of every character code, or -1.
+            self._strike_type_code_table = numpy.empty(256, numpy.int32)
+            self._strike_type_code_table.fill(-1)
+            self._strike_type_code_list = [-1] * 256
+        # The sections that had strike types to intern.
+        self._interning_sections = 0
+
+    def add_bar_group(self, group):
+        """Adds the notes of the group of bars after the notes added so far."""
+        if numpy is None:
+            return NoteEventsBuilder.add_bar_group(self, group)
+        # The grid is built when the first section of the group that is not
+        # in the GrooveCache is parsed.
+        self._grid_pending = True
+        try:
+            NoteEventsBuilder.add_bar_group(self, group)
+        finally:
+            self._grid = None
+            self._grid_pending = False
+
+    def _parse_columns(self, group, note_type_codes, c, num_cols):
+        """
+        Returns the Segment holding the notes in the num_cols columns after
+        column c, which are played as they are.
+        """
+        if self._grid_pending:
+            self._grid = _BarGroupGrid.build(self, group)
+            self._grid_pending = False
+        grid = self._grid
+        if grid is None:
+            return NoteEventsBuilder._parse_columns(self, group,
+                                                    note_type_codes, c,
+                                                    num_cols)
+        grid.check_row_lengths(group, c, num_cols)
+        self.columns_parsed += num_cols
+        self._spend(num_cols * len(note_type_codes))
+        first = bisect_left(grid.columns, c + 1)
+        end = bisect_right(grid.columns, c + num_cols)
+        start_tick = grid.column_tick(c + 1)
+        segment = Segment()
+        segment.num_ticks = grid.column_tick(c + num_cols + 1) - start_tick
+        if first == end:
+            return segment
+        ticks = grid.ticks[first:end]
+        if start_tick:
+            ticks = ticks - start_tick
+        segment.ticks = array('l', ticks.astype(numpy.int_).tostring())
+        segment.note_type_codes = \
+            grid.note_type_codes(note_type_codes)[first:end]
+        segment.strike_type_codes = self._grid_strike_type_codes(grid, first,
+                                                                 end)
+        return segment
+
+    def _grid_strike_type_codes(self, grid, first, end):
+        """
+        Returns the strike type codes of the strikes from first to end of the
+        grid as an array, interning new strike types in the order they are
+        played in.
+        """
+        table = self._strike_type_code_table
+        if grid.strike_type_codes is None:
+            grid.strike_type_codes = table[grid.strikes]
+        # Only the strikes of the section are checked, since the grid also
+        # has the characters of the note names, which are never interned.
+        codes = grid.strike_type_codes[first:end]
+        if (codes < 0).any():
+            self._interning_sections += 1
+            known = self._strike_type_code_list
+            for strike in grid.strikes[first:end][codes < 0].tolist():
+                if known[strike] < 0:
+                    known[strike] = table[strike] = \
+                        self.strike_type_code(chr(strike))
+            # The new strike types may be played in later sections too.
+            grid.strike_type_codes = table[grid.strikes]
+            codes = grid.strike_type_codes[first:end]
+        return array('H', codes.astype(numpy.uint16).tostring())
+
+
+class _BarGroupGrid(object):
+    """
+    The strikes of a group of bars found with NumPy.  columns, drums,
+    strikes and ticks hold the column, drum row, character code and tick
+    from the start of the group of every strike, in time-then-row order.
+    strike_type_codes holds the strike type code of every strike, or -1 if
+    it was not known yet, once a section of the group is parsed.
+    """
+
+    def __init__(self, builder, group, rows):
+        width = max(len(row) for row in rows)
+        grid = numpy.frombuffer(b"".join(row.ljust(width, '-')
+                                         for row in rows),
+                                numpy.uint8).reshape(len(rows), width)
+        self.row_lengths = [len(row) for row in rows]
+        self.ends_with_vertical_line = [row[-1] == '|' for row in rows]
+        is_vertical_line = numpy.zeros(width, bool)
+        is_vertical_line[[column for column in group.vertical_lines
+                          if column < width]] = True
+        strikes = (grid != _NO_NOTE) & (grid != _VERTICAL_LINE)
+        strikes[:, is_vertical_line] = False
+        # Transposing puts the columns first, so nonzero returns the
+        # strikes in time-then-row order.
+        columns, self.drums = strikes.T.nonzero()
+        self.columns = columns.tolist()
+        self.strikes = grid[self.drums, columns]
+        if builder.per_bar_divisions:
+            column_ticks = numpy.array(
+                [builder._column_ticks(group, column)
+                 for column in xrange(width)], numpy.int64)
+        else:
+            column_ticks = numpy.empty(width, numpy.int64)
+            column_ticks.fill(builder.step_ticks)
+        column_ticks[is_vertical_line] = 0
+        starts = numpy.concatenate(([0], column_ticks.cumsum()))
+        # The tick at which every column, and the column after the grid,
+        # starts.
+        self._column_ticks = starts.tolist()
+        self._step_ticks = builder.step_ticks
+        self.ticks = starts[columns]
+        self.strike_type_codes = None
+        self._note_type_codes = None
+
+    @classmethod
+    def build(cls, builder, group):
+        """
+        Returns the grid of the group, or None if its characters do not fit
+        in a byte.
+        """
+        rows = []
+        for row in group.rows:
+            if isinstance(row, unicode):
+                try:
+                    row = row.encode('ascii')
+                except UnicodeEncodeError:
+                    return None
+            rows.append(row)
+        return cls(builder, group, rows)
+
+    def column_tick(self, column):
+        """
+        Returns the tick at which the column starts, counted from the start
+        of the group.  Columns past the grid are not in a bar and last
+        step_ticks each.
+        """
+        column_ticks = self._column_ticks
+        if column < len(column_ticks):
+            return column_ticks[column]
+        return column_ticks[-1] + \
+            (column - len(column_ticks) + 1) * self._step_ticks
+
+    def note_type_codes(self, note_type_codes):
+        """
+        Returns the note type codes of all strikes as an array, given the
+        code of every drum row.
+        """
+        if self._note_type_codes is None:
+            self._note_type_codes = array('H', numpy.asarray(
+                note_type_codes, numpy.uint16)[self.drums].tostring())
+        return self._note_type_codes
+
+    def check_row_lengths(self, group, c, num_cols):
+        """
+        Raises IndexError where NoteEventsBuilder would read past the end of
+        a row that does not end with a vertical line.
+        """
+        end = c + num_cols
+        for length, ends_with_vertical_line in zip(
+                self.row_lengths, self.ends_with_vertical_line):
+            if length > end or ends_with_vertical_line:
+                continue
+            for column in xrange(max(c + 1, length), end + 1):
+                if not group.is_vertical_line(column):
+                    raise IndexError("string index out of range")
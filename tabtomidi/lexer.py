@@ -0,0 +1,484 @@
+"""
+lexer.py: Turns tab text into an immutable intermediate representation.
+
+The lexer makes a single pass over the normalized lines of a tab and records,
+for every group of bars, the rows that contain notes, the optional repetition
+row, the note names and the columns that hold vertical lines.  The rest of the
+library works from these BarGroup objects instead of re-scanning the text.
+"""
+import re
+import string
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from tabtomidi.exceptions import TabParsingException
+from tabtomidi.profiling import NO_STATS
+
+
+# Pipe character lookalikes that are replaced with proper pipe characters.
+# See http://stackoverflow.com/questions/10572627/
+PIPE_LOOKALIKES = u'\u007c\u00a6\u2758\uffc5\uffe4'
+
+_REPETITION_RE = re.compile(r"repeat|\|[-_=]*(\d+x|x\d+)[-_=]*\|")
+_TRIPLETS_RE = re.compile(r"\(3\)")
+
+
+class BarGroup(namedtuple('BarGroup', ['top_row', 'end_row', 'dependency_end',
+                                       'note_row', 'repetition_row',
+                                       'nested_repetition_rows', 'rows',
+                                       'note_types', 'vertical_lines',
+                                       'vertical_line_set'])):
+    """
+    A group of bars whose rows are played simultaneously.
+
+    top_row is the first row of the group and end_row the row just past it.
+    dependency_end is the row just past the last row that was read to lex
+    the group, so edits at or after it cannot change the group.  note_row is
+    the first row containing notes, rows holds the text of the note rows (one
+    for every entry of note_types) and repetition_row holds the text of the
+    row with repetition information, or None.  nested_repetition_rows holds
+    the rows below it that mark repeats within the repeated sections, from
+    the outermost to the innermost.  vertical_lines is
+    the sorted tuple of columns that contain an unbroken vertical line
+    starting from the first note row.
+    """
+    __slots__ = ()
+
+    def is_vertical_line(self, column):
+        """Returns True if the column is a vertical line / bar division."""
+        return column in self.vertical_line_set
+
+    def find_vertical_line(self, start_column=0):
+        """
+        Returns the first column on or after start_column that is a vertical
+        line / bar division.  If no column is found, returns None.
+        """
+        i = bisect_left(self.vertical_lines, start_column)
+        if i < len(self.vertical_lines):
+            return self.vertical_lines[i]
+        return None
+
+    def shifted(self, rows):
+        """Returns the same group moved down by the given number of rows."""
+        if not rows:
+            return self
+        return self._replace(top_row=self.top_row + rows,
+                             end_row=self.end_row + rows,
+                             dependency_end=self.dependency_end + rows,
+                             note_row=self.note_row + rows)
+
+
+class BarGroupError(namedtuple('BarGroupError', ['top_row', 'end_row',
+                                                 'dependency_end', 'error'])):
+    """
+    Takes the place of a BarGroup that could not be lexed when lexing with
+    errors=True.  error is the TabParsingException.
+    """
+    __slots__ = ()
+
+    def shifted(self, rows):
+        """Returns the same error moved down by the given number of rows."""
+        if not rows:
+            return self
+        return self._replace(top_row=self.top_row + rows,
+                             end_row=self.end_row + rows,
+                             dependency_end=self.dependency_end + rows)
+
+
+class TextStore(object):
+    """
+    The normalized lines of a tab, stored compactly.
+
+    The lines, with trailing whitespace removed but count rows kept, are
+    joined into one string, which is a byte string if the tab is ASCII, and
+    an array holds the offset at which every line starts.  Count rows and
+    blank rows are marked in bitsets and read as empty lines.  Indexing and
+    iterating return the lines like the list from normalize_lines, and rows
+    returns the lines of a group of bars without copying them.
+    """
+
+    def __init__(self, tabtext, stats=NO_STATS):
+        with stats.phase('pipe_lookalikes'):
+            for lookalike in PIPE_LOOKALIKES:
+                tabtext = tabtext.replace(lookalike, '|')
+        with stats.phase('split_lines'):
+            lines = [l.rstrip() for l in tabtext.splitlines()]
+            starts = array('L', [0])
+            start = 0
+            for line in lines:
+                start += len(line)
+                starts.append(start)
+            text = tabtext[:0].join(lines)
+            if isinstance(text, unicode):
+                try:
+                    text = text.encode('ascii')
+                except UnicodeEncodeError:
+                    pass
+        with stats.phase('count_rows'):
+            count_rows = bytearray((len(lines) + 7) // 8)
+            blank_rows = bytearray((len(lines) + 7) // 8)
+            for row, line in enumerate(lines):
+                if not line:
+                    blank_rows[row >> 3] |= 1 << (row & 7)
+                elif is_count_row(line):
+                    count_rows[row >> 3] |= 1 << (row & 7)
+        self._text = text
+        self._starts = starts
+        self._count_rows = count_rows
+        self._blank_rows = blank_rows
+
+    def __len__(self):
+        return len(self._starts) - 1
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("row out of range")
+        return self._line(row)
+
+    def __iter__(self):
+        for row in xrange(len(self)):
+            yield self._line(row)
+
+    def _line(self, row):
+        """Returns the normalized line of a row that exists."""
+        byte, bit = row >> 3, 1 << (row & 7)
+        if (self._count_rows[byte] | self._blank_rows[byte]) & bit:
+            return self._text[:0]
+        return self._text[self._starts[row]:self._starts[row + 1]]
+
+    def rows(self, first_row, count):
+        """Returns the count lines from first_row as a StoreRows view."""
+        return StoreRows(self, first_row, count)
+
+    def widest_line(self):
+        """
+        Returns the row of the longest line and its length, or (None, 0)
+        if there are no lines.
+        """
+        starts = self._starts
+        row, width = None, 0
+        for i in xrange(len(starts) - 1):
+            if starts[i + 1] - starts[i] > width:
+                row, width = i, starts[i + 1] - starts[i]
+        return row, width
+
+
+class StoreRows(object):
+    """
+    A read-only sequence of consecutive lines of a TextStore.  Lines are
+    sliced from the store when they are read, so code that reads a line
+    many times should copy the rows with tuple() first.  Pickling copies the
+    lines, so the store is not pickled along.
+    """
+    __slots__ = ('_store', '_first_row', '_count')
+
+    def __init__(self, store, first_row, count):
+        self._store = store
+        self._first_row = first_row
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("row out of range")
+        return self._store._line(self._first_row + index)
+
+    def __iter__(self):
+        line = self._store._line
+        for row in xrange(self._first_row, self._first_row + self._count):
+            yield line(row)
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        return tuple, (tuple(self),)
+
+
+class _RowWindow(object):
+    """
+    Reads rows from an iterable on demand and forgets the rows before the
+    first one that may still be needed, so that only a window of the rows is
+    held in memory.  Rows are addressed by their index in the whole input.
+    """
+
+    def __init__(self, lines, first_row=0):
+        self._store = lines if isinstance(lines, TextStore) else None
+        self._store_first_row = first_row
+        self._lines = iter(lines)
+        self._rows = []
+        self._first_row = first_row
+        self.last_requested_row = first_row - 1
+
+    def has(self, row):
+        """Returns True if the input has the given row."""
+        if row > self.last_requested_row:
+            self.last_requested_row = row
+        while row >= self._first_row + len(self._rows):
+            if self._lines is None:
+                return False
+            try:
+                self._rows.append(next(self._lines))
+            except StopIteration:
+                self._lines = None
+                return False
+        return True
+
+    def __getitem__(self, row):
+        return self._rows[row - self._first_row]
+
+    def group_rows(self, first_row, count):
+        """
+        Returns the count rows from first_row as a tuple, or as StoreRows if
+        the rows are read from a TextStore.
+        """
+        if self._store is not None:
+            return self._store.rows(first_row - self._store_first_row, count)
+        return tuple(self[row] for row in xrange(first_row, first_row + count))
+
+    def release(self, row):
+        """Forgets all rows before the given row."""
+        if row > self._first_row:
+            del self._rows[:row - self._first_row]
+            self._first_row = row
+
+
+def normalize_line(line):
+    """
+    Replaces pipe character lookalikes, removes trailing whitespace and
+    blanks out count rows.
+    """
+    for lookalike in PIPE_LOOKALIKES:
+        line = line.replace(lookalike, '|')
+    line = line.rstrip()
+    return "" if is_count_row(line) else line
+
+
+def normalize_lines(tabtext, stats=NO_STATS):
+    """
+    Splits the tab text into lines, replacing pipe character lookalikes,
+    removing trailing whitespace and blanking out count rows.  The steps are
+    timed as phases of the given ConversionStats.
+    """
+    with stats.phase('pipe_lookalikes'):
+        for lookalike in PIPE_LOOKALIKES:
+            tabtext = tabtext.replace(lookalike, '|')
+    with stats.phase('split_lines'):
+        lines = [l.rstrip() for l in tabtext.splitlines()]
+    with stats.phase('count_rows'):
+        return ["" if is_count_row(l) else l for l in lines]
+
+
+def has_bar_rows(tabtext):
+    """
+    Returns True if a normalized line of the tab text would contain a
+    vertical line.  Only the lines up to the first such line are normalized.
+    """
+    if not any(lookalike in tabtext for lookalike in PIPE_LOOKALIKES):
+        return False
+    return any('|' in line for line in iter_normalized_lines([tabtext]))
+
+
+def iter_normalized_lines(lines):
+    """
+    Normalizes lines read from any iterable, such as a file object, the same
+    way normalize_lines normalizes a whole text.
+    """
+    for line in lines:
+        # splitlines drops empty lines that have no line break.
+        for part in line.splitlines() or [line]:
+            yield normalize_line(part)
+
+
+def lex(lines):
+    """
+    Returns a tuple with a BarGroup for every group of bars in the given
+    normalized lines.
+    """
+    return tuple(iter_bar_groups(lines))
+
+
+def iter_bar_groups(lines, first_row=0, errors=False):
+    """
+    Yields a BarGroup for every group of bars in the normalized lines, which
+    may come from any iterable.  Each group is yielded as soon as the rows it
+    depends on have been read, and only those rows are kept in memory.
+
+    first_row is the row number of the first line, for lexing the rest of a
+    tab from a row that is not inside a group of bars.  If errors is True, a
+    BarGroupError is yielded for groups that cannot be lexed instead of
+    raising their TabParsingException.
+    """
+    rows = _RowWindow(lines, first_row)
+    row = first_row
+    while rows.has(row):
+        if '|' in rows[row]:
+            top_row = row
+            while rows.has(row) and ('|' in rows[row] or
+                                     contains_triplets(rows[row])):
+                row += 1
+            try:
+                yield _lex_bar_group(rows, top_row, row)
+            except TabParsingException as e:
+                if not errors:
+                    raise
+                yield BarGroupError(top_row, row,
+                                    rows.last_requested_row + 1, e)
+        else:
+            row += 1
+        rows.release(row)
+
+
+def _lex_bar_group(rows, top_row, end_row):
+    """Builds the BarGroup for the rows between top_row and end_row."""
+    # Find the first row that contains notes (as opposed to repetition
+    # information, comments, or triplet marks).
+    note_row = top_row
+    while rows.has(note_row) and (contains_repetitions(rows[note_row]) or
+                                  contains_triplets(rows[note_row])):
+        note_row += 1
+    if not rows.has(note_row):
+        raise TabParsingException("Bar without notes", row=top_row,
+                                  column=rows[top_row].find('|'))
+    vertical_lines = _find_vertical_lines(rows, note_row)
+    if not vertical_lines or not vertical_lines[0]:
+        raise TabParsingException("Bar without notes", row=top_row,
+                                  column=rows[top_row].find('|'))
+    # Determine which drums are present in this group of bars.
+    note_types = []
+    row = note_row
+    while rows.has(row) and '|' in rows[row]:
+        if not contains_repetitions(rows[row]):
+            note_types.append(find_note_type(rows[row]))
+        row += 1
+    nested_repetition_rows = []
+    if contains_repetitions(rows[top_row]):
+        repetition_row = rows[top_row]
+        row = top_row + 1
+        while row < min(note_row, end_row) and \
+                _REPETITION_RE.search(rows[row]):
+            nested_repetition_rows.append(rows[row])
+            row += 1
+    else:
+        repetition_row = None
+    return BarGroup(top_row, end_row, rows.last_requested_row + 1, note_row,
+                    repetition_row, tuple(nested_repetition_rows),
+                    rows.group_rows(note_row, len(note_types)),
+                    tuple(note_types), vertical_lines,
+                    frozenset(vertical_lines))
+
+
+def _find_vertical_lines(rows, start_row):
+    """
+    Returns the sorted tuple of columns that contain an unbroken vertical line
+    starting from the start_row.  A line ends at the first row that is blank,
+    too short, or has a space in that column.
+    """
+    top = rows[start_row]
+    candidates = []
+    column = top.find('|')
+    while column != -1:
+        candidates.append(column)
+        column = top.find('|', column + 1)
+    found = []
+    row = start_row + 1
+    while candidates and rows.has(row) and rows[row]:
+        line = rows[row]
+        length = len(line)
+        remaining = []
+        for column in candidates:
+            if column >= length or line[column] == ' ':
+                found.append(column)
+            elif line[column] == '|':
+                remaining.append(column)
+        candidates = remaining
+        row += 1
+    found.extend(candidates)
+    return tuple(sorted(found))
+
+
+def find_note_type(line):
+    """Finds the note type for a given row."""
+    note_type = line.partition('|')[0]
+    note_type = note_type.strip().split(' ')[0]
+    return note_type.rstrip(' :-')
+
+
+def contains_repetitions(line):
+    """
+    Return True if the row contains repetition information, False
+    otherwise.
+    """
+    if _REPETITION_RE.search(line):
+        return True
+    return not find_note_type(line)
+
+
+def contains_triplets(line):
+    """
+    Return True if the row contains notation indicating triplets, False
+    otherwise.
+    """
+    return _TRIPLETS_RE.search(line) is not None
+
+
+def is_count_row(line):
+    """
+    Return True if the row contains notation indicating a count, False
+    otherwise.  For example: | 1 e & a 2 e & a 3 e & a 4 e & a |
+    """
+    return '&' in line or '+' in line
+
+
+def calculate_divisions_in_bar(group):
+    """
+    Returns the number of divisions in the bars of the given group.
+    """
+    # Count the number of characters between the vertical bars.
+    start = group.find_vertical_line()
+    if not start:
+        raise TabParsingException("Could not find starting vertical bar.",
+                                  group.note_row, 0)
+    end = group.find_vertical_line(start + 1)
+    if not end:
+        raise TabParsingException("Could not find end vertical bar.",
+                                  group.note_row, start + 1)
+    return end - start - 1
+
+
+def calculate_repetitions(line, column):
+    """
+    Determines how many times the region whose start is at the given column
+    of a repetition row is repeated.
+    """
+    # TODO: handle the case where this row at this column is padded out
+    # with whitespace or is shorter than the rows below it.
+    fill_characters = '=-_ '
+    repetition_count = line[column+1:].split('|', 1)[0]
+    repetition_count = repetition_count.strip(fill_characters +
+                                              string.ascii_letters)
+    if repetition_count:
+        try:
+            reps = int(repetition_count)
+            if reps == 1:
+                # "repeat 1x" probably means "play this section twice"
+                return 2
+            else:
+                return reps
+        except ValueError:
+            # TODO: should probably log a warning here.
+            return 1
+    else:
+        return 1
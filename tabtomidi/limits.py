@@ -0,0 +1,80 @@
+"""
+limits.py: Budgets that bound the work of converting untrusted tabs.
+
+Converting a tab takes time and memory roughly in proportion to its text,
+except for repeats: a short tab with "x99999" markers, or with repeats nested
+in repeats, expands to far more notes than it has characters.  Pass a
+ResourceLimits object to Tab to bound the text, the groups of bars, the
+repeats and the notes of a tab, and the steps spent walking it, which counts
+the cells of the columns parsed and the notes and sections copied into the
+walk.  A tab that needs more raises ResourceLimitExceeded as soon as that is
+known, before the work is done.
+
+Without limits, Tab uses NO_LIMITS, which allows everything.
+UNTRUSTED_LIMITS are generous for real tabs, which are rarely more than a few
+hundred groups of bars of a few hundred columns, and keep a conversion of a
+crafted tab to a fraction of a second.
+"""
+from collections import namedtuple
+
+from tabtomidi.exceptions import ResourceLimitExceeded
+
+_FIELDS = ('max_input_bytes', 'max_line_width', 'max_bar_groups',
+           'max_notes', 'max_repetitions', 'max_steps')
+
+
+class ResourceLimits(namedtuple('ResourceLimits', _FIELDS)):
+    """
+    The most that converting a tab may use of every resource, or None for
+    no limit:
+
+    max_input_bytes: the length of the text, in UTF-8 bytes for unicode
+    max_line_width: the length of a line of the text
+    max_bar_groups: the number of groups of bars
+    max_notes: the number of notes, with every repeat played out
+    max_repetitions: the number of times a section is repeated
+    max_steps: the steps of a walk, as counted by NoteEventsBuilder
+    """
+    __slots__ = ()
+
+    def __new__(cls, max_input_bytes=None, max_line_width=None,
+                max_bar_groups=None, max_notes=None, max_repetitions=None,
+                max_steps=None):
+        return super(ResourceLimits, cls).__new__(
+            cls, max_input_bytes, max_line_width, max_bar_groups, max_notes,
+            max_repetitions, max_steps)
+
+    def check(self, limit, value, row=None, column=None):
+        """
+        Raises ResourceLimitExceeded if value is more than the named limit
+        allows.
+        """
+        maximum = getattr(self, limit)
+        if maximum is not None and value > maximum:
+            raise ResourceLimitExceeded(limit, value, maximum, row, column)
+
+    def check_input(self, tabtext):
+        """Raises ResourceLimitExceeded if the text is too long."""
+        maximum = self.max_input_bytes
+        if maximum is None:
+            return
+        if isinstance(tabtext, unicode) and len(tabtext) <= maximum:
+            # A character takes up to 4 bytes, so only texts that might be
+            # too long are encoded.
+            if 4 * len(tabtext) <= maximum:
+                return
+            size = len(tabtext.encode('utf-8'))
+        else:
+            size = len(tabtext)
+        self.check('max_input_bytes', size)
+
+
+NO_LIMITS = ResourceLimits()
+
+UNTRUSTED_LIMITS = ResourceLimits(
+    max_input_bytes=1024 * 1024,
+    max_line_width=4096,
+    max_bar_groups=4096,
+    max_notes=1000000,
+    max_repetitions=256,
+    max_steps=5000000)
@@ -0,0 +1,122 @@
+"""
+notemap.py: Note maps and strike volumes compiled into lookup tables.
+
+Rendering a note needs its midi pitch, which depends on the note name and on
+whether the drum is struck on the rim, and its velocity, which depends on the
+strike type.  A CompiledNoteMap turns the lookup tables of a NoteEvents
+object into dense arrays once, so that rendering a note only indexes arrays.
+Compiled maps are shared by all renders that use the same map and volumes,
+in all threads: compile_note_map interns them in a registry of the process,
+so tabs that use the same map do not keep copies of it, and the tables of a
+map are compiled once, by the first thread that needs them.
+"""
+import threading
+from array import array
+
+from tabtomidi.exceptions import UnmappableNoteNamesException
+from tabtomidi.notenames import DEFAULT_NOTE_NAME_TO_NUMBER_MAP, \
+    GM_SPEC_NOTE_NAME_TO_NUMBER_MAP
+
+# Strikes on the rim ('r') are played as sticks, whatever the drum.
+RIM_STRIKE_TYPE = 'r'
+RIM_PITCH = GM_SPEC_NOTE_NAME_TO_NUMBER_MAP['Sticks']
+
+# The number of compiled maps, and of tables per map, kept for reuse.
+MAX_CACHED = 256
+
+_compiled_maps = {}
+_compiled_maps_lock = threading.Lock()
+
+
+def strike_type_volume_map(strike_volume, accent_volume, ghost_note_volume):
+    """Returns a map from the known strike types to their volumes."""
+    return {
+        'O' : accent_volume,
+        'g' : ghost_note_volume,
+        'r' : strike_volume,
+        'o' : strike_volume,
+    }
+
+
+class CompiledNoteMap(object):
+    """
+    A note name to number map and the volumes of the strike types, compiled
+    into lookup tables for the note and strike type tables of NoteEvents.
+    Strike types without a volume are played at default_volume.
+    """
+
+    def __init__(self, note_name_to_number_map, volume_map, default_volume):
+        self._pitches = dict(note_name_to_number_map)
+        self._volumes = dict(volume_map)
+        self._default_volume = default_volume
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def tables(self, note_types, strike_types):
+        """
+        Returns a (width, pitches, velocities) tuple for the given note and
+        strike type tables.  The note with note type code n and strike type
+        code s has the pitch pitches[n * width + s] and the velocity
+        velocities[s].  Raises UnmappableNoteNamesException if a note type
+        has no pitch.
+        """
+        key = (note_types, strike_types)
+        tables = self._tables.get(key)
+        if tables is None:
+            with self._lock:
+                tables = self._tables.get(key)
+                if tables is None:
+                    tables = self._compile(note_types, strike_types)
+                    if len(self._tables) >= MAX_CACHED:
+                        self._tables.clear()
+                    self._tables[key] = tables
+        return tables
+
+    def check(self, note_types):
+        """
+        Raises UnmappableNoteNamesException if one of the note types has no
+        pitch.
+        """
+        unmappable_note_names = set(note_types).difference(self._pitches)
+        if unmappable_note_names:
+            raise UnmappableNoteNamesException(unmappable_note_names)
+
+    def _compile(self, note_types, strike_types):
+        """Builds the tables returned by tables."""
+        self.check(note_types)
+        pitches = array('i')
+        for note_type in note_types:
+            pitch = self._pitches[note_type]
+            pitches.extend(RIM_PITCH if strike_type == RIM_STRIKE_TYPE
+                           else pitch for strike_type in strike_types)
+        velocities = array('i', [self._volumes.get(strike_type,
+                                                   self._default_volume)
+                                 for strike_type in strike_types])
+        return len(strike_types), pitches, velocities
+
+
+def compile_note_map(note_name_to_number_map=None, strike_volume=70,
+                     accent_volume=110, ghost_note_volume=50):
+    """
+    Returns the CompiledNoteMap for the given map and volumes, which mean the
+    same as for Tab.  Calls with equal arguments return the same object, so
+    its tables are compiled once for all of them.
+    """
+    if note_name_to_number_map is None:
+        note_name_to_number_map = DEFAULT_NOTE_NAME_TO_NUMBER_MAP
+    key = (frozenset(note_name_to_number_map.iteritems()), strike_volume,
+           accent_volume, ghost_note_volume)
+    note_map = _compiled_maps.get(key)
+    if note_map is None:
+        with _compiled_maps_lock:
+            note_map = _compiled_maps.get(key)
+            if note_map is None:
+                note_map = CompiledNoteMap(
+                    note_name_to_number_map,
+                    strike_type_volume_map(strike_volume, accent_volume,
+                                           ghost_note_volume),
+                    strike_volume)
+                if len(_compiled_maps) >= MAX_CACHED:
+                    _compiled_maps.clear()
+                _compiled_maps[key] = note_map
+    return note_map
@@ -0,0 +1,115 @@
+"""
+parallel.py: Converts one long tab to midi in several processes.
+
+The groups of bars of the tab are split into chunks of consecutive groups,
+and every chunk is walked and encoded as a TrackChunk in a worker process.
+The chunks are then joined into one track.  A chunk starts at the tick that
+the serial walk reaches at its first group, which is found by counting the
+ticks of the groups before it without parsing their notes, so the midi file
+is the same as from Tab.to_midi_bytes.
+
+Every chunk is walked within the ResourceLimits of the tab and reports the
+notes and steps of its walk.  If the chunks together need more than the
+limits allow, the tab is converted serially, which raises the same
+ResourceLimitExceeded as Tab.to_midi_bytes.
+"""
+from multiprocessing import Pool, cpu_count
+
+from tabtomidi.drumtabs import midi_notes
+from tabtomidi.exceptions import ResourceLimitExceeded
+from tabtomidi.notemap import compile_note_map
+from tabtomidi.smf import DrumTrackWriter, encode_chunk
+
+# Tabs with fewer groups of bars than this are converted serially, since
+# starting the worker processes would take longer than the conversion.
+MIN_PARALLEL_BAR_GROUPS = 250
+# Chunks per worker process, so that a slow chunk does not keep the other
+# workers idle at the end.
+CHUNKS_PER_WORKER = 4
+
+
+def render_midi(tab, workers=None, pool=None,
+                min_bar_groups=MIN_PARALLEL_BAR_GROUPS):
+    """
+    Returns the midi file of the Tab as a string, like tab.to_midi_bytes(),
+    converting parts of it in worker processes (one per cpu by default) if
+    it has at least min_bar_groups groups of bars.  If pool is given, its
+    processes are used instead of starting new ones, and workers should be
+    its number of processes.
+    """
+    if workers is None:
+        workers = cpu_count()
+    bar_groups = tab._bar_groups
+    if (pool is None and workers <= 1) or len(bar_groups) < min_bar_groups:
+        return tab.to_midi_bytes()
+    tab._check_parsed()
+    tab._check_note_names()
+    tasks = _chunk_tasks(tab, workers)
+    if pool is None:
+        pool = Pool(workers)
+        try:
+            results = pool.map(_render_chunk, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = pool.map(_render_chunk, tasks, 1)
+    try:
+        tab._limits.check('max_notes', sum(result[1] for result in results))
+        tab._limits.check('max_steps', sum(result[2] for result in results))
+    except ResourceLimitExceeded:
+        # Let the serial walk raise the error where the limit is reached.
+        return tab.to_midi_bytes()
+    chunks = [result[0] for result in results if result[0] is not None]
+    writer = DrumTrackWriter(bpm=tab._bpm, ticks_per_beat=tab.ticks_per_beat)
+    if any(previous.last_tick > chunk.first_tick
+           for previous, chunk in zip(chunks, chunks[1:])):
+        # The notes of neighbouring chunks overlap, so encode them together.
+        return tab.to_midi_bytes()
+    for chunk in chunks:
+        writer.add_chunk(chunk)
+    return writer.to_bytes()
+
+
+def _chunk_tasks(tab, workers):
+    """
+    Splits the groups of bars of the tab into chunks with about the same
+    number of ticks each and returns the arguments of _render_chunk for every
+    chunk.
+    """
+    bar_groups = tab._bar_groups
+    group_ticks = tab._bar_group_ticks
+    num_chunks = min(len(bar_groups), workers * CHUNKS_PER_WORKER)
+    ticks_per_chunk = max(1, group_ticks[-1] // num_chunks)
+    options = (tab._engine, tab.divisions_in_bar, tab.ticks_per_beat,
+               tab._per_bar_divisions, tab._limits,
+               (tab._unfiltered_note_name_to_number_map, tab._strike_volume,
+                tab._accent_volume, tab._ghost_note_volume))
+    tasks = []
+    start = 0
+    for i in xrange(len(bar_groups)):
+        if group_ticks[i + 1] - group_ticks[start] >= ticks_per_chunk or \
+                i == len(bar_groups) - 1:
+            tasks.append((bar_groups[start:i + 1], group_ticks[start]) +
+                         options)
+            start = i + 1
+    return tasks
+
+
+def _render_chunk(task):
+    """
+    Walks and encodes a chunk of groups of bars in a worker process.
+    Returns the TrackChunk, or None if the chunk has no notes, with the
+    notes_added and steps of the walk.
+    """
+    (bar_groups, tick, engine, divisions_in_bar, ticks_per_beat,
+     per_bar_divisions, limits, note_map) = task
+    builder = engine(divisions_in_bar, False, ticks_per_beat,
+                     per_bar_divisions, limits)
+    builder.tick = tick
+    for group in bar_groups:
+        builder.add_bar_group(group)
+    chunk = encode_chunk(midi_notes(builder.build(),
+                                    compile_note_map(*note_map)),
+                         builder.step_ticks)
+    return chunk, builder.notes_added, builder.steps
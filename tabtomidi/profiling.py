@@ -0,0 +1,134 @@
+"""
+profiling.py: Opt-in statistics about the phases of a conversion.
+
+Pass a ConversionStats object to Tab to record the wall time and number of
+calls of every phase, such as normalizing the text, finding the groups of
+bars, walking the notes and encoding midi, together with counts of what the
+phases processed.  Without one, Tab uses NO_STATS, whose methods do nothing,
+so instrumentation costs a few method calls per phase rather than per note.
+"""
+from collections import OrderedDict
+from timeit import default_timer
+
+
+class ConversionStats(object):
+    """
+    Collects the wall time and call count of every phase and named counters.
+
+    phases maps the name of a phase to a [calls, seconds] list and counters
+    maps counter names to their values, both in the order in which they
+    were first recorded.  Callables added with add_hook are called with the
+    name and the duration of every phase as it ends.
+
+    dedup_ratio is the fraction of the sections of bars whose notes were
+    found in the GrooveCache of the walk instead of being parsed.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        self._hooks = []
+
+    def add_hook(self, hook):
+        """Calls hook(phase_name, seconds) whenever a phase ends."""
+        self._hooks.append(hook)
+
+    def phase(self, name):
+        """Returns a context manager that times a phase with the given name."""
+        return _Phase(self, name)
+
+    def add_phase_time(self, name, seconds):
+        """Records one call of the named phase that took the given time."""
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+        for hook in self._hooks:
+            hook(name, seconds)
+
+    def count(self, name, amount=1):
+        """Adds amount to the named counter."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @property
+    def dedup_ratio(self):
+        """
+        The fraction of the sections that were reused, or None if no
+        sections were counted.
+        """
+        sections = self.counters.get('sections')
+        if not sections:
+            return None
+        return self.counters.get('sections_reused', 0) / float(sections)
+
+    def as_dict(self):
+        """
+        Returns the phases and counters as a dict that can be dumped as
+        JSON.
+        """
+        return {
+            'phases': dict((name, {'calls': calls, 'seconds': seconds})
+                           for name, (calls, seconds)
+                           in self.phases.iteritems()),
+            'counters': dict(self.counters),
+            'dedup_ratio': self.dedup_ratio,
+        }
+
+    def report(self):
+        """Returns a table of the phases and counters as a string."""
+        lines = ["%-20s %6s %10s" % ("phase", "calls", "ms")]
+        for name, (calls, seconds) in self.phases.iteritems():
+            lines.append("%-20s %6d %10.3f" % (name, calls, seconds * 1000))
+        if self.counters:
+            lines.append("")
+            lines.append("%-20s %17s" % ("counter", "value"))
+            for name, value in self.counters.iteritems():
+                lines.append("%-20s %17d" % (name, value))
+            if self.dedup_ratio is not None:
+                lines.append("%-20s %17.3f" % ("dedup_ratio",
+                                               self.dedup_ratio))
+        return "\n".join(lines) + "\n"
+
+
+class _Phase(object):
+    """Times one call of a phase of a ConversionStats."""
+    __slots__ = ('_stats', '_name', '_start')
+
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        self._start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stats.add_phase_time(self._name, default_timer() - self._start)
+        return False
+
+
+class _NullPhase(object):
+    """A phase that is not timed."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _NoStats(object):
+    """Stands in for a ConversionStats when no statistics are wanted."""
+    __slots__ = ()
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def count(self, name, amount=1):
+        pass
+
+
+NO_STATS = _NoStats()
@@ -0,0 +1,493 @@
+"""
+server.py: An HTTP service that converts tabs to midi files.
+
+POST the text of a tab (UTF-8) to /convert to get the midi file back, or a
+JSON error if the tab cannot be converted.  Tab options such as bpm can be
+passed in the query string.  GET /metrics returns request counts, the number
+of conversions in progress and latency histograms as JSON.
+
+Conversions run in a pool of worker processes.  Identical submissions that
+arrive while the same conversion is in progress share its result instead of
+converting the tab again.  Tabs are converted within the UNTRUSTED_LIMITS of
+tabtomidi.limits, so that a crafted tab cannot keep a worker busy.  When
+max_pending conversions are in progress, new ones are rejected with status
+429 so that clients back off instead of piling up requests.
+
+Usage: python -m tabtomidi.server [--host HOST] [--port PORT] [-j WORKERS]
+"""
+import argparse
+import errno
+import itertools
+import json
+import os
+import sys
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import OrderedDict
+from multiprocessing import Pool
+from multiprocessing.queues import SimpleQueue
+from timeit import default_timer
+from urlparse import parse_qs, urlparse
+
+from tabtomidi.cache import cache_key
+from tabtomidi.drumtabs import Tab
+from tabtomidi.exceptions import ResourceLimitExceeded, \
+    TabParsingException, UnmappableNoteNamesException
+from tabtomidi.limits import UNTRUSTED_LIMITS
+
+# The Tab options that can be passed in the query string.
+QUERY_OPTIONS = ('bpm', 'strike_volume', 'accent_volume', 'ghost_note_volume')
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0,
+                   2.0, 5.0, 10.0, 30.0)
+
+
+class ServiceError(Exception):
+    """
+    Raised when a request is not converted.  status is the HTTP status code
+    of the response and error the dict describing the problem.
+    """
+
+    def __init__(self, status, message, **details):
+        Exception.__init__(self, message)
+        self.status = status
+        self.error = dict(details, message=message)
+
+
+def error_dict(exception):
+    """Returns the JSON-serializable description of a TabParsingException."""
+    error = {
+        'type': type(exception).__name__,
+        'message': str(exception),
+        'row': exception.row,
+        'column': exception.column,
+    }
+    if isinstance(exception, UnmappableNoteNamesException):
+        error['note_names'] = sorted(exception.note_names)
+    elif isinstance(exception, ResourceLimitExceeded):
+        error['limit'] = exception.limit
+    return error
+
+
+def convert_tab(tabtext, tab_options):
+    """
+    Converts a tab in a worker process.  Returns a (status, result, seconds)
+    tuple, where result is the midi file if status is 200 and an error dict
+    otherwise.
+    """
+    start = default_timer()
+    try:
+        midi = Tab(tabtext, limits=UNTRUSTED_LIMITS,
+                   **tab_options).to_midi_bytes()
+    except TabParsingException as e:
+        return 422, error_dict(e), default_timer() - start
+    except Exception as e:
+        return 500, {'type': type(e).__name__, 'message': str(e)}, \
+            default_timer() - start
+    return 200, midi, default_timer() - start
+
+
+# The queue on which a worker process reports the conversions it starts.
+_started = None
+
+
+def _init_worker(started):
+    """Keeps the queue of started conversions in a new worker process."""
+    global _started
+    _started = started
+
+
+def _run_conversion(convert, number, tabtext, tab_options):
+    """
+    Calls convert in a worker process, turning the exceptions that it raises
+    into outcomes with status 500.  The pool only calls back with results, so
+    a conversion that raised would never be finished otherwise.  The number
+    of the conversion and the pid of the worker are reported first, so that
+    the service can tell if the worker dies.
+    """
+    _started.put((number, os.getpid()))
+    start = default_timer()
+    try:
+        return convert(tabtext, tab_options)
+    except Exception as e:
+        return 500, {'type': type(e).__name__, 'message': str(e)}, \
+            default_timer() - start
+
+
+class LatencyHistogram(object):
+    """Counts durations in the buckets of LATENCY_BUCKETS."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, seconds):
+        """Records one duration."""
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and \
+                seconds > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def as_dict(self):
+        """
+        Returns the histogram as a dict that can be dumped as JSON.  Each
+        bucket counts the durations up to its bound that are longer than the
+        bound of the bucket before it.
+        """
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+        return {
+            'buckets': OrderedDict(zip(bounds, self.counts)),
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+def _process_exists(pid):
+    """Returns whether a process with the pid exists."""
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+class _Conversion(object):
+    """
+    A conversion in progress.  The requests for it wait for done, rather
+    than for the AsyncResult, which only wakes up one of them.  number tells
+    it apart from other conversions of the same tab and pid is the process
+    of the worker converting it, once it has started.
+    """
+    __slots__ = ('done', 'outcome', 'number', 'pid')
+
+    def __init__(self, number):
+        self.done = threading.Event()
+        self.outcome = None
+        self.number = number
+        self.pid = None
+
+
+class ConversionService(object):
+    """
+    Converts tabs in a pool of worker processes, merging identical
+    submissions and bounding the number of conversions in progress.
+
+    workers is the number of worker processes (one per cpu by default).  At
+    most max_pending different conversions are in progress at a time and a
+    request waits at most timeout seconds for its conversion, which is still
+    counted as in progress until it ends.  A conversion whose worker died
+    never ends; when a request times out or the service is full, such
+    conversions are found and end with status 500.  convert is called in the
+    workers like convert_tab.
+    """
+
+    def __init__(self, workers=None, max_pending=64, timeout=10.0,
+                 convert=convert_tab):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._convert = convert
+        self._started = SimpleQueue()
+        self._pool = Pool(workers, _init_worker, (self._started,))
+        self._numbers = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._statuses = {}
+        self._coalesced = 0
+        self._max_queue_depth = 0
+        self._request_seconds = LatencyHistogram()
+        self._conversion_seconds = LatencyHistogram()
+
+    def convert(self, tabtext, **tab_options):
+        """
+        Returns the midi file for the tab text.  Raises a ServiceError if
+        the tab cannot be converted, the service is busy or the conversion
+        takes too long.
+        """
+        start = default_timer()
+        status = 200
+        try:
+            return self._wait(*self._submit(tabtext, tab_options))
+        except ServiceError as e:
+            status = e.status
+            raise
+        finally:
+            self.record(status, default_timer() - start)
+
+    def record(self, status, seconds):
+        """Records a response in the metrics."""
+        with self._lock:
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+            self._request_seconds.add(seconds)
+
+    def metrics(self):
+        """Returns the metrics of the service as a dict."""
+        with self._lock:
+            return {
+                'responses': dict((str(status), count) for status, count
+                                  in sorted(self._statuses.iteritems())),
+                'coalesced': self._coalesced,
+                'queue_depth': len(self._pending),
+                'max_queue_depth': self._max_queue_depth,
+                'max_pending': self.max_pending,
+                'request_seconds': self._request_seconds.as_dict(),
+                'conversion_seconds': self._conversion_seconds.as_dict(),
+            }
+
+    def close(self):
+        """Stops the worker processes."""
+        self._pool.terminate()
+        self._pool.join()
+
+    def _submit(self, tabtext, tab_options):
+        """
+        Returns the cache key and the _Conversion of the tab, starting it
+        unless an identical conversion is in progress.
+        """
+        key = cache_key(tabtext, **tab_options)
+        with self._lock:
+            conversion = self._pending.get(key)
+            if conversion is not None:
+                self._coalesced += 1
+                return key, conversion
+            if len(self._pending) >= self.max_pending:
+                self._end_lost_conversions()
+            if len(self._pending) >= self.max_pending:
+                raise ServiceError(429, "Too many conversions in progress.")
+            conversion = self._pending[key] = \
+                _Conversion(next(self._numbers))
+            self._max_queue_depth = max(self._max_queue_depth,
+                                        len(self._pending))
+        self._pool.apply_async(
+            _run_conversion,
+            (self._convert, conversion.number, tabtext, tab_options),
+            callback=lambda outcome: self._finished(key, conversion, outcome))
+        return key, conversion
+
+    def _end(self, key, conversion, outcome):
+        """
+        Stops counting the conversion as in progress and wakes up the
+        requests waiting for it, unless it has ended already.  Called with
+        the lock held.
+        """
+        if self._pending.get(key) is not conversion:
+            return
+        del self._pending[key]
+        conversion.outcome = outcome
+        conversion.done.set()
+
+    def _finished(self, key, conversion, outcome):
+        """Called in the pool's result thread when a conversion ends."""
+        with self._lock:
+            self._end(key, conversion, outcome)
+            self._conversion_seconds.add(outcome[2])
+            # Keep the queue short, so that workers never wait to write.
+            self._read_started()
+
+    def _read_started(self):
+        """
+        Notes the worker of every conversion that started since the last
+        call.  Called with the lock held.
+        """
+        started = {}
+        while not self._started.empty():
+            number, pid = self._started.get()
+            started[number] = pid
+        if started:
+            for conversion in self._pending.itervalues():
+                if conversion.number in started:
+                    conversion.pid = started[conversion.number]
+
+    def _end_lost_conversions(self):
+        """
+        Ends the conversions whose worker died with status 500.  Called with
+        the lock held.
+        """
+        self._read_started()
+        for key, conversion in self._pending.items():
+            if conversion.pid is not None and \
+                    not _process_exists(conversion.pid):
+                self._end(key, conversion, (500, {
+                    'type': 'WorkerDied',
+                    'message': "The worker converting the tab died."}, 0.0))
+
+    def _wait(self, key, conversion):
+        """Waits for the conversion and returns its midi file."""
+        if not conversion.done.wait(self.timeout):
+            with self._lock:
+                self._end_lost_conversions()
+            if not conversion.done.is_set():
+                raise ServiceError(504, "The conversion took longer than "
+                                   "%gs." % self.timeout)
+        status, result, _ = conversion.outcome
+        if status != 200:
+            # The error dict is shared by all requests for the conversion.
+            error = dict(result)
+            raise ServiceError(status, error.pop('message'), **error)
+        return result
+
+
+class ConversionServer(ThreadingMixIn, HTTPServer):
+    """
+    A threaded HTTP server for a ConversionService.  Request bodies larger
+    than max_request_bytes are rejected with status 413.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, service, max_request_bytes=1024 * 1024,
+                 verbose=False):
+        HTTPServer.__init__(self, address, _RequestHandler)
+        self.service = service
+        self.max_request_bytes = max_request_bytes
+        self.verbose = verbose
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.service.close()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Handles the requests of a ConversionServer."""
+
+    # Clients that stop sending the body are disconnected after this long.
+    timeout = 30
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/metrics':
+            self._send_error(ServiceError(404, "Not found."))
+            return
+        self._send(200, 'application/json',
+                   json.dumps(self.server.service.metrics(), indent=2))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/convert':
+            self._send_error(ServiceError(404, "Not found."))
+            return
+        service = self.server.service
+        start = default_timer()
+        try:
+            tab_options = self._tab_options(url.query)
+            tabtext = self._read_body()
+        except ServiceError as e:
+            service.record(e.status, default_timer() - start)
+            self._send_error(e)
+            return
+        try:
+            midi = service.convert(tabtext, **tab_options)
+        except ServiceError as e:
+            self._send_error(e)
+            return
+        self._send(200, 'audio/midi', midi)
+
+    def _tab_options(self, query):
+        """Returns the Tab options passed in the query string."""
+        tab_options = {}
+        for name, values in parse_qs(query).iteritems():
+            if name not in QUERY_OPTIONS:
+                raise ServiceError(400, "Unknown option: %s" % name)
+            try:
+                tab_options[name] = int(values[-1])
+            except ValueError:
+                raise ServiceError(400, "Option %s must be an integer." %
+                                   name)
+        return tab_options
+
+    def _read_body(self):
+        """Reads the tab text sent in the body of the request."""
+        length = self.headers.getheader('content-length')
+        if length is None:
+            raise ServiceError(411, "Content-Length is required.")
+        try:
+            length = int(length)
+        except ValueError:
+            raise ServiceError(400, "Invalid Content-Length.")
+        if length < 0:
+            raise ServiceError(400, "Invalid Content-Length.")
+        if length > self.server.max_request_bytes:
+            # Read the body without keeping it, so that the client gets the
+            # response instead of a reset connection.
+            while length > 0:
+                chunk = self.rfile.read(min(length, 64 * 1024))
+                if not chunk:
+                    break
+                length -= len(chunk)
+            raise ServiceError(413, "Tabs are limited to %d bytes." %
+                               self.server.max_request_bytes)
+        body = self.rfile.read(length)
+        try:
+            return body.decode('utf-8')
+        except UnicodeDecodeError:
+            raise ServiceError(400, "The tab is not valid UTF-8.")
+
+    def _send_error(self, error):
+        self._send(error.status, 'application/json',
+                   json.dumps({'error': error.error}))
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def make_server(host='127.0.0.1', port=0, workers=None, max_pending=64,
+                timeout=10.0, max_request_bytes=1024 * 1024, verbose=False):
+    """
+    Returns a ConversionServer listening on the given address.  Port 0 picks
+    a free port, which can be read from server.server_address.
+    """
+    service = ConversionService(workers, max_pending, timeout)
+    try:
+        return ConversionServer((host, port), service, max_request_bytes,
+                                verbose)
+    except:
+        service.close()
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve tab to midi conversions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1",
+        help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000,
+        help="port to listen on (default: 8000)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+        help="number of worker processes (default: one per cpu)")
+    parser.add_argument("--max-pending", type=int, default=64,
+        help="conversions in progress before requests are rejected with "
+             "status 429 (default: 64)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+        help="seconds a request waits for its conversion (default: 10)")
+    parser.add_argument("--max-bytes", type=int, default=1024 * 1024,
+        help="largest tab accepted, in bytes (default: 1 MiB)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+        help="log every request")
+    args = parser.parse_args(argv)
+    server = make_server(args.host, args.port, args.workers, args.max_pending,
+                         args.timeout, args.max_bytes, args.verbose)
+    sys.stderr.write("Serving on http://%s:%d/\n" % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+smf.py: A small Standard MIDI File writer specialized for drum tracks.
+
+The writer encodes a single track straight into a bytearray.  Notes have to
+be added in time order, which is the order in which Tab produces them, so no
+events need to be buffered or sorted apart from the pending note-offs.
+"""
+import struct
+from array import array
+from collections import namedtuple
+from heapq import heappush, heappop
+from itertools import izip
+
+# midiutil's resolution, which the expected midi files in the tests use.
+TICKS_PER_BEAT = 128
+# The division field of the header has 15 bits for ticks per beat.
+MAX_TICKS_PER_BEAT = 0x7FFF
+# Channel 10 (9 when counting from zero) is reserved for percussion.
+DRUM_CHANNEL = 9
+
+
+class TrackChunk(namedtuple('TrackChunk', ['first_tick', 'last_tick',
+                                           'data'])):
+    """
+    Encoded note events of a part of a track, such as a group of bars, that
+    can be stored and added to a DrumTrackWriter with add_chunk.  data leaves
+    out the delta time of the first event, which depends on the events before
+    the chunk.
+    """
+    __slots__ = ()
+
+
+def tempo_bytes(bpm):
+    """
+    Returns the three bytes of a tempo event, which gives the tempo in
+    microseconds per quarter note.
+    """
+    return struct.pack('>I', int(60000000 / bpm))[1:]
+
+
+def write_var_length(data, value):
+    """Appends value to the bytearray as a MIDI variable-length quantity."""
+    if value < 0x80:
+        data.append(value)
+        return
+    encoded = [value & 0x7F]
+    value >>= 7
+    while value:
+        encoded.append(0x80 | (value & 0x7F))
+        value >>= 7
+    encoded.reverse()
+    data.extend(encoded)
+
+
+class DrumTrackWriter(object):
+    """
+    Encodes a one-track Standard MIDI File with a track name, a tempo and the
+    notes of a drum part.
+
+    Notes are added with add_notes in nondecreasing time order.  A note that
+    is struck again at the same time as an identical note is dropped, like
+    midiutil does when removing duplicates.  Calling to_bytes or write closes
+    the track.
+    """
+
+    def __init__(self, bpm=100, ticks_per_beat=TICKS_PER_BEAT, track_name="",
+                 channel=DRUM_CHANNEL, file_format=1):
+        if file_format not in (0, 1):
+            raise ValueError("Only format 0 and format 1 files are supported.")
+        self.ticks_per_beat = ticks_per_beat
+        self._file_format = file_format
+        self._note_on = 0x90 | channel
+        self._note_off = 0x80 | channel
+        self._data = bytearray()
+        self._tick = 0
+        self._last_note_tick = -1
+        self._pitches_at_last_tick = set()
+        self._pending_note_offs = []
+        self._sequence = 0
+        self._closed = False
+        if isinstance(track_name, unicode):
+            track_name = track_name.encode('utf-8')
+        self._data.extend(b'\x00\xff\x03')
+        write_var_length(self._data, len(track_name))
+        self._data.extend(track_name)
+        self._data.extend(b'\x00\xff\x51\x03')
+        self._tempo_offset = len(self._data)
+        self._data.extend(tempo_bytes(bpm))
+
+    def add_notes(self, notes, duration):
+        """
+        Adds (tick, pitch, velocity) tuples that last the given number of
+        ticks.
+        """
+        if self._closed:
+            raise ValueError("Cannot add notes to a closed track.")
+        data = self._data
+        append = data.append
+        pending = self._pending_note_offs
+        note_on = self._note_on
+        note_off = self._note_off
+        current_tick = self._tick
+        last_note_tick = self._last_note_tick
+        pitches = self._pitches_at_last_tick
+        sequence = self._sequence
+        for tick, pitch, velocity in notes:
+            if tick < last_note_tick:
+                raise ValueError("Notes must be added in time order.")
+            # Note-offs come before note-ons that happen at the same time.
+            while pending and pending[0][0] <= tick:
+                off_tick, _, off_pitch, off_velocity = heappop(pending)
+                delta = off_tick - current_tick
+                if delta < 0x80:
+                    append(delta)
+                else:
+                    write_var_length(data, delta)
+                append(note_off)
+                append(off_pitch)
+                append(off_velocity)
+                current_tick = off_tick
+            if tick != last_note_tick:
+                last_note_tick = tick
+                pitches = set()
+            elif pitch in pitches:
+                continue
+            pitches.add(pitch)
+            delta = tick - current_tick
+            if delta < 0x80:
+                append(delta)
+            else:
+                write_var_length(data, delta)
+            append(note_on)
+            append(pitch)
+            append(velocity)
+            current_tick = tick
+            # The sequence number keeps simultaneous note-offs in order.
+            sequence += 1
+            heappush(pending, (tick + duration, sequence, pitch, velocity))
+        self._sequence = sequence
+        self._tick = current_tick
+        self._last_note_tick = last_note_tick
+        self._pitches_at_last_tick = pitches
+
+    def add_chunk(self, chunk, offset=0):
+        """
+        Adds a TrackChunk, with its events moved offset ticks later.  The
+        chunk has to start at or after the last event so far and no
+        note-offs may be outstanding.
+        """
+        if self._closed:
+            raise ValueError("Cannot add notes to a closed track.")
+        first_tick = chunk.first_tick + offset
+        if self._pending_note_offs or first_tick < self._tick:
+            raise ValueError("Notes must be added in time order.")
+        write_var_length(self._data, first_tick - self._tick)
+        self._data.extend(chunk.data)
+        self._tick = self._last_note_tick = chunk.last_tick + offset
+        self._pitches_at_last_tick = set()
+
+    def _write_note_offs(self):
+        """Writes the outstanding note-offs."""
+        data = self._data
+        pending = self._pending_note_offs
+        while pending:
+            off_tick, _, off_pitch, off_velocity = heappop(pending)
+            write_var_length(data, off_tick - self._tick)
+            data.append(self._note_off)
+            data.append(off_pitch)
+            data.append(off_velocity)
+            self._tick = off_tick
+
+    def close(self):
+        """Writes the outstanding note-offs and the end of track event."""
+        if self._closed:
+            return
+        self._write_note_offs()
+        self._data.extend(b'\x00\xff\x2f\x00')
+        self._closed = True
+
+    def to_bytes(self):
+        """Closes the track and returns the complete midi file as a string."""
+        self.close()
+        return self._header(len(self._data)) + bytes(self._data)
+
+    def _header(self, track_length):
+        """Returns the file header and the header of the track chunk."""
+        return (b'MThd' + struct.pack('>IHHH', 6, self._file_format, 1,
+                                      self.ticks_per_beat) +
+                b'MTrk' + struct.pack('>I', track_length))
+
+    def write(self, file_object):
+        """Closes the track and writes the midi file to the file object."""
+        file_object.write(self.to_bytes())
+
+
+def encode_chunk(notes, duration, channel=DRUM_CHANNEL):
+    """
+    Encodes (tick, pitch, velocity) tuples that last the given number of
+    ticks, and their note-offs, as a TrackChunk.  Returns None if there are
+    no notes.
+    """
+    writer = DrumTrackWriter(channel=channel)
+    start = len(writer._data)
+    writer.add_notes(notes, duration)
+    writer._write_note_offs()
+    data = writer._data
+    if len(data) == start:
+        return None
+    # Leave out the delta time of the first event, which is its tick.
+    first_tick = 0
+    while True:
+        byte = data[start]
+        start += 1
+        first_tick = (first_tick << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            break
+    return TrackChunk(first_tick, writer._tick, bytes(data[start:]))
+
+
+class TrackTemplate(object):
+    """
+    A midi file encoded once and written many times with other tempos and
+    velocities.
+
+    The notes are (tick, pitch, key) tuples, where key is a number from 0 to
+    255 that is encoded in place of the velocity.  render replaces the tempo
+    and the velocity byte of every note-on and note-off, so no notes are
+    encoded again.  Velocities do not change which notes are dropped as
+    duplicates or the order of the events, so the result is the same as
+    encoding the notes with their velocities.
+    """
+
+    def __init__(self, notes, duration, ticks_per_beat=TICKS_PER_BEAT,
+                 track_name="", channel=DRUM_CHANNEL, file_format=1):
+        writer = DrumTrackWriter(ticks_per_beat=ticks_per_beat,
+                                 track_name=track_name, channel=channel,
+                                 file_format=file_format)
+        writer.add_notes(notes, duration)
+        writer.close()
+        self._data = writer._data
+        self._header = writer._header(len(writer._data))
+        self._tempo_offset = writer._tempo_offset
+        self._velocity_offsets = _velocity_offsets(
+            writer._data, writer._tempo_offset + 3)
+        self._keys = bytearray(writer._data[offset]
+                               for offset in self._velocity_offsets)
+
+    def __len__(self):
+        """The number of note-on and note-off events."""
+        return len(self._velocity_offsets)
+
+    def render(self, bpm, velocities):
+        """
+        Returns the midi file as a string, with the tempo in beats per minute
+        and every note played at velocities[key].
+        """
+        data = bytearray(self._data)
+        tempo_offset = self._tempo_offset
+        data[tempo_offset:tempo_offset + 3] = tempo_bytes(bpm)
+        for offset, key in izip(self._velocity_offsets, self._keys):
+            data[offset] = velocities[key]
+        return self._header + bytes(data)
+
+
+def _velocity_offsets(data, start):
+    """
+    Returns the offsets of the velocity bytes of the note events in the track
+    data after start, up to the end of track event.
+    """
+    offsets = array('L')
+    i = start
+    while True:
+        # Skip the delta time.
+        while data[i] >= 0x80:
+            i += 1
+        i += 1
+        if data[i] == 0xFF:
+            return offsets
+        # Note-ons and note-offs are written without running status.
+        offsets.append(i + 2)
+        i += 3
+
+
+class StreamingDrumTrackWriter(DrumTrackWriter):
+    """
+    A DrumTrackWriter that writes the track to a file object while notes are
+    being added instead of keeping the whole track in memory.
+
+    Every call to flush writes the events encoded so far.  close writes the
+    rest of the track and then seeks back to fill in the track length.  If
+    the file object cannot seek, the track is kept in memory and written by
+    close instead.
+    """
+
+    def __init__(self, file_object, **kwargs):
+        DrumTrackWriter.__init__(self, **kwargs)
+        self._file = file_object
+        self._track_length = 0
+        try:
+            self._start = file_object.tell()
+        except (AttributeError, IOError, OSError):
+            self._start = None
+        else:
+            # The track length is not known yet and is patched by close.
+            file_object.write(self._header(0))
+
+    def flush(self):
+        """Writes the events encoded so far to the file object."""
+        if self._start is None or not self._data:
+            return
+        self._file.write(bytes(self._data))
+        self._track_length += len(self._data)
+        del self._data[:]
+
+    def close(self):
+        """Writes the end of the track and fills in the track length."""
+        if self._closed:
+            return
+        DrumTrackWriter.close(self)
+        if self._start is None:
+            self._file.write(self._header(len(self._data)) +
+                             bytes(self._data))
+            return
+        self.flush()
+        end = self._file.tell()
+        self._file.seek(self._start + 18)
+        self._file.write(struct.pack('>I', self._track_length))
+        self._file.seek(end)
+
+    def to_bytes(self):
+        raise TypeError("A streaming writer writes to its file object.")
+
+    def write(self, file_object):
+        raise TypeError("A streaming writer writes to its file object.")
@@ -0,0 +1,73 @@
+"""
+streaming.py: Converts tabs of any length with bounded memory.
+
+Lines are read from any iterable, such as an open file, and every group of
+bars is turned into notes and midi events as soon as its last row has been
+read.  Peak memory therefore depends on the largest group of bars rather than
+on the size of the tab.  To keep it that way, the GrooveCache of the walk is
+cleared once it holds MAX_GROOVES Segments, so only grooves that are written
+out again within a while of each other are parsed once.
+"""
+from tabtomidi.drumtabs import midi_notes
+from tabtomidi.events import MAX_GROOVES, NoteEventsBuilder
+from tabtomidi.exceptions import TabParsingException
+from tabtomidi.lexer import calculate_divisions_in_bar, iter_bar_groups, \
+    iter_normalized_lines
+from tabtomidi.notemap import compile_note_map
+from tabtomidi.smf import StreamingDrumTrackWriter
+
+
+def _iter_bar_group_events(lines, ignore_repetition):
+    """
+    Yields the NoteEventsBuilder and the NoteEvents of every group of bars
+    read from the lines.
+    """
+    builder = None
+    for group in iter_bar_groups(iter_normalized_lines(lines)):
+        if builder is None:
+            # Like Tab, use the divisions in the first bar for all bars.
+            builder = NoteEventsBuilder(calculate_divisions_in_bar(group),
+                                        ignore_repetition)
+        builder.add_bar_group(group)
+        yield builder, builder.build()
+        if len(builder.grooves) >= MAX_GROOVES:
+            builder.grooves.clear()
+    if builder is None:
+        raise TabParsingException("Could not find any bars in input text.")
+
+
+def iter_note_events(lines, ignore_repetition=False):
+    """
+    Yields a NoteEvents object with the notes of every group of bars read
+    from the lines, in order.
+    """
+    for _, events in _iter_bar_group_events(lines, ignore_repetition):
+        yield events
+
+
+def stream_midi(lines, file_object, note_name_to_number_map=None,
+                bpm=100, strike_volume=70, accent_volume=110,
+                ghost_note_volume=50):
+    """
+    Converts the tab read from the lines to midi written to file_object and
+    returns the number of notes.  The options mean the same as for Tab.
+
+    Groups of bars are written as they are parsed.  If a group turns out to
+    be unparsable or contains unmappable note names, the exception is raised
+    after the preceding groups have been written.
+    """
+    note_map = compile_note_map(note_name_to_number_map, strike_volume,
+                                accent_volume, ghost_note_volume)
+    writer = None
+    num_notes = 0
+    for builder, events in _iter_bar_group_events(lines, False):
+        # Compiling the tables checks the note names of the group.
+        note_map.tables(events.note_types, events.strike_types)
+        if writer is None:
+            writer = StreamingDrumTrackWriter(
+                file_object, bpm=bpm, ticks_per_beat=builder.ticks_per_beat)
+        writer.add_notes(midi_notes(events, note_map), builder.step_ticks)
+        writer.flush()
+        num_notes += len(events)
+    writer.close()
+    return num_notes
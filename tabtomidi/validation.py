@@ -0,0 +1,101 @@
+"""
+validation.py: Checks whether a tab can be converted without converting it.
+
+validate lexes the tab and reads the characters of its bars, but does not walk
+the notes or expand repetitions, so it answers "can this tab be converted, and
+which note names and strike types does it use?" faster than a conversion.
+"""
+from collections import namedtuple
+
+from tabtomidi.events import iter_sections
+from tabtomidi.exceptions import TabParsingException
+from tabtomidi.lexer import calculate_divisions_in_bar, iter_bar_groups, \
+    normalize_lines
+from tabtomidi.notemap import strike_type_volume_map
+from tabtomidi.notenames import DEFAULT_NOTE_NAME_TO_NUMBER_MAP
+
+# The strike types that have a volume of their own.
+KNOWN_STRIKE_TYPES = frozenset(strike_type_volume_map(None, None, None))
+
+
+class ValidationResult(namedtuple('ValidationResult',
+                                  ['error', 'note_types',
+                                   'unmappable_note_names',
+                                   'unknown_strike_types'])):
+    """
+    The outcome of validate.  error is the first TabParsingException that
+    keeps the tab from being parsed, with its row and column, or None.  The
+    sets of note types, unmappable note names and unknown strike types
+    (which are played at the strike volume) cover the groups of bars before
+    the error.
+    """
+    __slots__ = ()
+
+    @property
+    def valid(self):
+        """True if the tab can be converted to midi."""
+        return self.error is None and not self.unmappable_note_names
+
+
+def validate(tabtext, note_name_to_number_map=None):
+    """
+    Returns a ValidationResult for the tab text.  Lexing stops at the first
+    group of bars that cannot be parsed.
+    """
+    if note_name_to_number_map is None:
+        note_name_to_number_map = DEFAULT_NOTE_NAME_TO_NUMBER_MAP
+    note_types = set()
+    strike_types = set()
+    error = None
+    divisions_in_bar = None
+    try:
+        for group in iter_bar_groups(normalize_lines(tabtext)):
+            if divisions_in_bar is None:
+                divisions_in_bar = calculate_divisions_in_bar(group)
+            note_types.update(group.note_types)
+            _add_strike_types(group, divisions_in_bar, strike_types)
+        if divisions_in_bar is None:
+            raise TabParsingException("Could not find any bars in input text.")
+    except TabParsingException as e:
+        error = e
+    strike_types.discard('-')
+    strike_types.discard('|')
+    return ValidationResult(
+        error, note_types,
+        note_types.difference(note_name_to_number_map.keys()),
+        strike_types.difference(KNOWN_STRIKE_TYPES))
+
+
+def _add_strike_types(group, divisions_in_bar, strike_types):
+    """
+    Adds the characters in the bars of the group to strike_types.  The bars
+    are found the same way as when the notes are walked, so characters
+    outside of them, such as trailing text, are left out.  Raises a
+    TabParsingException if walking the notes would run past the end of a
+    row.
+    """
+    for c, num_cols, _ in iter_sections(group, divisions_in_bar, None):
+        for d, row in enumerate(group.rows):
+            _check_row_length(group, d, c, num_cols)
+            strike_types.update(row[c+1:c+1+num_cols])
+    if group.repetition_row is not None:
+        # Repeated sections may be longer than the bars below them.
+        for c, num_cols, _ in iter_sections(group, divisions_in_bar,
+                                            group.repetition_row):
+            for d in xrange(len(group.rows)):
+                _check_row_length(group, d, c, num_cols)
+
+
+def _check_row_length(group, d, c, num_cols):
+    """
+    Raises a TabParsingException if the section of row d after column c is
+    cut short by the end of the row, which is only allowed when the row ends
+    with a vertical line.
+    """
+    row = group.rows[d]
+    if c + num_cols < len(row) or row[-1] == '|':
+        return
+    for column in xrange(max(c + 1, len(row)), c + num_cols + 1):
+        if not group.is_vertical_line(column):
+            raise TabParsingException("Row ends inside a bar",
+                                      group.note_row + d, len(row))
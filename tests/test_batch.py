@@ -0,0 +1,70 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import shutil
+from tabtomidi.batch import convert_many, find_tab_files
+
+
+def make_corpus(tmpdir):
+    corpus = tmpdir.mkdir("corpus")
+    shutil.copy('testdata/simple_4_4_beat.txt', corpus.strpath)
+    shutil.copy('testdata/repetition_4x.txt', corpus.mkdir("sub").strpath)
+    corpus.join("broken.txt").write("HH |o---o---o---\n")
+    return corpus
+
+
+def test_directories_keep_their_layout(tmpdir):
+    corpus = make_corpus(tmpdir)
+    pairs = find_tab_files([corpus.strpath], "out")
+    assert [os.path.relpath(m, "out") for _, m in pairs] == \
+        ["broken.mid", "simple_4_4_beat.mid", os.path.join("sub",
+                                                           "repetition_4x.mid")]
+
+
+def test_failures_are_reported_without_aborting(tmpdir):
+    corpus = make_corpus(tmpdir)
+    result = convert_many([corpus.strpath], tmpdir.join("out").strpath,
+                          workers=1)
+    assert len(result.results) == 3
+    failure, = result.failures
+    assert failure.tab_filename.endswith("broken.txt")
+    assert (failure.row, failure.column) == (0, 4)
+    assert "broken.txt:0:4: Could not find end vertical bar." in str(failure)
+    assert result.num_notes == 48
+    assert result.summary().startswith("Converted 2 of 3 tabs")
+
+
+def test_results_do_not_depend_on_the_number_of_workers(tmpdir):
+    corpus = make_corpus(tmpdir)
+    serial = convert_many([corpus.join("*.txt").strpath, corpus.strpath],
+                          tmpdir.join("serial").strpath, workers=1)
+    parallel = convert_many([corpus.join("*.txt").strpath, corpus.strpath],
+                            tmpdir.join("parallel").strpath, workers=3,
+                            chunksize=1)
+    assert [(r.tab_filename, r.num_notes, r.error) for r in serial.results] \
+        == [(r.tab_filename, r.num_notes, r.error) for r in parallel.results]
+    for result in serial.results[1:]:
+        parallel_midi = result.midi_filename.replace("serial", "parallel")
+        assert open(result.midi_filename, "rb").read() == \
+            open(parallel_midi, "rb").read()
+
+
+def test_tabs_with_the_same_output_file_are_not_converted(tmpdir):
+    corpus = make_corpus(tmpdir)
+    other = tmpdir.mkdir("other")
+    shutil.copy('testdata/repetition_4x.txt',
+                other.join("simple_4_4_beat.txt").strpath)
+    out = tmpdir.join("out")
+    for workers in (1, 2):
+        result = convert_many([corpus.join("*.txt").strpath,
+                               other.join("*.txt").strpath], out.strpath,
+                              workers=workers)
+        assert [r.tab_filename for r in result.failures] == [
+            corpus.join("broken.txt").strpath,
+            corpus.join("simple_4_4_beat.txt").strpath,
+            other.join("simple_4_4_beat.txt").strpath]
+        assert "would also be written for %s" % \
+            other.join("simple_4_4_beat.txt").strpath in \
+            result.failures[1].error
+        assert not out.join("simple_4_4_beat.mid").check()
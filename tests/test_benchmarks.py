@@ -0,0 +1,56 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+from cStringIO import StringIO
+from benchmarks.engines import compare_corpus
+from benchmarks.generator import generate_tab
+from benchmarks.suite import compare, run_case
+from benchmarks.threads import run_threads
+from benchmarks.worst_case import run_cases
+from tabtomidi import Tab
+
+
+def test_generated_tabs_are_reproducible_and_parsable():
+    text = generate_tab(bars=10, drums=4, divisions=12, bars_per_line=3,
+                        repeat_density=0.5, count_rows=True,
+                        pipe_lookalikes=0.5, seed=1)
+    assert text == generate_tab(bars=10, drums=4, divisions=12,
+                                bars_per_line=3, repeat_density=0.5,
+                                count_rows=True, pipe_lookalikes=0.5, seed=1)
+    assert text != generate_tab(bars=10, seed=2)
+    tab = Tab(text)
+    assert tab.divisions_in_bar == 12
+    assert tab.note_types == set(['HH', 'S', 'B', 'C'])
+    assert len(tab._bar_rows) == 4
+
+
+def test_compare_reports_slower_phases():
+    result = run_case(dict(bars=8), repeat=1)
+    result['phases'] = dict.fromkeys(result['phases'], 0.01)
+    baseline = {'cases': {'tiny': result}}
+    slower = dict(result, phases=dict.fromkeys(result['phases'], 0.02))
+    out = StringIO()
+    assert compare({'tiny': result}, baseline, 0.5, 0) == 0
+    assert compare({'tiny': slower}, baseline, 0.5, 0, out) == 5
+    assert "tiny init regressed" in out.getvalue()
+
+
+def test_engine_comparison_of_reference_with_itself():
+    comparison = compare_corpus('testdata', 'reference', repeat=1)
+    assert comparison.tabs > 0
+    assert comparison.mismatches == []
+    assert "0 mismatches" in comparison.summary()
+
+
+def test_worst_cases_hit_their_limits():
+    for name, expected, seconds, exceeded in run_cases():
+        assert exceeded == expected, name
+
+
+def test_threads_sharing_tabs_convert_them_correctly():
+    texts = [generate_tab(bars=8, seed=seed) for seed in xrange(3)]
+    expected = [dict((bpm, Tab(text, bpm=bpm).to_midi_bytes())
+                     for bpm in (60, 90)) for text in texts]
+    assert run_threads(texts, expected, 4, 2) > 0
+    assert run_threads(texts, expected, 2, 1, shared=False) > 0
@@ -0,0 +1,57 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import py.test
+from tabtomidi import Tab
+from tabtomidi import cache
+from tabtomidi.cache import ConversionCache, cache_key
+
+SIMPLE = codecs.open('testdata/simple_4_4_beat.txt', "r", "utf-8").read()
+REPEATED = codecs.open('testdata/repetition_4x.txt', "r", "utf-8").read()
+
+
+def test_key_depends_on_normalized_text_and_options():
+    assert cache_key(SIMPLE) == cache_key(SIMPLE.replace("\n", "  \r\n"))
+    assert cache_key(SIMPLE) == cache_key(SIMPLE, bpm=100)
+    assert cache_key(SIMPLE) != cache_key(SIMPLE, bpm=120)
+    assert cache_key(SIMPLE) != cache_key(SIMPLE,
+                                          note_name_to_number_map={'HH': 42})
+    with py.test.raises(TypeError):
+        cache_key(SIMPLE, tempo=120)
+
+
+def test_memory_cache_hits_and_evicts():
+    conversions = ConversionCache(max_entries=1)
+    midi = conversions.midi_bytes(SIMPLE)
+    assert midi == Tab(SIMPLE).to_midi_bytes()
+    assert conversions.midi_bytes(SIMPLE) is midi
+    assert conversions.tab(SIMPLE) is conversions.tab(SIMPLE)
+    conversions.midi_bytes(REPEATED)
+    stats = conversions.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (3, 2, 1)
+    assert stats['entries'] == 1
+
+
+def test_disk_cache_is_shared_and_salted(tmpdir, monkeypatch):
+    directory = tmpdir.join("cache").strpath
+    midi = ConversionCache(directory=directory).midi_bytes(SIMPLE)
+    second = ConversionCache(directory=directory)
+    assert second.midi_bytes(SIMPLE) == midi
+    assert second.disk_hits == 1
+    monkeypatch.setattr(cache, 'VERSION_SALT', 'tabtomidi-upgraded')
+    third = ConversionCache(directory=directory)
+    third.midi_bytes(SIMPLE)
+    assert (third.disk_hits, third.disk_writes) == (0, 1)
+
+
+def test_disk_cache_evicts_by_size(tmpdir):
+    directory = tmpdir.join("cache")
+    conversions = ConversionCache(directory=directory.strpath,
+                                  max_directory_bytes=300)
+    conversions.midi_bytes(SIMPLE)
+    conversions.midi_bytes(REPEATED)
+    assert conversions.disk_evictions == 1
+    assert len(directory.listdir()) == 2
+    assert sum(len(d.listdir()) for d in directory.listdir()) == 1
@@ -0,0 +1,71 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+from tabtomidi import Tab
+from tabtomidi.corpus import CorpusIndex, build_index, open_corpus
+
+TABS = ['simple_4_4_beat.txt', 'repetition_4x.txt', 'two_bar_repetition.txt',
+        'simple_4_4_beat_odd_pipe_chars.txt']
+
+
+def write_archive(tmpdir):
+    texts = [codecs.open(os.path.join('testdata', name), "r", "utf-8").read()
+             for name in TABS]
+    archive = tmpdir.join("archive.txt")
+    archive.write_binary(b"".join(text.encode('utf-8').rstrip(b"\n") +
+                                  b"\n\f\n" for text in texts))
+    return archive.strpath, texts
+
+
+def test_entries_convert_like_their_text(tmpdir):
+    archive_path, texts = write_archive(tmpdir)
+    with open_corpus(archive_path) as corpus:
+        assert len(corpus) == len(TABS)
+        for i, text in enumerate(texts):
+            assert corpus.text(i).rstrip() == text.rstrip()
+            tab = Tab(text)
+            assert corpus.tab(i, bpm=90).to_midi_bytes() == \
+                Tab(text, bpm=90).to_midi_bytes()
+            lines = corpus.text(i).encode('utf-8')
+            assert [lines[:offset].count(b"\n") for offset in
+                    corpus.group_offsets(i)] == tab._bar_rows
+
+
+def test_index_is_saved_and_rebuilt_when_stale(tmpdir):
+    archive_path, texts = write_archive(tmpdir)
+    index_path = archive_path + ".idx"
+    open_corpus(archive_path).close()
+    index = CorpusIndex.load(index_path)
+    assert list(index.starts) == \
+        list(build_index(open(archive_path, 'rb').read()).starts)
+    with open(archive_path, 'ab') as archive:
+        archive.write(b"HH |o-o-|\n")
+    os.utime(archive_path, (0, 0))
+    with open_corpus(archive_path) as corpus:
+        assert len(corpus) == len(TABS) + 1
+        assert corpus.text(len(TABS)) == u"HH |o-o-|\n"
+    assert len(CorpusIndex.load(index_path)) == len(TABS) + 1
+
+
+def test_shards_cover_the_entries_in_order(tmpdir):
+    archive_path, _ = write_archive(tmpdir)
+    with open_corpus(archive_path) as corpus:
+        for count in (1, 2, 3, 8):
+            shards = corpus.shards(count)
+            assert len(shards) == count
+            assert [i for shard in shards for i in shard] == range(len(TABS))
+
+
+def test_separators():
+    index = build_index(b"\f\nA |o|\r\n\f\r\n\f\nB |o|\n\f")
+    assert list(index.starts) == [2, 14]
+    assert list(index.ends) == [9, 20]
+    assert list(index.group_offsets) == [0, 0]
+
+
+def test_entries_that_start_with_bars():
+    entry = b"HH |o-o-|\n\nS |o-o-|\n"
+    index = build_index((entry + b"\f\n") * 2)
+    assert list(index.group_offsets) == [0, 11, 0, 11]
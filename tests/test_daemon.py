@@ -0,0 +1,140 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import socket
+import threading
+import pytest
+from tabtomidi import Tab
+from tabtomidi import client
+from tabtomidi.client import DaemonClient, DaemonError
+from tabtomidi.daemon import ConversionDaemon
+
+SIMPLE = codecs.open('testdata/simple_4_4_beat.txt', "r", "utf-8").read()
+
+
+def start_daemon(socket_path, **kwargs):
+    daemon = ConversionDaemon(socket_path, **kwargs)
+    thread = threading.Thread(target=daemon.serve)
+    thread.daemon = True
+    thread.start()
+    return daemon, thread
+
+
+@pytest.fixture
+def daemon(tmpdir):
+    daemon, thread = start_daemon(str(tmpdir.join('daemon.sock')))
+    yield daemon
+    daemon.stop()
+    thread.join(5)
+
+
+def test_convert(daemon):
+    connection = DaemonClient(daemon.socket_path)
+    try:
+        assert connection.convert(SIMPLE) == Tab(SIMPLE).to_midi_bytes()
+        assert connection.convert(path='testdata/simple_4_4_beat.txt',
+                                  bpm=60) == \
+            Tab(SIMPLE, bpm=60).to_midi_bytes()
+        assert connection.stats()['requests'] == 3
+    finally:
+        connection.close()
+
+
+def test_errors(daemon):
+    connection = DaemonClient(daemon.socket_path)
+    try:
+        with pytest.raises(DaemonError) as e:
+            connection.convert("HH |o-o-|\n\n   |")
+        assert e.value.status == 422
+        assert (e.value.error['row'], e.value.error['column']) == (2, 3)
+        assert "row 2, column 3" in str(e.value)
+        with pytest.raises(DaemonError) as e:
+            connection.convert("XX |o-o-|")
+        assert e.value.error['note_names'] == ['XX']
+        with pytest.raises(DaemonError) as e:
+            connection.convert(path='testdata/no_such_tab.txt')
+        assert e.value.status == 404
+        with pytest.raises(DaemonError) as e:
+            connection.convert(SIMPLE, tempo=60)
+        assert e.value.status == 400
+        for header in ({'command': 'convert', 'options': [60]},
+                       {'command': 'convert', 'options': "bpm"},
+                       {'command': 'convert', 'path': 7}):
+            with pytest.raises(DaemonError) as e:
+                connection._request(header, SIMPLE.encode('utf-8'))
+            assert e.value.status == 400
+        # The connection is still usable after errors.
+        assert connection.convert(SIMPLE) == Tab(SIMPLE).to_midi_bytes()
+    finally:
+        connection.close()
+
+
+def test_errors_without_a_column():
+    error = DaemonError(422, {'type': 'ResourceLimitExceeded',
+                              'message': "The tab exceeds max_line_width.",
+                              'row': 4, 'column': None})
+    assert str(error) == "ResourceLimitExceeded: The tab exceeds " \
+        "max_line_width. (row 4)"
+    assert str(DaemonError(500, {'message': "Failed."})) == "Error: Failed."
+
+
+def test_concurrent_clients(daemon):
+    results = []
+
+    def convert(bpm):
+        connection = DaemonClient(daemon.socket_path)
+        try:
+            for _ in xrange(5):
+                results.append((bpm, connection.convert(SIMPLE, bpm=bpm)))
+        finally:
+            connection.close()
+    threads = [threading.Thread(target=convert, args=(bpm,))
+               for bpm in (60, 100, 140, 180)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 20
+    for bpm, midi in results:
+        assert midi == Tab(SIMPLE, bpm=bpm).to_midi_bytes()
+
+
+def test_shutdown_removes_socket(tmpdir):
+    socket_path = str(tmpdir.join('daemon.sock'))
+    daemon, thread = start_daemon(socket_path)
+    with pytest.raises(socket.error):
+        ConversionDaemon(socket_path)
+    DaemonClient(socket_path).shutdown()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+    with pytest.raises(socket.error):
+        DaemonClient(socket_path).convert(SIMPLE)
+
+
+def test_idle_timeout_and_stale_socket(tmpdir):
+    socket_path = str(tmpdir.join('daemon.sock'))
+    # A socket file that nothing listens on is left by a crashed daemon.
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    daemon, thread = start_daemon(socket_path, idle_timeout=0.2)
+    assert DaemonClient(socket_path).convert(SIMPLE)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+
+
+def test_client_command(daemon, tmpdir, capsys):
+    midi_path = str(tmpdir.join('simple.mid'))
+    assert client.main(['--socket', daemon.socket_path, '--bpm', '60',
+                        'testdata/simple_4_4_beat.txt', midi_path,
+                        'testdata/no_such_tab.txt',
+                        str(tmpdir.join('missing.mid'))]) == 1
+    assert open(midi_path, 'rb').read() == Tab(SIMPLE, bpm=60).to_midi_bytes()
+    assert not tmpdir.join('missing.mid').check()
+    assert "no_such_tab.txt: IOError" in capsys.readouterr()[1]
+    assert client.main(['--socket', str(tmpdir.join('none.sock')),
+                        'testdata/simple_4_4_beat.txt', midi_path]) == 2
@@ -0,0 +1,87 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import pytest
+from tabtomidi import Tab
+from tabtomidi.differential import first_divergence
+from tabtomidi.engines import ENGINES, get_engine, register_engine
+from tabtomidi.events import NoteEventsBuilder
+
+
+class _SkipsAccents(NoteEventsBuilder):
+    """An engine that leaves out accented notes."""
+
+    def strike_type_code(self, strike_type):
+        return NoteEventsBuilder.strike_type_code(
+            self, 'o' if strike_type == 'O' else strike_type)
+
+
+class _FailsOnRepeats(NoteEventsBuilder):
+    """An engine that cannot play repeated sections."""
+
+    def add_bar_group(self, group):
+        if group.repetition_row is not None and not self.ignore_repetition:
+            raise NotImplementedError("repeats")
+        NoteEventsBuilder.add_bar_group(self, group)
+
+
+@pytest.fixture
+def engines():
+    register_engine('skips_accents', _SkipsAccents)
+    register_engine('fails_on_repeats', _FailsOnRepeats)
+    yield
+    del ENGINES['skips_accents']
+    del ENGINES['fails_on_repeats']
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        get_engine('no such engine')
+    with pytest.raises(ValueError):
+        Tab("HH |o-o-|", engine='no such engine')
+
+
+def test_reference_engine_agrees_with_itself():
+    for filename in os.listdir('testdata'):
+        if not filename.endswith('.txt'):
+            continue
+        text = codecs.open(os.path.join('testdata', filename), "r",
+                           "utf-8").read()
+        try:
+            Tab(text).note_events()
+        except Exception:
+            continue
+        assert first_divergence(text, 'reference') is None
+
+
+def test_divergence_is_located(engines):
+    text = "\n".join(["HH |o-o-o-o-|o-o-o-o-|",
+                      " S |----o---|----O---|",
+                      "",
+                      "HH |o-o-o-o-|o-o-o-o-|",
+                      " S |----O---|----o---|"])
+    tab = Tab(text, engine='skips_accents')
+    assert tab.strike_types == set(['o'])
+    divergence = first_divergence(text, 'skips_accents')
+    assert divergence.bar_group == 0
+    assert (divergence.row, divergence.column) == (1, 17)
+    assert divergence.expected == (768, 'S', 'O')
+    assert divergence.actual == (768, 'S', 'o')
+    assert "bar group 0, row 1, column 17" in str(divergence)
+
+
+def test_divergence_in_repeated_section(engines):
+    text = "\n".join(["   |---x3---|",
+                      "HH |o-o-o-o-|o-o-o-o-|",
+                      " S |--------|--O-----|"])
+    divergence = first_divergence(text, 'skips_accents')
+    # The accent is in the bar after the three repeats of the first bar.
+    assert divergence.expected == (3 * 512 + 128, 'S', 'O')
+    assert (divergence.row, divergence.column) == (2, 15)
+    divergence = first_divergence(text, 'fails_on_repeats')
+    assert divergence.bar_group == 0
+    assert isinstance(divergence.actual, NotImplementedError)
+    assert first_divergence(text, 'fails_on_repeats',
+                            ignore_repetition=True) is None
@@ -0,0 +1,115 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import glob
+import random
+import py.test
+from tabtomidi import Tab, TabParsingException, UnmappableNoteNamesException
+from tabtomidi.document import TabDocument
+from tabtomidi.events import MAX_GROOVES
+
+BAR_GROUP = [u"HH |o-o-o-o-|o-o-o-o-|",
+             u" S |----o---|----o---|",
+             u" B |o---o---|o-o-----|",
+             u""]
+
+
+def assert_matches_tab(document):
+    tab = Tab(document.text)
+    assert list(document.note_events()) == list(tab.note_events())
+    assert document.to_midi_bytes() == tab.to_midi_bytes()
+
+
+def test_document_matches_tab_for_test_files():
+    for filename in glob.glob('testdata/*.txt'):
+        document = TabDocument(codecs.open(filename, "r", "utf-8").read())
+        assert_matches_tab(document)
+
+
+def test_edits_only_relex_nearby_groups():
+    document = TabDocument(u"\n".join(BAR_GROUP * 50))
+    document.to_midi_bytes()
+    groups = document.bar_groups
+    document.replace_lines(41, 42, [u" S |--o-o---|----o---|"])
+    assert document.bar_groups[:10] == groups[:10]
+    assert document.bar_groups[10] != groups[10]
+    assert document.bar_groups[11:] == groups[11:]
+    assert_matches_tab(document)
+    document.insert_lines(8, BAR_GROUP)
+    assert document.bar_groups[3].top_row == groups[2].top_row + 4
+    assert_matches_tab(document)
+    document.delete_lines(0, 4)
+    assert document.bar_groups[0].top_row == 0
+    assert_matches_tab(document)
+
+
+def test_groups_that_move_in_time_are_not_encoded_again():
+    document = TabDocument(u"\n".join(BAR_GROUP * 10))
+    document.to_midi_bytes()
+    chunks = document._midi_chunks
+    events = document.note_events()
+    notes = list(events)
+    # A group of one bar moves every later group by one bar.
+    document.insert_lines(8, [u"HH |o-o-o-o-|", u""])
+    assert_matches_tab(document)
+    assert all(new is old for new, old in zip(document._midi_chunks[3:],
+                                              chunks[2:]))
+    assert list(events) == notes
+
+
+def test_random_edits_match_tab():
+    generator = random.Random(7)
+    pieces = BAR_GROUP + [u"   |----x3--|", u"HH |o-o-o-o-", u"text", u"|"]
+    document = TabDocument(u"\n".join(BAR_GROUP * 8))
+    for _ in xrange(300):
+        start = generator.randint(0, len(document.lines))
+        end = min(len(document.lines), start + generator.randint(0, 5))
+        document.replace_lines(start, end, [
+            generator.choice(pieces)
+            for _ in xrange(generator.randint(0, 5))])
+        try:
+            expected = Tab(document.text)
+            expected_events = list(expected.note_events())
+        except (TabParsingException, IndexError):
+            with py.test.raises((TabParsingException, IndexError)):
+                document.note_events()
+            continue
+        assert list(document.note_events()) == expected_events
+        assert document.to_midi_bytes() == expected.to_midi_bytes()
+        assert [group.top_row for group in document.bar_groups] == \
+            [group.top_row for group in expected._bar_groups]
+
+
+def test_unparsable_edits_are_reported_later():
+    document = TabDocument(u"\n".join(BAR_GROUP))
+    document.replace_lines(0, 3, [u"   |--x2--|"])
+    assert len(document.errors) == 1
+    with py.test.raises(TabParsingException):
+        document.to_midi_bytes()
+    document.replace_lines(0, 1, BAR_GROUP)
+    assert document.errors == []
+    assert_matches_tab(document)
+    with py.test.raises(IndexError):
+        document.replace_lines(3, 2, [])
+
+
+def test_note_names_that_were_edited_out_are_forgotten():
+    document = TabDocument(u"\n".join(BAR_GROUP))
+    document.to_midi_bytes()
+    document.replace_lines(1, 2, [u"XX |----o---|----o---|"])
+    with py.test.raises(UnmappableNoteNamesException):
+        document.to_midi_bytes()
+    document.replace_lines(1, 2, [BAR_GROUP[1]])
+    assert_matches_tab(document)
+
+
+def test_grooves_of_many_edits_are_not_all_kept():
+    document = TabDocument(u"\n".join(BAR_GROUP * 4))
+    for i in xrange(MAX_GROOVES + 100):
+        bar = u"".join(u"o" if i >> bit & 1 else u"-" for bit in xrange(16))
+        document.replace_lines(12, len(document.lines), [u"HH |%s|" % bar])
+        document.to_midi_bytes()
+        assert len(document._builder.grooves) < MAX_GROOVES
+    assert_matches_tab(document)
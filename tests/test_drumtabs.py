@@ -3,9 +3,16 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 os.chdir(os.path.dirname(__file__))
 import codecs
+import inspect
 import py.test
 import filecmp
+import struct
+import threading
+from collections import defaultdict
 from tabtomidi import Tab, TabParsingException, UnmappableNoteNamesException
+from tabtomidi.drumtabs import run_chunks
+from tabtomidi.profiling import ConversionStats
+from tabtomidi.smf import DrumTrackWriter
 
 output_verification_tests = [
     ('simple_4_4_beat',     {'tab' : 'testdata/simple_4_4_beat.txt',
@@ -20,6 +27,8 @@ output_verification_tests = [
                              'expected_midi' : 'testdata/repetition_4x.mid'}),
     ('repetition_1x_2x_1x', {'tab' : 'testdata/repetition_1x_2x_1x.txt',
                              'expected_midi' : 'testdata/repetition_4x.mid'}),
+    ('repetition_nested',   {'tab' : 'testdata/repetition_nested_2x_2x.txt',
+                             'expected_midi' : 'testdata/repetition_4x.mid'}),
     ('unknown_strike_types',{'tab' : 'testdata/unknown_strike_types.txt',
                              'expected_midi' : 'testdata/simple_4_4_beat.mid'}),
     ('variable_bar_lengths',{'tab' : 'testdata/variable_bar_lengths.txt',
@@ -46,6 +55,18 @@ def test_string_without_tab():
         """)
 
 
+def test_construction_is_lazy():
+    # Errors in the groups of bars are only raised when they are needed.
+    tab = Tab("HH |o-o-|\n\n   |----|")
+    assert tab.stats is None
+    with py.test.raises(TabParsingException):
+        tab.note_types
+    tab = Tab(file('testdata/simple_4_4_beat.txt').read())
+    assert tab._lines is None
+    assert tab.divisions_in_bar == 32
+    assert tab._bar_rows == [2]
+
+
 def test_unknown_strike_types_are_identified():
     tab = Tab(file('testdata/unknown_strike_types.txt').read())
     assert tab.unknown_strike_types == set(['Q', 'S', 'X', 'Z', 'z'])
@@ -59,15 +80,163 @@ def test_walk_notes_works_with_unknown_note_types():
         tab.write_midi_file(open(os.devnull, 'w'))
 
 
+def read_midi_events(midi):
+    """
+    Decodes a single track midi file into its header and a dict mapping each
+    tick to the sorted list of events that happen at that tick.
+    """
+    header = struct.unpack('>4sIHHH', midi[:14])
+    assert midi[14:18] == 'MTrk'
+    data = bytearray(midi[22:])
+    events = defaultdict(list)
+    tick = 0
+    i = 0
+    while i < len(data):
+        delta = 0
+        while data[i] & 0x80:
+            delta = (delta << 7) | (data[i] & 0x7F)
+            i += 1
+        delta = (delta << 7) | data[i]
+        tick += delta
+        i += 1
+        if data[i] == 0xFF:
+            length = data[i + 2]
+            events[tick].append(tuple(data[i:i + 3 + length]))
+            i += 3 + length
+        else:
+            events[tick].append(tuple(data[i:i + 3]))
+            i += 3
+    return header, dict((t, sorted(e)) for t, e in events.items())
+
+
+def midiutil_generated_expected_midi():
+    """The expected midi files were generated with MIDIUtil 0.87."""
+    try:
+        from midiutil.MidiFile import MIDIFile
+    except ImportError:
+        return False
+    return 'file_format' not in inspect.getargspec(MIDIFile.__init__).args
+
+
 def pytest_generate_tests(metafunc):
-    if metafunc.function == test_generated_midi_matches_expected_midi:
+    if metafunc.function in (test_generated_midi_matches_expected_midi,
+                             test_midiutil_midi_matches_expected_midi):
         for test in output_verification_tests:
             metafunc.addcall(id=test[0], funcargs=test[1])
 
 
-def test_generated_midi_matches_expected_midi(tmpdir, tab, expected_midi):
+def test_generated_midi_matches_expected_midi(tab, expected_midi):
+    # Notes that start at the same time may be stored in a different order
+    # than midiutil used for the expected files, so compare the decoded
+    # events at every tick instead of the raw bytes.
+    tab = Tab(codecs.open(tab, "r", "utf-8").read())
+    actual = read_midi_events(tab.to_midi_bytes())
+    expected = read_midi_events(open(expected_midi, "rb").read())
+    assert actual == expected
+
+
+@py.test.mark.skipif("not midiutil_generated_expected_midi()")
+def test_midiutil_midi_matches_expected_midi(tmpdir, tab, expected_midi):
     actual_midi = tmpdir.join("actual.mid").strpath
 
     tab = Tab(codecs.open(tab, "r", "utf-8").read())
-    tab.write_midi_file(open(actual_midi, "wb"))
+    tab.write_midi_file(open(actual_midi, "wb"), use_midiutil=True)
     assert filecmp.cmp(actual_midi, expected_midi)
+
+
+def test_write_midi_file_writes_midi_bytes(tmpdir):
+    actual_midi = tmpdir.join("actual.mid").strpath
+    tab = Tab(file('testdata/simple_4_4_beat.txt').read())
+    tab.write_midi_file(open(actual_midi, "wb"))
+    assert open(actual_midi, "rb").read() == tab.to_midi_bytes()
+
+
+def test_render_variants_match_new_tabs():
+    text = file('testdata/simple_4_4_beat.txt').read()
+    variants = [dict(bpm=60), dict(bpm=140, accent_volume=127),
+                dict(note_name_to_number_map={'HH': 46, 'S': 40, 'B': 35},
+                     ghost_note_volume=20)]
+    tab = Tab(text)
+    midi_files = tab.render_variants(variants)
+    for variant, midi in zip(variants, midi_files):
+        assert midi == Tab(text, **variant).to_midi_bytes()
+    assert tab.render() == tab.to_midi_bytes()
+    with py.test.raises(UnmappableNoteNamesException):
+        tab.render(note_name_to_number_map={'HH': 42})
+
+
+def test_render_range_plays_only_the_range():
+    bar = "HH |o-o-o-o-|\n S |----o---|\n\n"
+    text = bar + "HH |o-------|\n S |--------|\n\n" + bar
+    tab = Tab(text)
+    assert list(tab._bar_group_ticks) == [0, 512, 1024, 1536]
+    assert tab.render_range(0, None) == tab.to_midi_bytes()
+    assert tab.render_range(2, 3) == Tab(bar).to_midi_bytes()
+    assert tab.render_range(1, 2, loops=3) == \
+        Tab("HH |o-------|o-------|o-------|").to_midi_bytes()
+    # Ranges are the same whether or not the whole tab has been walked.
+    walked = Tab(text)
+    walked.note_events()
+    assert walked.render_range(-2, None, loops=2) == \
+        tab.render_range(1, 3, loops=2)
+    with py.test.raises(ValueError):
+        tab.render_range(0, 1, loops=0)
+
+
+def test_repeated_grooves_are_encoded_once():
+    groove = "\n".join(["HH |o-o-o-o-|o-o-o-o-|",
+                        " S |----o---|----O---|",
+                        " B |o-------|o---o---|"])
+    tab = Tab("\n\n".join([groove] * 4))
+    events = tab.note_events()
+    assert len(set(events.runs.codes)) == 2
+    writer = DrumTrackWriter(ticks_per_beat=events.ticks_per_beat)
+    writer.add_notes(tab._midi_notes(), 64)
+    assert tab.to_midi_bytes() == writer.to_bytes()
+
+
+def test_distinct_bars_are_encoded_together():
+    bars = ["".join("o" if i >> bit & 1 else "-" for bit in xrange(8))
+            for i in xrange(16)]
+    tab = Tab("HH |" + "|".join(bars) + "|")
+    events = tab.note_events()
+    assert run_chunks(events, tab._note_map(), 64) is None
+    writer = DrumTrackWriter(ticks_per_beat=events.ticks_per_beat)
+    writer.add_notes(tab._midi_notes(), 64)
+    assert tab.to_midi_bytes() == writer.to_bytes()
+
+
+def test_shared_tabs_compute_lazy_values_once():
+    text = "\n\n".join([codecs.open("testdata/two_bar_repetition.txt", "r",
+                                   "utf-8").read()] * 50)
+    expected = Tab(text)
+    expected = (expected.to_midi_bytes(), expected.render(bpm=60),
+                expected.note_types, expected.strike_types)
+    stats = ConversionStats()
+    tab = Tab(text, stats=stats)
+    start = threading.Event()
+    results = []
+
+    def convert():
+        start.wait()
+        for _ in xrange(3):
+            results.append((tab.to_midi_bytes(), tab.render(bpm=60),
+                            tab.note_types, tab.strike_types))
+    threads = [threading.Thread(target=convert) for _ in xrange(8)]
+    # Switch threads as often as possible, to let them race.
+    check_interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setcheckinterval(check_interval)
+    assert len(results) == 24
+    assert all(result == expected for result in results)
+    # Once with repeats and once without for the strike types.
+    assert stats.phases['walk_notes'][0] == 2
+    assert stats.phases['bar_groups'][0] == 1
+    assert not hasattr(tab, '_Tab__note_name_to_number_map')
@@ -0,0 +1,125 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import pytest
+from tabtomidi.events import MIN_GROOVE_LOOKUPS, ticks_per_beat_for
+from tabtomidi.exceptions import TabParsingException
+from tabtomidi.profiling import ConversionStats
+from tabtomidi import Tab
+
+
+def load_tab(filename):
+    return Tab(codecs.open(filename, "r", "utf-8").read())
+
+
+def test_note_events_match_walk_notes():
+    tab = load_tab('testdata/repetition_4x.txt')
+    events = tab.note_events()
+    assert len(events) == 32
+    assert list(events) == list(tab.walk_notes())
+    assert sorted(events.note_types) == ['B', 'HH', 'S']
+    assert events.strike_types == ('o',)
+
+
+def test_note_events_slicing_shares_tables():
+    events = load_tab('testdata/simple_4_4_beat.txt').note_events()
+    head = events[:4]
+    assert len(head) == 4
+    assert head.note_types is events.note_types
+    assert list(head) == list(events)[:4]
+    assert events[-1] == list(events)[-1]
+    assert events[4:6].times.tolist() == [2.0, 2.0]
+
+
+def test_nested_repetitions_repeat_each_section():
+    tab = Tab("\n".join([
+        "   |------------------------------x2------------------------------|",
+        "   |--------------x2----------------|--------------x3-------------|",
+        "HH |o-------o-------o-------o-------|o---o---o---o---o---o---o---|",
+        " S |----------------o---------------|------------o---------------|"]))
+    events = tab.note_events()
+    hi_hats = [note['time'] for note in events if note['note_type'] == 'HH']
+    # (first bar twice, second bar three times) twice.
+    assert len(hi_hats) == (4 * 2 + 7 * 3) * 2
+    assert hi_hats[8:10] == [8.0, 8.5]
+    assert hi_hats[29] == 4 * 2 + 3.5 * 3
+    assert len(tab.note_events(ignore_repetition=True)) == 4 + 1 + 7 + 1
+
+
+def test_triplet_divisions_get_exact_ticks():
+    tab = Tab("HH |o-o-o-o-o-o-|o-o-o-o-o-o-|")
+    assert tab.ticks_per_beat == 384
+    events = tab.note_events()
+    assert events.ticks.tolist() == [256 * i for i in xrange(12)]
+    assert events[3]['time'] == 2.0
+    # Power of two divisions keep the default resolution.
+    assert Tab("HH |o-o-o-o-|").ticks_per_beat == 128
+
+
+def test_explicit_ticks_per_beat():
+    tab = Tab("HH |o-o-o-o-|", ticks_per_beat=96)
+    assert tab.note_events().ticks.tolist() == [0, 96, 192, 288]
+    with pytest.raises(ValueError):
+        Tab("HH |o-o-o-o-o-o-|", ticks_per_beat=100).to_midi_bytes()
+
+
+def test_per_bar_divisions():
+    text = "HH |o-o-o-o-|o-o-o-o-o-o-|o---|"
+    events = Tab(text, per_bar_divisions=True).note_events()
+    assert events.ticks_per_beat == 384
+    # Bars of 8, 12 and 4 divisions, each 4 * 384 ticks long.
+    assert events.ticks.tolist() == [0, 384, 768, 1152,
+                                     1536, 1792, 2048, 2304, 2560, 2816,
+                                     3072]
+    # Without it, every bar is timed like the first one.
+    assert Tab(text).note_events().times.tolist()[4:6] == [4.0, 5.0]
+
+
+def test_too_many_ticks_per_beat():
+    with pytest.raises(TabParsingException):
+        ticks_per_beat_for([101, 103])
+
+
+def test_written_out_grooves_are_parsed_once():
+    groove = "HH |o-o-o-o-|o-o-o-o-|o-o-o-o-|\n S |----o---|----o---|----o---|"
+    repeated = "   |--x3----|\nHH |o-o-o-o-|\n S |----o---|"
+    stats = ConversionStats()
+    tab = Tab(groove + "\n\n" + groove, stats=stats)
+    events = tab.note_events()
+    assert list(events) == list(Tab(repeated + "\n\n" + repeated)
+                                .note_events())
+    assert stats.counters['sections'] == 6
+    assert stats.counters['sections_reused'] == 5
+    assert stats.counters['columns_parsed'] == 8
+    assert stats.dedup_ratio == 5 / 6.0
+    assert list(events.runs.codes) == [0] * 6
+    assert list(events.runs.ticks) == [0, 512, 1024, 1536, 2048, 2560]
+
+
+def test_grooves_with_short_rows_are_parsed_again():
+    stats = ConversionStats()
+    tab = Tab("HH |o-o-|o-o-|o-o-|\n S |--o-|--o-|", stats=stats)
+    snares = [note['time'] for note in tab.note_events()
+              if note['note_type'] == 'S']
+    assert snares == [2.0, 6.0]
+    assert stats.counters['sections_reused'] == 1
+
+
+def distinct_bars(count):
+    """Returns a tab of count hi-hat bars that all differ."""
+    bars = ["".join("o" if i >> bit & 1 else "-" for bit in xrange(16))
+            for i in xrange(count)]
+    return "\n\n".join("HH |" + "|".join(bars[i:i + 4]) + "|"
+                        for i in xrange(0, count, 4))
+
+
+def test_grooves_are_not_fingerprinted_if_none_are_written_out_again():
+    stats = ConversionStats()
+    groove = "HH |o-o-o-o-o-o-o-o-|o-o-o-o-o-o-o-o-|"
+    text = distinct_bars(MIN_GROOVE_LOOKUPS) + "\n\n" + groove
+    events = Tab(text, stats=stats).note_events()
+    assert len(events) == text.count("o")
+    assert stats.counters['sections'] == MIN_GROOVE_LOOKUPS + 2
+    assert stats.counters['sections_reused'] == 0
@@ -0,0 +1,83 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import pytest
+from tabtomidi import Tab, gridengine
+from tabtomidi.differential import first_divergence
+from tabtomidi.gridengine import GRID_ENGINE
+
+needs_numpy = pytest.mark.skipif(gridengine.numpy is None,
+                                 reason="NumPy is not installed")
+
+
+@needs_numpy
+def test_grid_engine_agrees_on_testdata():
+    for filename in os.listdir('testdata'):
+        if not filename.endswith('.txt'):
+            continue
+        text = codecs.open(os.path.join('testdata', filename), "r",
+                           "utf-8").read()
+        for per_bar_divisions in (False, True):
+            assert first_divergence(
+                text, GRID_ENGINE,
+                per_bar_divisions=per_bar_divisions) is None, filename
+
+
+@needs_numpy
+def test_grid_engine_agrees_on_ragged_groups():
+    text = "\n".join(["   |--x2--|   |----x3----|",
+                      "HH |o-x-X-|o-o-o-o-|o-g-o-o-o-|  notes",
+                      " S |--o-|--r---o-|-------O--|",
+                      " B |o-----|o-------|o---o-----",
+                      "",
+                      "HH |o-o-o-o-|o-o-o-o-|",
+                      " S |----o---|----o---|"])
+    for per_bar_divisions in (False, True):
+        assert first_divergence(
+            text, GRID_ENGINE, per_bar_divisions=per_bar_divisions) is None
+    tab = Tab(text, engine=GRID_ENGINE)
+    assert tab.to_midi_bytes() == Tab(text).to_midi_bytes()
+    assert tab.strike_types == Tab(text).strike_types
+
+
+@needs_numpy
+def test_grid_engine_raises_like_reference():
+    # The snare row ends before the bar does.
+    text = "\n".join(["HH |o-o-o-o-|o-o-o-o-|",
+                      " S |----o---|----o-"])
+    with pytest.raises(IndexError):
+        Tab(text).note_events()
+    with pytest.raises(IndexError):
+        Tab(text, engine=GRID_ENGINE).note_events()
+
+
+@needs_numpy
+def test_known_strike_types_are_not_interned_again():
+    # Every bar differs, so that none is found in the GrooveCache.
+    bars = ["o-o-o-o-", "x-o-o-o-", "o-x-o-o-", "o-o-x-o-", "o-o-o-x-",
+            "x-x-o-o-", "o-x-x-o-", "o-o-x-x-"]
+    text = "\n".join(["HH |%s|" % "|".join(bars),
+                      " S |%s|" % "|".join(bar[::-1] for bar in bars)])
+    builder = Tab(text, engine=GRID_ENGINE)._new_builder()
+    for group in Tab(text)._bar_groups:
+        builder.add_bar_group(group)
+    # Only the first two bars have strike types that are new.
+    assert builder._interning_sections == 2
+    assert builder.columns_parsed == 64
+    assert first_divergence(text, GRID_ENGINE) is None
+
+
+def test_grid_engine_without_numpy(monkeypatch):
+    monkeypatch.setattr(gridengine, 'numpy', None)
+    text = codecs.open(os.path.join('testdata', 'repetition_4x.txt'), "r",
+                       "utf-8").read()
+    assert first_divergence(text, GRID_ENGINE) is None
+
+
+@needs_numpy
+def test_grid_engine_falls_back_on_wide_characters():
+    text = u"\n".join([u"HH |o-o-o-o-|o-o-o-o-|",
+                       u" S |----o---|----\u00f8---|"])
+    assert first_divergence(text, GRID_ENGINE) is None
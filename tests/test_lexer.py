@@ -0,0 +1,78 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import py.test
+from tabtomidi import TabParsingException
+import pickle
+from tabtomidi.lexer import TextStore, lex, normalize_lines
+
+
+def lex_file(filename):
+    return lex(normalize_lines(codecs.open(filename, "r", "utf-8").read()))
+
+
+def test_bar_groups_of_simple_beat():
+    groups = lex_file('testdata/simple_4_4_beat.txt')
+    assert len(groups) == 1
+    group = groups[0]
+    assert (group.top_row, group.note_row, group.end_row) == (2, 2, 5)
+    assert group.note_types == ('HH', 'S', 'B')
+    assert group.repetition_row is None
+    assert group.vertical_lines == (3, 36, 69)
+    assert group.find_vertical_line(4) == 36
+    assert group.find_vertical_line(70) is None
+
+
+def test_repetition_row_is_separated_from_note_rows():
+    group = lex_file('testdata/repetition_4x.txt')[0]
+    assert group.top_row == 2
+    assert group.note_row == 3
+    assert group.repetition_row.strip().startswith('|---')
+    assert len(group.rows) == len(group.note_types) == 3
+
+
+def test_vertical_lines_end_at_broken_columns():
+    lines = normalize_lines("HH |o---|o---|\n"
+                            " B |o---|o---x")
+    assert lex(lines)[0].vertical_lines == (3, 8)
+
+
+def test_bar_without_notes_reports_row():
+    with py.test.raises(TabParsingException) as excinfo:
+        lex(normalize_lines("HH |o---|\n\n   |----|"))
+    assert excinfo.value.row == 2
+
+
+def test_text_store_reads_like_normalized_lines():
+    for filename in os.listdir('testdata'):
+        if not filename.endswith('.txt'):
+            continue
+        text = codecs.open(os.path.join('testdata', filename), "r",
+                           "utf-8").read()
+        lines = normalize_lines(text)
+        store = TextStore(text)
+        assert list(store) == lines
+        assert [store[row] for row in xrange(-len(lines), len(lines))] == \
+            lines + lines
+        assert lex(store) == lex(lines)
+
+
+def test_text_store_keeps_ascii_tabs_as_byte_strings():
+    text = u"Count:\nHH |o-o-|  \n   |1 & |\n\n S |--o-|"
+    store = TextStore(text)
+    assert list(store) == [u"Count:", u"HH |o-o-|", u"", u"", u" S |--o-|"]
+    assert isinstance(store[1], str)
+    assert isinstance(TextStore(u"\u00e9\nHH |o-o-|")[1], unicode)
+    with py.test.raises(IndexError):
+        store[5]
+
+
+def test_group_rows_are_views_that_pickle_as_tuples():
+    group, = lex(TextStore(u"HH |o-o-|\n S |--o-|"))
+    assert not isinstance(group.rows, tuple)
+    assert list(group.rows) == ["HH |o-o-|", " S |--o-|"]
+    assert group.rows[-1] == " S |--o-|"
+    assert pickle.loads(pickle.dumps(group.rows)) == ("HH |o-o-|",
+                                                      " S |--o-|")
@@ -0,0 +1,83 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import glob
+import pickle
+import pytest
+from tabtomidi import ResourceLimitExceeded, ResourceLimits, Tab
+from tabtomidi.limits import UNTRUSTED_LIMITS
+
+REPEATED = "   |-------x4-------|\nHH |o-o-o-o-o-o-o-o-|\n S |----o-------o---|"
+NESTED = ("   |------x50-------|\n   |------x50-------|\n"
+          "   |------x50-------|\n"
+          "HH |o-o-o-o-o-o-o-o-|")
+
+
+def limit_exceeded(tabtext, **limits):
+    """Returns the ResourceLimitExceeded raised by converting the tab."""
+    with pytest.raises(ResourceLimitExceeded) as e:
+        Tab(tabtext, limits=ResourceLimits(**limits)).to_midi_bytes()
+    return e.value
+
+
+def test_tabs_within_limits_convert_as_without_limits():
+    for filename in glob.glob('testdata/*.txt'):
+        tabtext = codecs.open(filename, "r", "utf-8").read()
+        try:
+            expected = Tab(tabtext).to_midi_bytes()
+        except Exception:
+            continue
+        assert Tab(tabtext, limits=UNTRUSTED_LIMITS).to_midi_bytes() == \
+            expected
+    assert Tab(REPEATED, limits=ResourceLimits(
+        max_notes=40, max_repetitions=4)).to_midi_bytes() == \
+        Tab(REPEATED).to_midi_bytes()
+
+
+def test_input_bytes():
+    e = limit_exceeded(u"HH |o-o-o-o-|\n\n" + u"\u00f8" * 20,
+                       max_input_bytes=40)
+    assert (e.limit, e.value, e.maximum) == ('max_input_bytes', 55, 40)
+    assert "max_input_bytes: 55 > 40" in str(e)
+    Tab(u"HH |o-o-o-o-|\n\n" + u"\u00f8" * 20, limits=ResourceLimits(
+        max_input_bytes=55)).to_midi_bytes()
+
+
+def test_line_width_and_bar_groups():
+    e = limit_exceeded("HH |o-o-|\n\n S |o-o-o-o-o-o-|", max_line_width=16)
+    assert (e.limit, e.value, e.row) == ('max_line_width', 17, 2)
+    e = limit_exceeded("\n\n".join(["HH |o-o-|"] * 5), max_bar_groups=3)
+    assert (e.limit, e.row) == ('max_bar_groups', 6)
+    assert len(Tab("\n\n".join(["HH |o-o-|"] * 3), limits=ResourceLimits(
+        max_bar_groups=3)).note_events()) == 6
+
+
+def test_repetitions_and_notes():
+    e = limit_exceeded(REPEATED, max_repetitions=3)
+    assert (e.limit, e.value, e.row, e.column) == ('max_repetitions', 4, 0, 4)
+    e = limit_exceeded(REPEATED, max_notes=39)
+    assert (e.limit, e.value) == ('max_notes', 40)
+    # Nested repeats are stopped before they are played out.
+    e = limit_exceeded(NESTED, max_notes=100000)
+    assert (e.limit, e.value) == ('max_notes', 1000000)
+
+
+def test_steps():
+    tab = Tab(REPEATED, limits=ResourceLimits(max_steps=1000))
+    tab.note_events()
+    e = limit_exceeded(REPEATED, max_steps=50)
+    assert e.limit == 'max_steps'
+    for engine in ('reference', 'grid'):
+        with pytest.raises(ResourceLimitExceeded):
+            Tab("\n\n".join(["HH |o-o-|"] * 10), engine=engine,
+                limits=ResourceLimits(max_steps=100)).note_events()
+
+
+def test_exceptions_survive_pickling():
+    e = limit_exceeded(REPEATED, max_repetitions=3)
+    copy = pickle.loads(pickle.dumps(e))
+    assert (copy.limit, copy.value, copy.maximum, copy.row, copy.column) == \
+        (e.limit, e.value, e.maximum, e.row, e.column)
+    assert str(copy) == str(e)
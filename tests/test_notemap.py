@@ -0,0 +1,54 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import threading
+import py.test
+from tabtomidi import Tab, UnmappableNoteNamesException
+from tabtomidi.notemap import RIM_PITCH, compile_note_map
+
+
+def test_tables_map_codes_to_pitches_and_velocities():
+    note_map = compile_note_map({'HH': 42, 'S': 38}, strike_volume=70,
+                                accent_volume=110, ghost_note_volume=50)
+    width, pitches, velocities = note_map.tables(('S', 'HH'),
+                                                 ('o', 'r', 'O', 'x'))
+    assert width == 4
+    assert pitches.tolist() == [38, RIM_PITCH, 38, 38,
+                                42, RIM_PITCH, 42, 42]
+    assert velocities.tolist() == [70, 70, 110, 70]
+    assert note_map.tables(('S', 'HH'), ('o', 'r', 'O', 'x'))[1] is pitches
+
+
+def test_compiled_maps_are_shared():
+    assert compile_note_map({'HH': 42}) is compile_note_map({'HH': 42})
+    assert compile_note_map({'HH': 42}) is not compile_note_map({'HH': 46})
+    assert compile_note_map() is not compile_note_map(strike_volume=80)
+    # Tabs share the map of their note names and volumes.
+    assert Tab("HH |o-o-|")._note_map() is Tab("S |o-o-|")._note_map()
+
+
+def test_maps_and_tables_are_compiled_once_across_threads():
+    note_maps = []
+    tables = []
+    start = threading.Event()
+
+    def compile_map():
+        start.wait()
+        note_map = compile_note_map({'HH': 42, 'Threads': 38})
+        note_maps.append(note_map)
+        tables.append(note_map.tables(('Threads',), ('o', 'x')))
+    threads = [threading.Thread(target=compile_map) for _ in xrange(8)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    assert len(set(map(id, note_maps))) == 1
+    assert len(set(map(id, tables))) == 1
+
+
+def test_unmappable_names_are_found_when_compiling():
+    note_map = compile_note_map({'HH': 42})
+    with py.test.raises(UnmappableNoteNamesException):
+        note_map.tables(('HH', 'XX'), ('o',))
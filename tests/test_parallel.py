@@ -0,0 +1,54 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import py.test
+from multiprocessing import Pool
+from benchmarks.generator import generate_tab
+from tabtomidi import Tab, UnmappableNoteNamesException
+from tabtomidi.exceptions import ResourceLimitExceeded
+from tabtomidi.limits import ResourceLimits
+from tabtomidi.parallel import render_midi
+
+
+def test_parallel_midi_matches_serial_midi():
+    pool = Pool(2)
+    try:
+        for divisions in (12, 16, 20):
+            text = generate_tab(bars=120, divisions=divisions,
+                                repeat_density=0.3, count_rows=True)
+            assert render_midi(Tab(text), workers=2, pool=pool,
+                               min_bar_groups=1) == Tab(text).to_midi_bytes()
+        with py.test.raises(UnmappableNoteNamesException):
+            render_midi(Tab(text, note_name_to_number_map={}), workers=2,
+                        pool=pool, min_bar_groups=1)
+    finally:
+        pool.terminate()
+
+
+def test_small_tabs_are_converted_serially():
+    text = generate_tab(bars=8)
+    # Starting a pool would fail with zero workers.
+    assert render_midi(Tab(text), workers=0) == Tab(text).to_midi_bytes()
+    assert render_midi(Tab(text), workers=2, min_bar_groups=100) == \
+        Tab(text).to_midi_bytes()
+
+
+def test_parallel_conversion_keeps_to_the_limits_of_the_whole_tab():
+    text = generate_tab(bars=120)
+    notes = len(Tab(text).note_events())
+    pool = Pool(2)
+    try:
+        for limits in (ResourceLimits(max_notes=notes - 10),
+                       ResourceLimits(max_steps=notes)):
+            with py.test.raises(ResourceLimitExceeded) as serial:
+                Tab(text, limits=limits).to_midi_bytes()
+            with py.test.raises(ResourceLimitExceeded) as parallel:
+                render_midi(Tab(text, limits=limits), workers=2, pool=pool,
+                            min_bar_groups=1)
+            assert str(parallel.value) == str(serial.value)
+        limits = ResourceLimits(max_notes=notes)
+        assert render_midi(Tab(text, limits=limits), workers=2, pool=pool,
+                           min_bar_groups=1) == Tab(text).to_midi_bytes()
+    finally:
+        pool.terminate()
@@ -0,0 +1,46 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import json
+from tabtomidi import Tab
+from tabtomidi.profiling import ConversionStats
+
+REPEATED = codecs.open('testdata/repetition_4x.txt', "r", "utf-8").read()
+
+
+def test_phases_and_counters_are_recorded():
+    stats = ConversionStats()
+    ended = []
+    stats.add_hook(lambda name, seconds: ended.append(name))
+    tab = Tab(REPEATED, stats=stats)
+    midi = tab.to_midi_bytes()
+    tab.to_midi_bytes()
+    assert tab.stats is stats
+    assert stats.phases.keys() == ['pipe_lookalikes', 'split_lines',
+                                   'count_rows', 'bar_groups',
+                                   'divisions_in_bar', 'note_types',
+                                   'walk_notes',
+                                   'encode_midi']
+    assert stats.phases['walk_notes'][0] == 1
+    assert stats.phases['encode_midi'][0] == 2
+    assert ended.count('encode_midi') == 2
+    assert stats.counters['bar_groups'] == 1
+    assert stats.counters['note_rows'] == 3
+    assert stats.counters['columns_parsed'] == 32
+    assert stats.counters['repetitions_expanded'] == 3
+    assert stats.counters['notes'] == 32
+    assert stats.counters['sections'] == 1
+    assert stats.dedup_ratio == 0.0
+    assert stats.counters['midi_bytes'] == 2 * len(midi)
+    assert json.loads(json.dumps(stats.as_dict()))['counters']['notes'] == 32
+    assert "walk_notes" in stats.report()
+    assert "dedup_ratio" in stats.report()
+
+
+def test_tabs_without_stats_are_unchanged():
+    tab = Tab(REPEATED)
+    assert tab.stats is None
+    assert tab.to_midi_bytes() == Tab(REPEATED, stats=ConversionStats()) \
+        .to_midi_bytes()
@@ -0,0 +1,182 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import httplib
+import json
+import threading
+import time
+import py.test
+from tabtomidi import Tab
+from tabtomidi.server import ConversionService, ServiceError, convert_tab, \
+    make_server
+
+SIMPLE = codecs.open('testdata/simple_4_4_beat.txt', "r", "utf-8").read()
+
+
+def slow_convert(tabtext, tab_options):
+    time.sleep(0.5)
+    return convert_tab(tabtext, tab_options)
+
+
+def failing_convert(tabtext, tab_options):
+    raise RuntimeError("The converter failed.")
+
+
+def dying_convert(tabtext, tab_options):
+    os._exit(1)
+
+
+def pytest_funcarg__server(request):
+    server = make_server(workers=1, max_request_bytes=4096)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(stop)
+    return server
+
+
+def request(server, method, path, body=None, headers={}):
+    connection = httplib.HTTPConnection(*server.server_address)
+    connection.request(method, path, body, headers)
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response.status, response.getheader('content-type'), data
+
+
+def test_convert(server):
+    status, content_type, midi = request(server, 'POST', '/convert',
+                                         SIMPLE.encode('utf-8'))
+    assert (status, content_type) == (200, 'audio/midi')
+    assert midi == Tab(SIMPLE).to_midi_bytes()
+    status, _, midi = request(server, 'POST', '/convert?bpm=60',
+                              SIMPLE.encode('utf-8'))
+    assert midi == Tab(SIMPLE, bpm=60).to_midi_bytes()
+
+
+def test_errors(server):
+    status, content_type, body = request(server, 'POST', '/convert',
+                                         "XX |o-o-|o-o-|\n")
+    assert (status, content_type) == (422, 'application/json')
+    error = json.loads(body)['error']
+    assert error['type'] == 'UnmappableNoteNamesException'
+    assert error['note_names'] == ['XX']
+    status, _, body = request(server, 'POST', '/convert', "no bars")
+    assert status == 422
+    assert json.loads(body)['error']['type'] == 'TabParsingException'
+    status, _, body = request(server, 'POST', '/convert', "HH |o-o-|\n\n   |")
+    assert status == 422
+    error = json.loads(body)['error']
+    assert (error['row'], error['column']) == (2, 3)
+    status, _, body = request(server, 'POST', '/convert',
+                              "   |-x99999-|\nHH |o-o-o-o-|")
+    assert status == 422
+    assert json.loads(body)['error']['limit'] == 'max_repetitions'
+    assert request(server, 'POST', '/convert', "x" * 5000)[0] == 413
+    assert request(server, 'POST', '/convert', SIMPLE * 10,
+                   {'Content-Length': '-1'})[0] == 400
+    assert request(server, 'POST', '/convert?tempo=1', SIMPLE)[0] == 400
+    assert request(server, 'POST', '/convert', "\xff")[0] == 400
+    assert request(server, 'GET', '/convert')[0] == 404
+
+
+def test_metrics(server):
+    request(server, 'POST', '/convert', SIMPLE.encode('utf-8'))
+    request(server, 'POST', '/convert', "no bars")
+    status, content_type, body = request(server, 'GET', '/metrics')
+    assert (status, content_type) == (200, 'application/json')
+    metrics = json.loads(body)
+    assert metrics['responses'] == {'200': 1, '422': 1}
+    assert metrics['queue_depth'] == 0
+    assert metrics['request_seconds']['count'] == 2
+    assert sum(metrics['conversion_seconds']['buckets'].values()) == 2
+
+
+def test_identical_submissions_are_coalesced_and_queue_is_bounded():
+    service = ConversionService(workers=1, max_pending=1, timeout=10,
+                                convert=slow_convert)
+    try:
+        results = []
+
+        def convert():
+            results.append(service.convert(SIMPLE))
+        threads = [threading.Thread(target=convert) for _ in xrange(3)]
+        for thread in threads:
+            thread.start()
+        while service.metrics()['coalesced'] < 2:
+            time.sleep(0.01)
+        with py.test.raises(ServiceError) as e:
+            service.convert(SIMPLE, bpm=60)
+        assert e.value.status == 429
+        for thread in threads:
+            thread.join()
+        assert results == [Tab(SIMPLE).to_midi_bytes()] * 3
+        metrics = service.metrics()
+        assert metrics['conversion_seconds']['count'] == 1
+        assert metrics['max_queue_depth'] == 1
+        assert metrics['responses'] == {'200': 3, '429': 1}
+    finally:
+        service.close()
+
+
+def test_timeout():
+    service = ConversionService(workers=1, timeout=0.05, convert=slow_convert)
+    try:
+        with py.test.raises(ServiceError) as e:
+            service.convert(SIMPLE)
+        assert e.value.status == 504
+    finally:
+        service.close()
+
+
+def test_timed_out_conversions_are_counted_until_they_end():
+    service = ConversionService(workers=1, max_pending=1, timeout=0.2,
+                                convert=slow_convert)
+    try:
+        with py.test.raises(ServiceError) as e:
+            service.convert(SIMPLE)
+        assert e.value.status == 504
+        with py.test.raises(ServiceError) as e:
+            service.convert(SIMPLE, bpm=60)
+        assert e.value.status == 429
+        assert service.metrics()['queue_depth'] == 1
+        time.sleep(0.5)
+        assert service.metrics()['queue_depth'] == 0
+    finally:
+        service.close()
+
+
+def test_failed_conversions_are_not_counted_as_in_progress():
+    service = ConversionService(workers=1, max_pending=1, timeout=5,
+                                convert=failing_convert)
+    try:
+        for bpm in (60, 90):
+            with py.test.raises(ServiceError) as e:
+                service.convert(SIMPLE, bpm=bpm)
+            assert e.value.status == 500
+            assert e.value.error['type'] == 'RuntimeError'
+        assert service.metrics()['queue_depth'] == 0
+    finally:
+        service.close()
+
+
+def test_conversions_of_dead_workers_are_not_counted_as_in_progress():
+    service = ConversionService(workers=1, max_pending=1, timeout=0.5,
+                                convert=dying_convert)
+    try:
+        # The pool never calls back, so the requests time out and find
+        # that the worker died.
+        for bpm in (60, 90):
+            with py.test.raises(ServiceError) as e:
+                service.convert(SIMPLE, bpm=bpm)
+            assert e.value.status == 500
+            assert e.value.error['type'] == 'WorkerDied'
+        assert service.metrics()['queue_depth'] == 0
+    finally:
+        service.close()
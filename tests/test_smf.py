@@ -0,0 +1,82 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import py.test
+from tabtomidi.smf import DrumTrackWriter, TrackTemplate, encode_chunk, \
+    write_var_length
+
+HEADER_AND_TEMPO = 14 + 8 + 4 + 7
+
+
+def track_events(writer):
+    return writer.to_bytes()[HEADER_AND_TEMPO:]
+
+
+def test_var_length_encoding():
+    for value, encoded in [(0, [0x00]), (0x7F, [0x7F]), (0x80, [0x81, 0x00]),
+                           (0x3FFF, [0xFF, 0x7F]),
+                           (0x200000, [0x81, 0x80, 0x80, 0x00])]:
+        data = bytearray()
+        write_var_length(data, value)
+        assert list(data) == encoded
+
+
+def test_header_and_meta_events():
+    midi = DrumTrackWriter(bpm=100, file_format=0).to_bytes()
+    assert midi[:14] == 'MThd\x00\x00\x00\x06\x00\x00\x00\x01\x00\x80'
+    assert midi[14:22] == 'MTrk\x00\x00\x00\x0f'
+    assert midi[22:] == '\x00\xff\x03\x00\x00\xff\x51\x03\x09\x27\xc0' \
+                        '\x00\xff\x2f\x00'
+
+
+def test_note_offs_precede_note_ons_at_the_same_tick():
+    writer = DrumTrackWriter()
+    writer.add_notes([(0, 42, 70), (16, 42, 110)], 16)
+    assert track_events(writer) == '\x00\x99\x2a\x46' '\x10\x89\x2a\x46' \
+                                   '\x00\x99\x2a\x6e' '\x10\x89\x2a\x6e' \
+                                   '\x00\xff\x2f\x00'
+
+
+def test_duplicate_notes_are_dropped():
+    writer = DrumTrackWriter()
+    writer.add_notes([(0, 42, 70), (0, 42, 110), (0, 36, 70)], 16)
+    assert track_events(writer).count('\x99') == 2
+
+
+def test_notes_must_be_added_in_time_order():
+    writer = DrumTrackWriter()
+    writer.add_notes([(32, 42, 70)], 16)
+    with py.test.raises(ValueError):
+        writer.add_notes([(16, 42, 70)], 16)
+
+
+def test_chunks_encode_like_added_notes():
+    notes = [(0, 42, 70), (0, 36, 70), (16, 42, 70), (200, 38, 110)]
+    expected = DrumTrackWriter()
+    expected.add_notes(notes, 16)
+    writer = DrumTrackWriter()
+    writer.add_chunk(encode_chunk(notes[:3], 16))
+    writer.add_chunk(encode_chunk(notes[3:], 16))
+    assert writer.to_bytes() == expected.to_bytes()
+    assert encode_chunk([], 16) is None
+    writer = DrumTrackWriter()
+    writer.add_chunk(encode_chunk(notes[:3], 16))
+    writer.add_chunk(encode_chunk([(0, 38, 110)], 16), 200)
+    assert writer.to_bytes() == expected.to_bytes()
+    with py.test.raises(ValueError):
+        writer = DrumTrackWriter()
+        writer.add_chunk(encode_chunk(notes[3:], 16))
+        writer.add_chunk(encode_chunk(notes[:3], 16))
+
+
+def test_templates_render_like_encoded_notes():
+    notes = [(0, 42, 0), (0, 36, 1), (0, 36, 0), (16, 42, 2), (400, 38, 1)]
+    template = TrackTemplate(notes, 16)
+    # The duplicate note is dropped, leaving four note-ons and note-offs.
+    assert len(template) == 8
+    for bpm, velocities in [(100, [70, 110, 50]), (60, [1, 2, 127])]:
+        expected = DrumTrackWriter(bpm=bpm)
+        expected.add_notes([(tick, pitch, velocities[key])
+                            for tick, pitch, key in notes], 16)
+        assert template.render(bpm, velocities) == expected.to_bytes()
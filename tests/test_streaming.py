@@ -0,0 +1,76 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+import glob
+import itertools
+import py.test
+from multiprocessing import Pool
+from benchmarks.memory import measure_stream
+from tabtomidi import Tab, TabParsingException
+from tabtomidi.lexer import iter_bar_groups, iter_normalized_lines
+from tabtomidi.streaming import iter_note_events, stream_midi
+
+BAR_GROUP = ["HH |o-o-o-o-|o-o-o-o-|",
+             " B |o---o---|o---o---|",
+             ""]
+
+
+class Pipe(object):
+    """A file object that cannot seek, like a pipe."""
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+
+
+def test_streamed_midi_matches_tab_midi(tmpdir):
+    for filename in glob.glob('testdata/*.txt'):
+        expected = Tab(codecs.open(filename, "r", "utf-8").read()) \
+            .to_midi_bytes()
+        output = tmpdir.join("streamed.mid")
+        with open(output.strpath, "wb") as midi_file:
+            stream_midi(codecs.open(filename, "r", "utf-8"), midi_file)
+        assert output.read("rb") == expected
+        pipe = Pipe()
+        stream_midi(codecs.open(filename, "r", "utf-8"), pipe)
+        assert "".join(pipe.data) == expected
+
+
+def test_bar_groups_are_yielded_before_the_input_ends():
+    read = []
+
+    def lines():
+        for line in itertools.cycle(BAR_GROUP):
+            read.append(line)
+            yield line
+
+    groups = iter_bar_groups(iter_normalized_lines(lines()))
+    first, second = itertools.islice(groups, 2)
+    assert (first.top_row, second.top_row) == (0, 3)
+    assert len(read) == 6
+
+
+def test_note_events_are_yielded_per_bar_group():
+    events = list(iter_note_events(BAR_GROUP * 3))
+    assert [len(e) for e in events] == [12, 12, 12]
+    assert events[1].times[0] == 8.0
+
+
+def test_streaming_input_without_bars():
+    with py.test.raises(TabParsingException):
+        stream_midi(["no bars here"], Pipe())
+
+
+def test_peak_memory_does_not_grow_with_the_tab():
+    peaks = []
+    for bars in (2000, 20000):
+        pool = Pool(1)
+        try:
+            peaks.append(pool.apply(measure_stream, (bars,)))
+        finally:
+            pool.terminate()
+    assert peaks[1] - peaks[0] < 2 * 1024 * 1024
@@ -0,0 +1,50 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(__file__))
+import codecs
+from tabtomidi import Tab
+from tabtomidi.validation import validate
+
+
+def read(name):
+    return codecs.open(os.path.join('testdata', name), "r", "utf-8").read()
+
+
+def test_valid_tab():
+    result = validate(read('simple_4_4_beat_trailing_text.txt'))
+    assert result.valid
+    assert result.error is None
+    assert result.note_types == set(['HH', 'S', 'B'])
+    assert result.unmappable_note_names == set()
+    assert result.unknown_strike_types == set()
+
+
+def test_unknown_strike_types_match_tab():
+    text = read('unknown_strike_types.txt')
+    result = validate(text)
+    assert result.valid
+    assert result.unknown_strike_types == Tab(text).unknown_strike_types
+
+
+def test_unmappable_note_names():
+    result = validate(read('repetition_4x.txt'), {'HH': 42})
+    assert not result.valid
+    assert result.error is None
+    assert result.unmappable_note_names == set(['S', 'B'])
+
+
+def test_no_bars():
+    result = validate(u"Just some words.\n1 & 2 & | 3 & 4 &")
+    assert not result.valid
+    assert result.error.message == "Could not find any bars in input text."
+
+
+def test_error_position():
+    result = validate(u"HH |o-o-|o-o-|\n\nxx\n   |\n")
+    assert result.error.message == "Bar without notes"
+    assert (result.error.row, result.error.column) == (3, 3)
+    assert result.note_types == set(['HH'])
+    result = validate(u"HH |o-o-o-o-|\n S |--o-")
+    assert result.error.message == "Row ends inside a bar"
+    assert (result.error.row, result.error.column) == (1, 8)